@@ -25,15 +25,8 @@ def hist() -> HashMap:
 @section("tracepoint/syscalls/sys_enter_clone")
 def hello(ctx: c_void_p) -> c_int64:
     process_id = pid()
-    one = 1
-    prev = hist().lookup(process_id)
-    if prev:
-        previous_value = prev + 1
-        print(f"count: {previous_value} with {process_id}")
-        hist().update(process_id, previous_value)
-        return c_int64(0)
-    else:
-        hist().update(process_id, one)
+    # One lookup and an atomic add, inserting the key on its first clone
+    hist[process_id] += 1
     return c_int64(0)
 
 
@@ -1,5 +1,4 @@
-from .decorators import bpf, map, section, bpfglobal, struct
-from .codegen import compile_to_ir, compile, BPF
+from .decorators import bpf, map, section, bpfglobal, struct, inline
 
 __all__ = [
     "bpf",
@@ -7,7 +6,26 @@ __all__ = [
     "section",
     "bpfglobal",
     "struct",
+    "inline",
     "compile_to_ir",
+    "compile_to_object",
     "compile",
     "BPF",
+    "IncrementalCompiler",
 ]
+
+# The compiler pulls in llvmlite and pylibbpf, so it is only imported once one
+# of its entry points is actually used.
+_LAZY_CODEGEN = ("compile_to_ir", "compile_to_object", "compile", "BPF")
+
+
+def __getattr__(name):
+    if name in _LAZY_CODEGEN:
+        from . import codegen
+
+        return getattr(codegen, name)
+    if name == "IncrementalCompiler":
+        from .incremental import IncrementalCompiler
+
+        return IncrementalCompiler
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
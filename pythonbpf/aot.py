@@ -0,0 +1,303 @@
+import ast
+import base64
+import ctypes
+import inspect
+import json
+import textwrap
+from pathlib import Path
+from logging import Logger
+import logging
+
+from .backend import DEFAULT_OPT_LEVEL, DEFAULT_CPU
+from .maps import maps as map_classes
+from .maps.flags import MAP_FLAGS, flags_value
+from .symbol_index import SymbolKind, build_symbol_index
+
+logger: Logger = logging.getLogger(__name__)
+
+# Attributes of the generated Skeleton class that maps/programs must not shadow
+SKELETON_RESERVED = {"program", "load_and_attach", "map", "maps", "programs"}
+
+SKELETON_RUNTIME = '''
+class MapSpec:
+    """A map in the object. BpfMap accepts it in place of the @map function."""
+
+    def __init__(self, name, kind, **params):
+        self.__name__ = name
+        self.name = name
+        self.kind = kind
+        self.params = params
+
+    def __repr__(self):
+        return f"MapSpec({self.name!r}, {self.kind!r}, **{self.params!r})"
+
+
+class ProgramSpec:
+    """A program in the object and the section it attaches through."""
+
+    def __init__(self, name, section):
+        self.__name__ = name
+        self.name = name
+        self.section = section
+
+    def __repr__(self):
+        return f"ProgramSpec({self.name!r}, {self.section!r})"
+'''
+
+
+def quote(value):
+    """Render a string literal the way the formatter would."""
+    return json.dumps(value)
+
+
+def ctypes_expr(node, struct_names):
+    """Render a ctypes annotation or map argument as skeleton source."""
+    flags = flags_value(node, MAP_FLAGS)
+    if flags is not None:
+        # An int, or map_flags written as BPF_F_* names
+        return repr(flags)
+    if isinstance(node, ast.Name):
+        if node.id in struct_names:
+            return node.id
+        if hasattr(ctypes, node.id):
+            return f"ctypes.{node.id}"
+    elif (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id == "str"
+        and node.args
+        and isinstance(node.args[0], ast.Constant)
+    ):
+        return f"ctypes.c_char * {node.args[0].value}"
+    elif isinstance(node, ast.Constant):
+        if isinstance(node.value, str):
+            return quote(node.value)
+        return repr(node.value)
+    elif isinstance(node, (ast.List, ast.Tuple)) and all(
+        isinstance(elt, ast.Name) for elt in node.elts
+    ):
+        # ProgArray programs, referred to by name
+        return f"[{', '.join(quote(elt.id) for elt in node.elts)}]"
+    raise TypeError(f"Cannot express {ast.dump(node)} in a skeleton")
+
+
+def struct_layout(cls_node, struct_names):
+    """Return (field name, ctypes source) pairs for a @struct class."""
+    fields = []
+    for item in cls_node.body:
+        if isinstance(item, ast.AnnAssign) and isinstance(item.target, ast.Name):
+            fields.append((item.target.id, ctypes_expr(item.annotation, struct_names)))
+        else:
+            raise TypeError(f"Unsupported field in {ast.dump(cls_node)}")
+    return fields
+
+
+def map_params(func_node, struct_names):
+    """Return (map class name, {param: source}) for a @map function."""
+    rval = next(
+        (stmt.value for stmt in func_node.body if isinstance(stmt, ast.Return)), None
+    )
+    if not (isinstance(rval, ast.Call) and isinstance(rval.func, ast.Name)):
+        raise ValueError(f"Function under @map must return a map: {func_node.name}")
+
+    kind = rval.func.id
+    map_class = getattr(map_classes, kind, None)
+    positional = []
+    if map_class is not None:
+        positional = list(inspect.signature(map_class).parameters)
+
+    params = {}
+    for name, arg in zip(positional, rval.args):
+        params[name] = ctypes_expr(arg, struct_names)
+    for keyword in rval.keywords:
+        params[keyword.arg] = ctypes_expr(keyword.value, struct_names)
+    return kind, params
+
+
+def dict_lines(name, symbols, values):
+    """Render a module-level dict literal keyed by symbol name."""
+    if not symbols:
+        return [f"{name} = {{}}", ""]
+    lines = [f"{name} = {{"]
+    for symbol, value in zip(symbols, values):
+        lines.append(f"    {quote(symbol.name)}: {value},")
+    return lines + ["}", ""]
+
+
+def generate_skeleton(source, filename, object_name=None, object_bytes=None) -> str:
+    """
+    Render the Python skeleton for the @bpf chunks in source.
+
+    The skeleton loads object_name from its own directory, or the embedded
+    object_bytes when given, and only imports ctypes and pylibbpf.
+    """
+    from .codegen import VERSION
+
+    symbols = build_symbol_index(ast.parse(source, filename))
+    structs = symbols.of_kind(SymbolKind.STRUCT)
+    struct_names = {symbol.name for symbol in structs}
+
+    out = [
+        '"""',
+        f"BPF skeleton for {Path(filename).name}, generated by PythonBPF {VERSION}.",
+        "",
+        "Loading it needs only pylibbpf. Do not edit; regenerate it with",
+        "`python -m pythonbpf build --skeleton`.",
+        '"""',
+        "",
+    ]
+    if object_bytes is not None:
+        out += ["import atexit", "import base64", "import ctypes", "import os"]
+        out += ["import tempfile"]
+    else:
+        out += ["import ctypes", "from pathlib import Path"]
+    out += ["", "from pylibbpf import BpfMap, BpfProgram", "", ""]
+
+    if object_bytes is not None:
+        encoded = base64.b64encode(object_bytes).decode("ascii")
+        out.append("OBJECT_BYTES = base64.b64decode(")
+        out += [f'    "{line}"' for line in textwrap.wrap(encoded, 76)]
+        out += [")", "", ""]
+        out.append(
+            textwrap.dedent(
+                '''\
+                def object_path():
+                    """Write the embedded object to a temporary file and return its path."""
+                    fd, name = tempfile.mkstemp(suffix=".o")
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(OBJECT_BYTES)
+                    atexit.register(os.unlink, name)
+                    return name
+                '''
+            )
+        )
+    else:
+        out.append(f"OBJECT_PATH = Path(__file__).with_name({quote(object_name)})")
+        out.append("")
+        out.append(
+            textwrap.dedent(
+                """\
+
+                def object_path():
+                    return str(OBJECT_PATH)
+                """
+            )
+        )
+
+    for symbol in structs:
+        out += ["", f"class {symbol.name}(ctypes.Structure):", "    _fields_ = ["]
+        for name, ctype in struct_layout(symbol.node, struct_names):
+            out.append(f"        ({quote(name)}, {ctype}),")
+        out += ["    ]", ""]
+
+    out.append(SKELETON_RUNTIME)
+
+    maps = symbols.of_kind(SymbolKind.MAP)
+    programs = symbols.of_kind(SymbolKind.PROGRAM)
+
+    struct_entries = [f"{symbol.name}" for symbol in structs]
+    map_entries = []
+    for symbol in maps:
+        kind, params = map_params(symbol.node, struct_names)
+        args = "".join(f", {name}={value}" for name, value in params.items())
+        map_entries.append(f"MapSpec({quote(symbol.name)}, {quote(kind)}{args})")
+    program_entries = [
+        f"ProgramSpec({quote(symbol.name)}, {quote(symbol.section)})"
+        for symbol in programs
+    ]
+
+    out.append("")
+    out += dict_lines("STRUCTS", structs, struct_entries)
+    out += dict_lines("MAPS", maps, map_entries)
+    out += dict_lines("PROGRAMS", programs, program_entries)
+    out.append("")
+
+    out.append(
+        textwrap.dedent(
+            '''\
+            class Skeleton:
+                """The compiled object, with a typed handle for every map and program."""
+
+                maps = MAPS
+                programs = PROGRAMS
+
+                def __init__(self, path=None):
+                    self.program = BpfProgram(path or object_path())
+
+                def load_and_attach(self):
+                    self.program.load_and_attach()
+                    return self
+
+                def map(self, name) -> BpfMap:
+                    return BpfMap(self.program, MAPS[name])
+            '''
+        )
+    )
+    for symbol in maps:
+        if symbol.name in SKELETON_RESERVED:
+            logger.warning(f"Map {symbol.name} is only reachable as MAPS[...]")
+            continue
+        out += [
+            "    @property",
+            f"    def {symbol.name}(self) -> BpfMap:",
+            f"        return self.map({quote(symbol.name)})",
+            "",
+        ]
+    for symbol in programs:
+        if symbol.name in SKELETON_RESERVED:
+            logger.warning(f"Program {symbol.name} is only reachable as PROGRAMS[...]")
+            continue
+        out.append(f"    {symbol.name} = PROGRAMS[{quote(symbol.name)}]")
+
+    return "\n".join(out).rstrip() + "\n"
+
+
+def skeleton_path(obj_path) -> Path:
+    obj_path = Path(obj_path)
+    return obj_path.with_name(f"{obj_path.stem}_skel.py")
+
+
+def write_skeleton(filename, obj_path, embed=False, source=None) -> Path:
+    """Write the <stem>_skel.py loader for an already compiled object."""
+    if source is None:
+        with open(filename) as f:
+            source = f.read()
+    obj_path = Path(obj_path)
+    object_bytes = obj_path.read_bytes() if embed else None
+    path = skeleton_path(obj_path)
+    path.write_text(generate_skeleton(source, filename, obj_path.name, object_bytes))
+    logger.info(f"Skeleton written to {path}")
+    return path
+
+
+def compile_aot(
+    filename: str,
+    output_dir=None,
+    embed=False,
+    opt_level=DEFAULT_OPT_LEVEL,
+    cpu=DEFAULT_CPU,
+    use_llc=False,
+    cache=None,
+):
+    """
+    Compile a file to <stem>.o plus a <stem>_skel.py loader next to it.
+
+    With embed=True the object is embedded in the skeleton, which then is
+    the only artifact a host needs. Returns (object path, skeleton path).
+    """
+    from .codegen import compile_to_object
+
+    source_path = Path(filename)
+    output_dir = Path(output_dir) if output_dir else source_path.parent
+    output_dir.mkdir(parents=True, exist_ok=True)
+    obj_path = output_dir / source_path.with_suffix(".o").name
+
+    compile_to_object(
+        str(source_path),
+        str(obj_path),
+        opt_level=opt_level,
+        cpu=cpu,
+        use_llc=use_llc,
+        cache=cache,
+    )
+    return obj_path, write_skeleton(str(source_path), obj_path, embed)
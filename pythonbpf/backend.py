@@ -0,0 +1,227 @@
+import subprocess
+import tempfile
+import time
+from functools import lru_cache
+from pathlib import Path
+from logging import Logger
+import logging
+
+from llvmlite import ir
+
+logger: Logger = logging.getLogger(__name__)
+
+DEFAULT_OPT_LEVEL = 2
+DEFAULT_CPU = "generic"
+BPF_TRIPLE = "bpf"
+
+
+@lru_cache(maxsize=None)
+def _target_machine(opt_level: int, cpu: str):
+    """Create (once per flag combination) an llvmlite BPF target machine."""
+    from llvmlite import binding as llvm
+
+    llvm.initialize_all_targets()
+    llvm.initialize_all_asmprinters()
+    target = llvm.Target.from_triple(BPF_TRIPLE)
+    return target.create_target_machine(
+        cpu=cpu, opt=opt_level, reloc="static", codemodel="small"
+    )
+
+
+# Passes run on the generated IR for each optimization level. The always
+# inliner expands @inline helper functions into their callers; sroa is the
+# new pass manager's mem2reg: it promotes the per-variable allocas emitted by
+# functions_pass to SSA registers.
+OPT_PIPELINES = {
+    0: (),
+    1: (
+        "always_inliner",
+        "sroa",
+        "instruction_combine",
+        "simplify_cfg",
+        "dead_code_elimination",
+    ),
+    2: (
+        "always_inliner",
+        "sroa",
+        "instruction_combine",
+        "simplify_cfg",
+        "new_gvn",
+        "instruction_combine",
+        "dead_code_elimination",
+        "simplify_cfg",
+    ),
+}
+OPT_PIPELINES[3] = OPT_PIPELINES[2] + ("aggressive_dce", "simplify_cfg")
+
+# Atomic or/and/xor (m[k] |= n, ...) need the v3 instruction set
+ATOMIC_ALU_CPUS = ("v3", "v4", "probe")
+
+
+def check_cpu_features(llvm_module, cpu=DEFAULT_CPU):
+    """
+    Reject instructions the BPF backend cannot select for cpu.
+
+    LLVM reports these as fatal errors that end the process, so they are
+    turned into a ValueError before code generation.
+    """
+    if cpu in ATOMIC_ALU_CPUS:
+        return
+    for func in llvm_module.functions:
+        for block in func.blocks:
+            for instr in block.instructions:
+                if instr.opcode != "atomicrmw":
+                    continue
+                op = str(instr).split("atomicrmw", 1)[1].split()[0]
+                if op != "add":
+                    raise ValueError(
+                        f"{func.name}: atomic {op} on a map value needs "
+                        f"cpu='v3' or newer (kernel 5.12+), not {cpu!r}"
+                    )
+
+
+def optimize_module(llvm_module, opt_level=DEFAULT_OPT_LEVEL, cpu=DEFAULT_CPU):
+    """Run the LLVM pass pipeline for opt_level over an in-memory module."""
+    from llvmlite import binding as llvm
+
+    passes = OPT_PIPELINES[opt_level]
+    if not passes:
+        return llvm_module
+
+    tuning = llvm.create_pipeline_tuning_options(speed_level=opt_level)
+    pass_builder = llvm.create_pass_builder(_target_machine(opt_level, cpu), tuning)
+    pass_manager = llvm.create_new_module_pass_manager()
+    for name in passes:
+        getattr(pass_manager, f"add_{name}_pass")()
+    pass_manager.run(llvm_module, pass_builder)
+    logger.info(f"Ran -O{opt_level} pipeline: {', '.join(passes)}")
+    return llvm_module
+
+
+def parse_module(module, source_filename=None):
+    """Parse an llvmlite ir.Module (or its textual IR) into an LLVM module."""
+    from llvmlite import binding as llvm
+
+    ir_text = str(module)
+    if source_filename:
+        ir_text = f'source_filename = "{source_filename}"\n' + ir_text
+    llvm_module = llvm.parse_assembly(ir_text)
+    llvm_module.verify()
+    return llvm_module
+
+
+def emit_object_llvmlite(
+    module: ir.Module,
+    output,
+    opt_level=DEFAULT_OPT_LEVEL,
+    cpu=DEFAULT_CPU,
+    source_filename=None,
+):
+    """Emit a BPF object file in-process through llvmlite's BPF target machine."""
+    timings = {}
+
+    if isinstance(module, (ir.Module, str)):
+        start = time.perf_counter()
+        ir_text = str(module)
+        timings["serialize"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        llvm_module = parse_module(ir_text, source_filename)
+        timings["parse"] = time.perf_counter() - start
+    else:
+        # Already an llvmlite.binding module (e.g. a relinked incremental build)
+        llvm_module = module
+
+    start = time.perf_counter()
+    optimize_module(llvm_module, opt_level, cpu)
+    timings["optimize"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    check_cpu_features(llvm_module, cpu)
+    target_machine = _target_machine(opt_level, cpu)
+    obj = target_machine.emit_object(llvm_module)
+    timings["codegen"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    Path(output).write_bytes(obj)
+    timings["write"] = time.perf_counter() - start
+
+    return timings
+
+
+def emit_object_llc(
+    module: ir.Module,
+    output,
+    opt_level=DEFAULT_OPT_LEVEL,
+    cpu=DEFAULT_CPU,
+    source_filename=None,
+):
+    """
+    Emit a BPF object file by running an external llc process.
+
+    The IR pass pipeline only runs in-process, so llc gets the unoptimized IR
+    and applies its own -O level during code generation.
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    with tempfile.NamedTemporaryFile(mode="w", suffix=".ll") as ll_file:
+        if source_filename:
+            ll_file.write(f'source_filename = "{source_filename}"\n')
+        ll_file.write(str(module))
+        ll_file.write("\n")
+        ll_file.flush()
+        timings["write_ir"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        subprocess.run(
+            [
+                "llc",
+                "-march=bpf",
+                f"-mcpu={cpu}",
+                "-filetype=obj",
+                f"-O{opt_level}",
+                ll_file.name,
+                "-o",
+                str(output),
+            ],
+            check=True,
+        )
+        timings["llc"] = time.perf_counter() - start
+
+    return timings
+
+
+def emit_object(
+    module: ir.Module,
+    output,
+    opt_level=DEFAULT_OPT_LEVEL,
+    cpu=DEFAULT_CPU,
+    use_llc=False,
+    source_filename=None,
+):
+    """
+    Compile an ir.Module to a BPF object file and return per-stage timings.
+
+    module may also be IR text or an already parsed llvmlite.binding module.
+
+    The object is emitted in-process through llvmlite unless use_llc is set;
+    if the llvmlite BPF target is unavailable we fall back to an llc process.
+    """
+    if opt_level not in (0, 1, 2, 3):
+        raise ValueError(f"Invalid optimization level: {opt_level}")
+
+    if not use_llc:
+        try:
+            _target_machine(opt_level, cpu)
+        except (ImportError, RuntimeError) as e:
+            logger.warning(f"llvmlite BPF target unavailable ({e}), using llc")
+        else:
+            return emit_object_llvmlite(module, output, opt_level, cpu, source_filename)
+
+    return emit_object_llc(module, output, opt_level, cpu, source_filename)
+
+
+def format_timings(timings):
+    """Render a timings dict as a short, human readable string."""
+    return ", ".join(f"{stage}={secs * 1000:.2f}ms" for stage, secs in timings.items())
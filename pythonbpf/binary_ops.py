@@ -3,6 +3,14 @@ from llvmlite import ir
 from logging import Logger
 import logging
 
+from .type_deducer import (
+    DEFAULT_CTYPE,
+    ctypes_to_ir,
+    expr_ctype,
+    is_signed,
+    local_ctypes,
+)
+
 logger: Logger = logging.getLogger(__name__)
 
 
@@ -18,15 +26,33 @@ def recursive_dereferencer(var, builder):
         raise TypeError(f"Unsupported type for dereferencing: {var.type}")
 
 
-def get_operand_value(operand, module, builder, local_sym_tab):
-    """Extract the value from an operand, handling variables and constants."""
+def fits_width(value, width):
+    """Whether an int literal is representable in width bits."""
+    return -(1 << (width - 1)) <= value < (1 << width)
+
+
+def get_operand_value(operand, module, builder, local_sym_tab, const_type=None):
+    """
+    Extract the value from an operand, handling variables and constants.
+
+    Int literals are built as const_type, c_int64 by default.
+    """
     if isinstance(operand, ast.Name):
         if operand.id in local_sym_tab:
-            return recursive_dereferencer(local_sym_tab[operand.id].var, builder)
+            sym = local_sym_tab[operand.id]
+            if sym.in_register and isinstance(sym.ir_type, ir.PointerType):
+                # Helpers return opaque pointers, the declared type has the pointee
+                val = builder.load(sym.value, typ=sym.ir_type.pointee)
+                return recursive_dereferencer(val, builder)
+            if sym.in_register:
+                return recursive_dereferencer(sym.value, builder)
+            return recursive_dereferencer(sym.var, builder)
         raise ValueError(f"Undefined variable: {operand.id}")
     elif isinstance(operand, ast.Constant):
         if isinstance(operand.value, int):
-            return ir.Constant(ir.IntType(64), operand.value)
+            if const_type is None or not fits_width(operand.value, const_type.width):
+                const_type = ir.IntType(64)
+            return ir.Constant(const_type, operand.value)
         raise TypeError(f"Unsupported constant type: {type(operand.value)}")
     elif isinstance(operand, ast.BinOp):
         return handle_binary_op_impl(operand, module, builder, local_sym_tab)
@@ -34,20 +60,39 @@ def get_operand_value(operand, module, builder, local_sym_tab):
 
 
 def handle_binary_op_impl(rval, module, builder, local_sym_tab):
+    """
+    Emit rval in the type its operands unify to (see type_deducer).
+
+    The operation is as wide as its widest operand, so a c_uint32 sum stays
+    a 32-bit add, and its signedness picks sdiv/udiv, srem/urem and ashr/lshr.
+    Narrower operands are extended by their own signedness.
+    """
     op = rval.op
-    left = get_operand_value(rval.left, module, builder, local_sym_tab)
-    right = get_operand_value(rval.right, module, builder, local_sym_tab)
-    logger.info(f"left is {left}, right is {right}, op is {op}")
+    env = local_ctypes(local_sym_tab)
+    ctype = expr_ctype(rval, env) or DEFAULT_CTYPE
+    signed = is_signed(ctype)
+    op_type = ctypes_to_ir(ctype)
+
+    operands = []
+    for operand in (rval.left, rval.right):
+        val = get_operand_value(operand, module, builder, local_sym_tab, op_type)
+        operands.append((val, is_signed(expr_ctype(operand, env))))
+    width = max(op_type.width, *(val.type.width for val, _ in operands))
+    left, right = (
+        extend_operand(builder, val, ir.IntType(width), operand_signed)
+        for val, operand_signed in operands
+    )
+    logger.info(f"left is {left}, right is {right}, op is {op} ({ctype})")
 
     # Map AST operation nodes to LLVM IR builder methods
     op_map = {
         ast.Add: builder.add,
         ast.Sub: builder.sub,
         ast.Mult: builder.mul,
-        ast.Div: builder.sdiv,
-        ast.Mod: builder.srem,
+        ast.Div: builder.sdiv if signed else builder.udiv,
+        ast.Mod: builder.srem if signed else builder.urem,
         ast.LShift: builder.shl,
-        ast.RShift: builder.lshr,
+        ast.RShift: builder.ashr if signed else builder.lshr,
         ast.BitOr: builder.or_,
         ast.BitXor: builder.xor,
         ast.BitAnd: builder.and_,
@@ -61,6 +106,16 @@ def handle_binary_op_impl(rval, module, builder, local_sym_tab):
         raise SyntaxError("Unsupported binary operation")
 
 
+def extend_operand(builder, val, ir_type, signed):
+    """Widen an int operand to ir_type with sext or zext."""
+    if val.type.width >= ir_type.width:
+        return val
+    if signed:
+        return builder.sext(val, ir_type)
+    return builder.zext(val, ir_type)
+
+
 def handle_binary_op(rval, module, builder, var_name, local_sym_tab):
     result = handle_binary_op_impl(rval, module, builder, local_sym_tab)
-    builder.store(result, local_sym_tab[var_name].var)
+    ctype = expr_ctype(rval, local_ctypes(local_sym_tab))
+    local_sym_tab[var_name].store(builder, result, is_signed(ctype))
@@ -0,0 +1,123 @@
+import ast
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from logging import Logger
+import logging
+
+logger: Logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+CACHE_DIR_ENV = "PYTHONBPF_CACHE_DIR"
+CACHE_MAX_BYTES_ENV = "PYTHONBPF_CACHE_MAX_BYTES"
+
+
+def default_cache_dir() -> Path:
+    """Resolve the cache directory from the environment or XDG defaults."""
+    if os.environ.get(CACHE_DIR_ENV):
+        return Path(os.environ[CACHE_DIR_ENV])
+    xdg_cache = os.environ.get("XDG_CACHE_HOME")
+    base = Path(xdg_cache) if xdg_cache else Path.home() / ".cache"
+    return base / "pythonbpf"
+
+
+def normalized_chunks(chunks, constants=None):
+    """
+    Dump the @bpf chunks of a module without positions or comments, followed
+    by the module constants they may inline.
+    """
+    dumps = [ast.dump(chunk, include_attributes=False) for chunk in chunks]
+    if constants:
+        dumps.append(json.dumps(constants, sort_keys=True))
+    return dumps
+
+
+class CompileCache:
+    """Persistent, size-bounded LRU cache of compiled BPF object files."""
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = Path(directory) if directory else default_cache_dir()
+        if max_bytes is None:
+            max_bytes = int(os.environ.get(CACHE_MAX_BYTES_ENV, DEFAULT_MAX_BYTES))
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, chunk_dumps, version, flags, filename=None):
+        """
+        Build the content address for a set of chunks and backend flags.
+
+        filename is part of the key because the object's debug info and BTF
+        name the source file.
+        """
+        payload = json.dumps(
+            {
+                "version": version,
+                "flags": flags,
+                "filename": filename,
+                "chunks": chunk_dumps,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, key) -> Path:
+        return self.directory / f"{key}.o"
+
+    def lookup(self, key):
+        """Return the cached object for key, refreshing its LRU position."""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            logger.info(f"Cache miss for {key}")
+            return None
+        logger.info(f"Cache hit for {key}")
+        return path
+
+    def scratch_path(self) -> Path:
+        """Return a fresh temporary path inside the cache directory."""
+        fd, name = tempfile.mkstemp(suffix=".o.tmp", dir=self.directory)
+        os.close(fd)
+        return Path(name)
+
+    def insert(self, key, obj_path) -> Path:
+        """Atomically move a freshly built object into the cache."""
+        path = self.path_for(key)
+        os.replace(obj_path, path)
+        self.evict()
+        return path
+
+    def entries(self):
+        """List cached objects as (mtime, size, path), least recently used first."""
+        entries = []
+        for path in self.directory.glob("*.o"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """Drop least recently used objects until the cache fits its budget."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                logger.info(f"Evicted {path.name} from compile cache")
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
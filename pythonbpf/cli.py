@@ -0,0 +1,213 @@
+import argparse
+import ast
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from logging import Logger
+import logging
+
+from .backend import DEFAULT_OPT_LEVEL, DEFAULT_CPU
+from .symbol_index import build_symbol_index
+
+logger: Logger = logging.getLogger(__name__)
+
+
+def has_bpf_chunks(path: Path) -> bool:
+    """Check whether a file defines @bpf chunks, without executing it."""
+    try:
+        tree = ast.parse(path.read_text(), str(path))
+    except (SyntaxError, UnicodeDecodeError, OSError) as e:
+        logger.info(f"Skipping {path}: {e}")
+        return False
+    return len(build_symbol_index(tree)) > 0
+
+
+def discover_sources(paths):
+    """Expand files and directories into (source, relative output stem) pairs."""
+    sources = []
+    for raw in paths:
+        path = Path(raw)
+        if path.is_dir():
+            candidates = sorted(p for p in path.rglob("*.py") if p.is_file())
+            root = path
+        elif path.is_file():
+            candidates = [path]
+            root = path.parent
+        else:
+            raise FileNotFoundError(f"No such file or directory: {raw}")
+
+        for candidate in candidates:
+            if has_bpf_chunks(candidate):
+                sources.append((candidate.resolve(), candidate.relative_to(root)))
+    return sources
+
+
+def build_one(
+    source,
+    output,
+    opt_level,
+    cpu,
+    use_llc,
+    cache_dir,
+    profile=False,
+    skeleton=None,
+):
+    """Compile one source file; runs inside a worker process."""
+    from .aot import write_skeleton
+    from .cache import CompileCache
+    from .codegen import compile_to_object
+    from .profiler import CompileProfile
+
+    start = time.perf_counter()
+    report = CompileProfile() if profile else None
+    try:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        cache = CompileCache(cache_dir) if cache_dir is not None else None
+        timings = compile_to_object(
+            str(source),
+            str(output),
+            opt_level=opt_level,
+            cpu=cpu,
+            use_llc=use_llc,
+            cache=cache,
+            profile=report,
+        )
+        if skeleton is not None:
+            write_skeleton(str(source), output, embed=skeleton == "embed")
+        error = None
+    except Exception as e:
+        timings = {}
+        error = f"{type(e).__name__}: {e}"
+    if report is not None:
+        report = report.to_dict()
+    return source, output, time.perf_counter() - start, timings, error, report
+
+
+def build(args) -> int:
+    sources = discover_sources(args.paths)
+    if not sources:
+        print("No @bpf sources found", file=sys.stderr)
+        return 1
+
+    output_dir = Path(args.output_dir)
+    cache_dir = None
+    if not args.no_cache:
+        from .cache import default_cache_dir
+
+        cache_dir = str(args.cache_dir or default_cache_dir())
+
+    profile = args.profile or args.profile_json is not None
+    reports = []
+
+    start = time.perf_counter()
+    failures = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [
+            pool.submit(
+                build_one,
+                source,
+                output_dir / rel.with_suffix(".o"),
+                args.opt_level,
+                args.cpu,
+                args.use_llc,
+                cache_dir,
+                profile,
+                args.skeleton,
+            )
+            for source, rel in sources
+        ]
+        for future in futures:
+            source, output, elapsed, timings, error, report = future.result()
+            if error is not None:
+                failures += 1
+                print(f"FAIL {elapsed * 1000:9.2f}ms  {source}: {error}")
+                continue
+            status = "HIT " if "ir" not in timings else "OK  "
+            print(f"{status} {elapsed * 1000:9.2f}ms  {source} -> {output}")
+            if report is not None:
+                reports.append(report)
+                if args.profile:
+                    from .profiler import CompileProfile
+
+                    print(CompileProfile.from_dict(report).format())
+
+    if args.profile_json is not None:
+        with open(args.profile_json, "w") as f:
+            json.dump(reports, f, indent=2)
+            f.write("\n")
+
+    total = time.perf_counter() - start
+    print(
+        f"Built {len(sources) - failures}/{len(sources)} objects "
+        f"in {total * 1000:.2f}ms"
+    )
+    return 1 if failures else 0
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(
+        prog="pythonbpf", description="Reduced Python frontend for eBPF"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser(
+        "build", help="Compile @bpf source files and directories to objects"
+    )
+    build_parser.add_argument("paths", nargs="+", help="Files or directories")
+    build_parser.add_argument(
+        "-o", "--output-dir", default="build", help="Directory for .o files"
+    )
+    build_parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count(), help="Worker processes"
+    )
+    build_parser.add_argument(
+        "-O",
+        dest="opt_level",
+        type=int,
+        choices=(0, 1, 2, 3),
+        default=DEFAULT_OPT_LEVEL,
+        help="Optimization level",
+    )
+    build_parser.add_argument("--mcpu", dest="cpu", default=DEFAULT_CPU)
+    build_parser.add_argument(
+        "--use-llc", action="store_true", help="Emit objects with an llc process"
+    )
+    build_parser.add_argument("--cache-dir", help="Compile cache directory")
+    build_parser.add_argument(
+        "--no-cache", action="store_true", help="Do not use the compile cache"
+    )
+    build_parser.add_argument(
+        "--skeleton",
+        nargs="?",
+        const="reference",
+        choices=("reference", "embed"),
+        help="Also write a <name>_skel.py loader that needs only pylibbpf; "
+        "'embed' puts the object inside it",
+    )
+    build_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print per-phase and per-function compile timings (skips the cache)",
+    )
+    build_parser.add_argument(
+        "--profile-json", metavar="FILE", help="Write the compile timings as JSON"
+    )
+    build_parser.add_argument("-v", "--verbose", action="count", default=0)
+    build_parser.set_defaults(handler=build)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = make_parser().parse_args(argv)
+    loglevel = logging.WARNING - 10 * min(args.verbose, 2)
+    logging.basicConfig(
+        level=loglevel, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+    )
+    try:
+        return args.handler(args)
+    except FileNotFoundError as e:
+        print(e, file=sys.stderr)
+        return 1
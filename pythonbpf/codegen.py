@@ -1,60 +1,74 @@
 import ast
+import llvmlite
 from llvmlite import ir
 from .license_pass import license_processing
 from .functions_pass import func_proc
 from .maps import maps_proc
 from .structs import structs_proc
 from .globals_pass import globals_processing
+from .symbol_index import build_symbol_index
 from .debuginfo import DW_LANG_C11, DwarfBehaviorEnum, DebugInfoGenerator
+from .backend import (
+    DEFAULT_OPT_LEVEL,
+    DEFAULT_CPU,
+    emit_object,
+    format_timings,
+    optimize_module,
+    parse_module,
+)
+from .cache import CompileCache, normalized_chunks
+from .profiler import CompileProfile, phase
 import os
-import subprocess
-import inspect
+import sys
+import atexit
+import linecache
+import shutil
+import time
 from pathlib import Path
-from pylibbpf import BpfProgram
 import tempfile
+from typing import TYPE_CHECKING
 from logging import Logger
 import logging
 
+if TYPE_CHECKING:
+    from pylibbpf import BpfProgram
+
 logger: Logger = logging.getLogger(__name__)
 
 VERSION = "v0.1.4"
 
 
 def find_bpf_chunks(tree):
-    """Find all functions decorated with @bpf in the AST."""
-    bpf_functions = []
-    for node in ast.walk(tree):
-        if isinstance(node, ast.FunctionDef) or isinstance(node, ast.ClassDef):
-            for decorator in node.decorator_list:
-                if isinstance(decorator, ast.Name) and decorator.id == "bpf":
-                    bpf_functions.append(node)
-                    break
-    return bpf_functions
-
+    """Find all top-level functions and classes decorated with @bpf in the AST."""
+    return build_symbol_index(tree).chunks
 
-def processor(source_code, filename, module):
-    tree = ast.parse(source_code, filename)
-    logger.debug(ast.dump(tree, indent=4))
 
-    bpf_chunks = find_bpf_chunks(tree)
-    for func_node in bpf_chunks:
-        logger.info(f"Found BPF function/struct: {func_node.name}")
+def processor(source_code, filename, module, opt_level=DEFAULT_OPT_LEVEL, profile=None):
+    with phase(profile, "ast_parse"):
+        tree = ast.parse(source_code, filename)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(ast.dump(tree, indent=4))
 
-    structs_sym_tab = structs_proc(tree, module, bpf_chunks)
-    map_sym_tab = maps_proc(tree, module, bpf_chunks)
-    func_proc(tree, module, bpf_chunks, map_sym_tab, structs_sym_tab)
+    with phase(profile, "symbol_index"):
+        symbols = build_symbol_index(tree)
 
-    license_processing(tree, module)
-    globals_processing(tree, module)
+    with phase(profile, "structs_proc"):
+        structs_sym_tab = structs_proc(tree, module, symbols)
+    with phase(profile, "maps_proc"):
+        map_sym_tab = maps_proc(tree, module, symbols, structs_sym_tab)
+    with phase(profile, "func_proc"):
+        func_proc(
+            tree, module, symbols, map_sym_tab, structs_sym_tab, opt_level, profile
+        )
 
+    with phase(profile, "license_processing"):
+        license_processing(tree, module, symbols)
+    with phase(profile, "globals_processing"):
+        globals_processing(tree, module, symbols)
 
-def compile_to_ir(filename: str, output: str, loglevel=logging.WARNING):
-    logging.basicConfig(
-        level=loglevel, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
-    )
-    with open(filename) as f:
-        source = f.read()
 
+def new_ir_module(filename: str, opt_level=DEFAULT_OPT_LEVEL) -> ir.Module:
+    """Create an empty BPF ir.Module carrying the file's debug compile unit."""
     module = ir.Module(name=filename)
     module.data_layout = "e-m:e-p:64:64-i64:64-i128:128-n32:64-S128"
     module.triple = "bpf"
@@ -65,14 +79,16 @@ def compile_to_ir(filename: str, output: str, loglevel=logging.WARNING):
         debug_generator.generate_debug_cu(
             DW_LANG_C11,
             f"PythonBPF {VERSION}",
-            True,  # TODO: This is probably not true
+            opt_level > 0,
             # TODO: add a global field here that keeps track of all the globals. Works without it, but I think it might
             # be required for kprobes.
             True,
         )
+    return module
 
-    processor(source, filename, module)
 
+def add_module_flags(module: ir.Module):
+    """Attach the module flags and llvm.ident every BPF module needs."""
     wchar_size = module.add_metadata(
         [
             DwarfBehaviorEnum.ERROR_IF_MISMATCH,
@@ -112,73 +128,298 @@ def compile_to_ir(filename: str, output: str, loglevel=logging.WARNING):
 
     module.add_named_metadata("llvm.ident", [f"PythonBPF {VERSION}"])
 
+
+def generate_ir_module(
+    filename: str, source=None, opt_level=DEFAULT_OPT_LEVEL, profile=None
+) -> ir.Module:
+    """Build the in-memory LLVM IR module for the @bpf chunks in a file."""
+    if source is None:
+        with open(filename) as f:
+            source = f.read()
+
+    with phase(profile, "debug_info"):
+        module = new_ir_module(filename, opt_level)
+    processor(source, filename, module, opt_level, profile)
+    with phase(profile, "debug_info"):
+        add_module_flags(module)
+    return module
+
+
+def resolve_profile(profile, filename, opt_level):
+    """Turn the profile argument of the entry points into a CompileProfile or None."""
+    if not profile:
+        return None
+    if profile is True:
+        profile = CompileProfile()
+    profile.filename = filename
+    profile.version = VERSION
+    profile.opt_level = opt_level
+    return profile
+
+
+def report_profile(requested, profile):
+    """Print the report when it was asked for with profile=True."""
+    logger.info(f"Compile profile: {profile.to_json(indent=None)}")
+    if requested is True:
+        print(profile.format(), file=sys.stderr)
+
+
+def compile_to_ir(
+    filename: str,
+    output: str,
+    loglevel=logging.WARNING,
+    opt_level=DEFAULT_OPT_LEVEL,
+    profile=False,
+):
+    """
+    Write the LLVM IR for a file to output and return output.
+
+    With profile=True a timing report is printed and returned instead; a
+    CompileProfile instance may also be passed in to be filled.
+    """
+    logging.basicConfig(
+        level=loglevel, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+    )
+    report = resolve_profile(profile, filename, opt_level)
+    module = generate_ir_module(filename, opt_level=opt_level, profile=report)
+
+    with phase(report, "serialize"):
+        ir_text = str(module)
+
     logger.info(f"IR written to {output}")
     with open(output, "w") as f:
-        f.write(f'source_filename = "{filename}"\n')
-        f.write(str(module))
-        f.write("\n")
+        if opt_level > 0:
+            with phase(report, "parse"):
+                llvm_module = parse_module(ir_text, filename)
+            with phase(report, "optimize"):
+                optimize_module(llvm_module, opt_level)
+            with phase(report, "write"):
+                f.write(str(llvm_module))
+        else:
+            with phase(report, "write"):
+                f.write(f'source_filename = "{filename}"\n')
+                f.write(ir_text)
+                f.write("\n")
 
+    if report is not None:
+        report_profile(profile, report)
+        return report
     return output
 
 
-def compile(loglevel=logging.WARNING) -> bool:
-    # Look one level up the stack to the caller of this function
-    caller_frame = inspect.stack()[1]
-    caller_file = Path(caller_frame.filename).resolve()
+def backend_flags(opt_level, cpu, use_llc):
+    """Flags that change the emitted object, used as part of the cache key."""
+    return {
+        "opt_level": opt_level,
+        "cpu": cpu,
+        "backend": "llc" if use_llc else "llvmlite",
+        # Each llvmlite release is built against one LLVM version; reading
+        # llvm_version_info would load LLVM on every cache hit
+        "llvmlite": llvmlite.__version__,
+    }
 
-    ll_file = Path("/tmp") / caller_file.with_suffix(".ll").name
-    o_file = caller_file.with_suffix(".o")
 
-    success = True
-    success = (
-        compile_to_ir(str(caller_file), str(ll_file), loglevel=loglevel) and success
+def resolve_cache(cache):
+    """Turn the cache argument of compile()/BPF() into a CompileCache or None."""
+    if cache is True:
+        try:
+            return CompileCache()
+        except OSError as e:
+            logger.warning(f"Compile cache unavailable ({e}), compiling uncached")
+            return None
+    return cache or None
+
+
+def build_object(
+    filename,
+    output,
+    source=None,
+    opt_level=DEFAULT_OPT_LEVEL,
+    cpu=DEFAULT_CPU,
+    use_llc=False,
+    profile=None,
+):
+    """Generate IR for a file and emit it as an object, returning stage timings."""
+    start = time.perf_counter()
+    module = generate_ir_module(filename, source, opt_level, profile)
+    timings = {"ir": time.perf_counter() - start}
+
+    backend_timings = emit_object(
+        module,
+        output,
+        opt_level=opt_level,
+        cpu=cpu,
+        use_llc=use_llc,
+        source_filename=filename,
     )
+    if profile is not None:
+        profile.add_timings(backend_timings)
+    timings.update(backend_timings)
+    return timings
 
-    success = bool(
-        subprocess.run(
-            [
-                "llc",
-                "-march=bpf",
-                "-filetype=obj",
-                "-O2",
-                str(ll_file),
-                "-o",
-                str(o_file),
-            ],
-            check=True,
-        )
-        and success
+
+def cached_object(
+    filename, source, cache, opt_level=DEFAULT_OPT_LEVEL, cpu=DEFAULT_CPU, use_llc=False
+):
+    """Return the cached object for source, compiling and storing it on a miss."""
+    start = time.perf_counter()
+    symbols = build_symbol_index(ast.parse(source, filename))
+    key = cache.key(
+        normalized_chunks(symbols.chunks, symbols.constants),
+        VERSION,
+        backend_flags(opt_level, cpu, use_llc),
+        filename,
     )
+    obj_path = cache.lookup(key)
+    timings = {"cache_lookup": time.perf_counter() - start}
+    if obj_path is not None:
+        return obj_path, timings
+
+    scratch = cache.scratch_path()
+    try:
+        timings.update(build_object(filename, scratch, source, opt_level, cpu, use_llc))
+        obj_path = cache.insert(key, scratch)
+    finally:
+        scratch.unlink(missing_ok=True)
+    return obj_path, timings
+
+
+def compile_to_object(
+    filename: str,
+    output: str,
+    opt_level=DEFAULT_OPT_LEVEL,
+    cpu=DEFAULT_CPU,
+    use_llc=False,
+    cache=None,
+    profile=None,
+):
+    """
+    Compile the @bpf chunks in a file to a BPF object and return stage timings.
 
-    logger.info(f"Object written to {o_file}")
-    return success
-
-
-def BPF(loglevel=logging.WARNING) -> BpfProgram:
-    caller_frame = inspect.stack()[1]
-    src = inspect.getsource(caller_frame.frame)
-    with tempfile.NamedTemporaryFile(
-        mode="w+", delete=True, suffix=".py"
-    ) as f, tempfile.NamedTemporaryFile(
-        mode="w+", delete=True, suffix=".ll"
-    ) as inter, tempfile.NamedTemporaryFile(
-        mode="w+", delete=False, suffix=".o"
-    ) as obj_file:
-        f.write(src)
-        f.flush()
-        source = f.name
-        compile_to_ir(source, str(inter.name), loglevel=loglevel)
-        subprocess.run(
-            [
-                "llc",
-                "-march=bpf",
-                "-filetype=obj",
-                "-O2",
-                str(inter.name),
-                "-o",
-                str(obj_file.name),
-            ],
-            check=True,
+    Profiled builds skip the compile cache, since a hit has nothing to measure.
+    """
+    report = resolve_profile(profile, filename, opt_level)
+    cache = resolve_cache(cache) if report is None else None
+    if cache is None:
+        timings = build_object(filename, output, None, opt_level, cpu, use_llc, report)
+    else:
+        with open(filename) as f:
+            source = f.read()
+        obj_path, timings = cached_object(
+            filename, source, cache, opt_level, cpu, use_llc
         )
+        start = time.perf_counter()
+        shutil.copyfile(obj_path, output)
+        timings["copy"] = time.perf_counter() - start
+
+    logger.info(f"Object written to {output} ({format_timings(timings)})")
+    if report is not None:
+        report_profile(profile, report)
+    return timings
+
+
+_scratch_dir = None
+
+
+def scratch_dir() -> Path:
+    """Per-process directory for uncached objects, removed at interpreter exit."""
+    global _scratch_dir
+    if _scratch_dir is None:
+        _scratch_dir = Path(tempfile.mkdtemp(prefix="pythonbpf-"))
+        atexit.register(shutil.rmtree, _scratch_dir, ignore_errors=True)
+    return _scratch_dir
+
+
+def caller_filename(depth=2) -> str:
+    """
+    Return the file of the frame `depth` levels up the stack.
+
+    Only that single frame is touched; inspect.stack() would read source
+    context for every frame on the stack.
+    """
+    return sys._getframe(depth).f_code.co_filename
+
+
+def caller_source(filename) -> str:
+    """Return the full source of the caller's module."""
+    lines = linecache.getlines(filename)
+    if not lines:
+        raise OSError(f"Could not read source of {filename}")
+    return "".join(lines)
+
+
+def compile(
+    loglevel=logging.WARNING,
+    opt_level=DEFAULT_OPT_LEVEL,
+    cpu=DEFAULT_CPU,
+    use_llc=False,
+    cache=True,
+    profile=False,
+):
+    """
+    Compile the calling module to a .o next to it.
+
+    Returns True, or the CompileProfile when profiling was requested.
+    """
+    logging.basicConfig(
+        level=loglevel, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+    )
+    caller_file = Path(caller_filename()).resolve()
+
+    o_file = caller_file.with_suffix(".o")
+
+    report = resolve_profile(profile, str(caller_file), opt_level)
+    compile_to_object(
+        str(caller_file),
+        str(o_file),
+        opt_level=opt_level,
+        cpu=cpu,
+        use_llc=use_llc,
+        cache=cache,
+        profile=report,
+    )
+    if report is not None:
+        # compile_to_object already logged the report
+        if profile is True:
+            print(report.format(), file=sys.stderr)
+        return report
+    return True
+
+
+def BPF(
+    loglevel=logging.WARNING,
+    opt_level=DEFAULT_OPT_LEVEL,
+    cpu=DEFAULT_CPU,
+    use_llc=False,
+    cache=True,
+    profile=False,
+) -> "BpfProgram":
+    """
+    Compile the calling module and return it as a pylibbpf BpfProgram.
+
+    Pass a CompileProfile as profile to collect the timing report, or True to
+    just print it.
+    """
+    logging.basicConfig(
+        level=loglevel, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+    )
+    from pylibbpf import BpfProgram
+
+    filename = caller_filename()
+    src = caller_source(filename)
+    filename = str(Path(filename).resolve())
+
+    report = resolve_profile(profile, filename, opt_level)
+    cache = resolve_cache(cache) if report is None else None
+    if cache is None:
+        fd, obj_name = tempfile.mkstemp(suffix=".o", dir=scratch_dir())
+        os.close(fd)
+        obj_path = Path(obj_name)
+        timings = build_object(filename, obj_path, src, opt_level, cpu, use_llc, report)
+    else:
+        obj_path, timings = cached_object(filename, src, cache, opt_level, cpu, use_llc)
 
-        return BpfProgram(str(obj_file.name))
+    logger.info(f"Loading {obj_path} ({format_timings(timings)})")
+    if report is not None:
+        report_profile(profile, report)
+    return BpfProgram(str(obj_path))
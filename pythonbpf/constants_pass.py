@@ -0,0 +1,430 @@
+import ast
+import copy
+import logging
+from collections import Counter
+
+from .loops_pass import (
+    check_loop_body,
+    should_unroll,
+    strip_override,
+    trip_count,
+    while_trip_count,
+)
+
+logger = logging.getLogger(__name__)
+
+INT64_MASK = (1 << 64) - 1
+
+
+def to_int64(value):
+    """Wrap an int to a signed 64-bit value, as the emitted i64 arithmetic does."""
+    value &= INT64_MASK
+    return value - (1 << 64) if value >> 63 else value
+
+
+def _sdiv(a, b):
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+def _srem(a, b):
+    return a - b * _sdiv(a, b)
+
+
+# Same semantics as the instructions handle_binary_op_impl emits. Folded
+# operands are untyped literals, which it computes as signed c_int64.
+BIN_OPS = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div: _sdiv,
+    ast.Mod: _srem,
+    ast.LShift: lambda a, b: a << b,
+    ast.RShift: lambda a, b: to_int64(a) >> b,
+    ast.BitOr: lambda a, b: a | b,
+    ast.BitXor: lambda a, b: a ^ b,
+    ast.BitAnd: lambda a, b: a & b,
+    ast.FloorDiv: lambda a, b: (a & INT64_MASK) // (b & INT64_MASK),
+}
+
+COMPARE_OPS = {
+    ast.Eq: lambda a, b: a == b,
+    ast.NotEq: lambda a, b: a != b,
+    ast.Lt: lambda a, b: a < b,
+    ast.LtE: lambda a, b: a <= b,
+    ast.Gt: lambda a, b: a > b,
+    ast.GtE: lambda a, b: a >= b,
+}
+
+
+def const_value(node, env):
+    """Return the compile-time int/bool value of an expression, or None."""
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, int):
+            return node.value
+        return None
+    elif isinstance(node, ast.Name):
+        return env.get(node.id)
+    elif isinstance(node, ast.UnaryOp):
+        operand = const_value(node.operand, env)
+        if operand is None:
+            return None
+        if isinstance(node.op, ast.Not):
+            return not operand
+        elif isinstance(node.op, ast.USub):
+            return to_int64(-operand)
+        elif isinstance(node.op, ast.UAdd):
+            return operand
+        elif isinstance(node.op, ast.Invert):
+            return to_int64(~operand)
+    elif isinstance(node, ast.BinOp):
+        left = const_value(node.left, env)
+        right = const_value(node.right, env)
+        op = BIN_OPS.get(type(node.op))
+        if left is None or right is None or op is None:
+            return None
+        if isinstance(node.op, (ast.Div, ast.Mod, ast.FloorDiv)) and right == 0:
+            # Leave division by zero to the program
+            return None
+        if isinstance(node.op, (ast.LShift, ast.RShift)) and not 0 <= right < 64:
+            return None
+        return to_int64(op(int(left), int(right)))
+    elif isinstance(node, ast.Compare):
+        # a < b < c is a < b and b < c
+        left = const_value(node.left, env)
+        for node_op, comparator in zip(node.ops, node.comparators):
+            right = const_value(comparator, env)
+            op = COMPARE_OPS.get(type(node_op))
+            if left is None or right is None or op is None:
+                return None
+            if not op(left, right):
+                return False
+            left = right
+        return True
+    elif isinstance(node, ast.BoolOp):
+        values = [const_value(value, env) for value in node.values]
+        if any(value is None for value in values):
+            return None
+        if isinstance(node.op, ast.And):
+            return all(values)
+        return any(values)
+    elif isinstance(node, ast.IfExp):
+        test = const_value(node.test, env)
+        if test is None:
+            return None
+        return const_value(node.body if test else node.orelse, env)
+    return None
+
+
+def collect_module_constants(tree_body):
+    """
+    Return {name: value} for the module-level names bound to int constants.
+
+    Names assigned more than once at module level are left out.
+    """
+    constants = {}
+    seen = Counter()
+    for node in tree_body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1:
+            target, value = node.targets[0], node.value
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            target, value = node.target, node.value
+        else:
+            continue
+        if not isinstance(target, ast.Name):
+            continue
+        seen[target.id] += 1
+        folded = const_value(value, constants)
+        if folded is not None:
+            constants[target.id] = folded
+    return {name: value for name, value in constants.items() if seen[name] == 1}
+
+
+def assigned_names(func_node):
+    """Count how often each name is bound inside a function, parameters included."""
+    counts = Counter(arg.arg for arg in func_node.args.args)
+    for node in ast.walk(func_node):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            counts[node.id] += 1
+    return counts
+
+
+class ConstantFolder(ast.NodeTransformer):
+    """
+    Replace constant expressions in a function body by their values.
+
+    Names are only substituted where their value is needed. A name passed
+    directly to a map method or deref(), or used as a map subscript, is left
+    alone, because those take the variable's address.
+    """
+
+    def __init__(self, env, assigned=None):
+        self.env = env
+        # How often each name is bound in the function
+        self.assigned = assigned or Counter()
+
+    def fold(self, node):
+        value = const_value(node, self.env)
+        if value is not None and not isinstance(node, ast.Constant):
+            return ast.copy_location(ast.Constant(value), node)
+        return self.visit(node)
+
+    def visit_Call(self, node):
+        node.func = self.visit(node.func)
+        keeps_address = isinstance(node.func, ast.Attribute) or (
+            isinstance(node.func, ast.Name) and node.func.id == "deref"
+        )
+        node.args = [
+            arg if keeps_address and isinstance(arg, ast.Name) else self.fold(arg)
+            for arg in node.args
+        ]
+        for keyword in node.keywords:
+            keyword.value = self.fold(keyword.value)
+        return node
+
+    def visit_Subscript(self, node):
+        node.value = self.visit(node.value)
+        if not isinstance(node.slice, ast.Name):
+            # map[key] hands the key to the map helpers by address
+            node.slice = self.fold(node.slice)
+        return node
+
+    def visit_FormattedValue(self, node):
+        value = const_value(node.value, self.env)
+        if value is not None and node.conversion == -1 and node.format_spec is None:
+            # Print the literal instead of passing it as a printk argument
+            return ast.copy_location(ast.Constant(str(value)), node)
+        return node
+
+    def visit_BinOp(self, node):
+        return self.fold_expr(node)
+
+    def visit_UnaryOp(self, node):
+        return self.fold_expr(node)
+
+    def visit_Compare(self, node):
+        return self.fold_expr(node)
+
+    def visit_BoolOp(self, node):
+        return self.fold_expr(node)
+
+    def visit_IfExp(self, node):
+        test = const_value(node.test, self.env)
+        if test is not None:
+            # Only the branch that is taken is compiled
+            return self.fold(node.body if test else node.orelse)
+        return self.fold_expr(node)
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load) and node.id in self.env:
+            return ast.copy_location(ast.Constant(self.env[node.id]), node)
+        return node
+
+    def fold_expr(self, node):
+        value = const_value(node, self.env)
+        if value is not None:
+            return ast.copy_location(ast.Constant(value), node)
+        return self.generic_visit(node)
+
+
+def stored_names(node):
+    return {
+        sub.id
+        for sub in ast.walk(node)
+        if isinstance(sub, ast.Name) and isinstance(sub.ctx, ast.Store)
+    }
+
+
+def range_bounds(node):
+    """Return (start, stop, step) of a range() call with constant arguments."""
+    if not (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id == "range"
+        and 1 <= len(node.args) <= 3
+        and not node.keywords
+        and all(
+            isinstance(arg, ast.Constant) and isinstance(arg.value, int)
+            for arg in node.args
+        )
+    ):
+        return None
+    args = [arg.value for arg in node.args]
+    if len(args) == 1:
+        args.insert(0, 0)
+    if len(args) == 2:
+        args.append(1)
+    if args[2] == 0:
+        raise ValueError("range() step must not be zero")
+    return tuple(args)
+
+
+def unroll_body(body, trips, folder, bind=None):
+    """Repeat body trips times; bind(i) runs before the i-th copy is folded."""
+    unrolled = []
+    for i in range(trips):
+        if bind is not None:
+            unrolled.extend(bind(i))
+        unrolled.extend(fold_body(copy.deepcopy(body), folder, ()))
+        if unrolled and isinstance(unrolled[-1], ast.Return):
+            break
+    return unrolled
+
+
+def fold_for(stmt, folder):
+    """Unroll a for loop over a constant range(), or fold it in place."""
+    check_loop_body(stmt.body)
+    iterable, forced = strip_override(stmt.iter)
+    stmt.iter = folder.visit(iterable)
+    bounds = range_bounds(stmt.iter)
+    if bounds is None or not isinstance(stmt.target, ast.Name):
+        raise SyntaxError("Only 'for <name> in range(...)' with constant bounds")
+    target = stmt.target.id
+    orelse = stmt.orelse
+    stmt.orelse = []
+
+    trips = trip_count(*bounds)
+    if not should_unroll(trips, stmt.body, forced):
+        stmt.body = fold_body(stmt.body, folder, ())
+        return [stmt] + fold_body(orelse, folder, ())
+
+    values = range(*bounds)
+
+    def bind(i):
+        if folder.assigned[target] == 1:
+            # Only the loop binds the name, substitute the value directly
+            folder.env[target] = values[i]
+            return []
+        assign = ast.Assign(
+            targets=[ast.Name(target, ast.Store())], value=ast.Constant(values[i])
+        )
+        return [ast.copy_location(assign, stmt)]
+
+    unrolled = unroll_body(stmt.body, trips, folder, bind)
+    if unrolled and isinstance(unrolled[-1], ast.Return):
+        return unrolled
+    return unrolled + fold_body(orelse, folder, ())
+
+
+def fold_while(stmt, folder, known):
+    """Unroll a while loop with a provable bound, or fold it in place."""
+    check_loop_body(stmt.body)
+    test, forced = strip_override(stmt.test)
+    orelse = stmt.orelse
+    stmt.orelse = []
+    value = const_value(test, folder.env)
+    if value is not None and not value:
+        return fold_body(orelse, folder, ())
+
+    bound = while_trip_count(
+        test, stmt.body, known, lambda node: const_value(node, folder.env)
+    )
+    if bound is None:
+        raise SyntaxError(
+            "while loops must compare a counter with a constant and step it by "
+            "a constant once per iteration"
+        )
+    name, _, _, trips = bound
+    logger.info(f"while loop over {name} runs {trips} times")
+    if not should_unroll(trips, stmt.body, forced):
+        stmt.test = folder.visit(test)
+        stmt.body = fold_body(stmt.body, folder, ())
+        return [stmt] + fold_body(orelse, folder, ())
+
+    unrolled = unroll_body(stmt.body, trips, folder)
+    if unrolled and isinstance(unrolled[-1], ast.Return):
+        return unrolled
+    return unrolled + fold_body(orelse, folder, ())
+
+
+def fold_body(stmts, folder, propagate):
+    """
+    Fold a statement list, dropping dead if branches and code after return,
+    and unrolling loops the heuristic picks.
+    """
+    body = []
+    # Names whose latest binding in this list is a known constant
+    known = {}
+    for stmt in stmts:
+        if isinstance(stmt, ast.If):
+            test = const_value(stmt.test, folder.env)
+            if test is not None:
+                logger.info(f"Removing if with constant condition {bool(test)}")
+                body.extend(fold_body(stmt.body if test else stmt.orelse, folder, ()))
+            else:
+                stmt.test = folder.visit(stmt.test)
+                stmt.body = fold_body(stmt.body, folder, ())
+                stmt.orelse = fold_body(stmt.orelse, folder, ())
+                body.append(stmt)
+        elif isinstance(stmt, ast.For):
+            body.extend(fold_for(stmt, folder))
+        elif isinstance(stmt, ast.While):
+            body.extend(fold_while(stmt, folder, known))
+        else:
+            body.append(folder.visit(stmt))
+            # Single assignments at the top level are visible from here on
+            if (
+                isinstance(stmt, ast.Assign)
+                and len(stmt.targets) == 1
+                and isinstance(stmt.targets[0], ast.Name)
+                and stmt.targets[0].id in propagate
+            ):
+                value = const_value(stmt.value, folder.env)
+                if value is not None:
+                    folder.env[stmt.targets[0].id] = value
+
+        for name in stored_names(stmt):
+            known.pop(name, None)
+        if (
+            isinstance(stmt, ast.Assign)
+            and len(stmt.targets) == 1
+            and isinstance(stmt.targets[0], ast.Name)
+            and isinstance(stmt.value, ast.Constant)
+            and isinstance(stmt.value.value, int)
+        ):
+            known[stmt.targets[0].id] = stmt.value.value
+
+        if body and isinstance(body[-1], ast.Return):
+            # Anything after it is unreachable
+            break
+    return body
+
+
+def fold_constants(func_node, module_constants=None):
+    """
+    Return a copy of func_node with constant expressions folded.
+
+    Module-level constants are inlined unless the function rebinds them;
+    locals assigned exactly once at the top level of the body are propagated
+    to their uses, and the assignment is dropped once nothing reads it.
+    """
+    func_node = copy.deepcopy(func_node)
+    counts = assigned_names(func_node)
+    env = {
+        name: value
+        for name, value in (module_constants or {}).items()
+        if name not in counts
+    }
+    propagate = {name for name, n in counts.items() if n == 1}
+    folder = ConstantFolder(env, counts)
+    func_node.body = fold_body(func_node.body, folder, propagate)
+
+    # Drop assignments whose every read was replaced by the value
+    reads = Counter(
+        node.id
+        for node in ast.walk(func_node)
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)
+    )
+    func_node.body = [
+        stmt
+        for stmt in func_node.body
+        if not (
+            isinstance(stmt, ast.Assign)
+            and len(stmt.targets) == 1
+            and isinstance(stmt.targets[0], ast.Name)
+            and stmt.targets[0].id in folder.env
+            and stmt.targets[0].id in propagate
+            and reads[stmt.targets[0].id] == 0
+        )
+    ]
+    return func_node
@@ -61,6 +61,17 @@ class DebugInfoGenerator:
         """Get debug info for unsigned 64-bit integer"""
         return self.get_basic_type("unsigned long long", 64, dc.DW_ATE_unsigned)
 
+    def get_int_type(self, width: int, signed: bool) -> Any:
+        """Get debug info for an integer of the given width and signedness"""
+        name = {8: "char", 16: "short", 32: "int", 64: "long long"}[width]
+        if width == 8:
+            encoding = dc.DW_ATE_signed_char if signed else dc.DW_ATE_unsigned_char
+        else:
+            encoding = dc.DW_ATE_signed if signed else dc.DW_ATE_unsigned
+        return self.get_basic_type(
+            name if signed else f"unsigned {name}", width, encoding
+        )
+
     def create_pointer_type(self, base_type: Any, size: int = 64) -> Any:
         """Create a pointer type to the given base type"""
         return self.module.add_debug_info(
@@ -81,6 +92,24 @@ class DebugInfoGenerator:
             },
         )
 
+    def create_flexible_array_type(self, base_type: Any) -> Any:
+        """Create a zero-sized trailing array (`T name[]`) of the given base type"""
+        subrange = self.module.add_debug_info("DISubrange", {"count": -1})
+        return self.module.add_debug_info(
+            "DICompositeType",
+            {
+                "tag": dc.DW_TAG_array_type,
+                "baseType": base_type,
+                "elements": [subrange],
+            },
+        )
+
+    def create_subroutine_type(self, return_type: Any, param_types: List[Any]) -> Any:
+        """Create a function prototype type"""
+        return self.module.add_debug_info(
+            "DISubroutineType", {"types": [return_type, *param_types]}
+        )
+
     @staticmethod
     def _compute_array_size(base_type: Any, count: int) -> int:
         # Extract size from base_type if possible
@@ -102,18 +131,19 @@ class DebugInfoGenerator:
         )
 
     def create_struct_type(
-        self, members: List[Any], size: int, is_distinct: bool
+        self, members: List[Any], size: int, is_distinct: bool, name: str = None
     ) -> Any:
         """Create a struct type with the given members and size"""
+        attrs = {
+            "tag": dc.DW_TAG_structure_type,
+            "file": self.module._file_metadata,
+            "size": size,
+            "elements": members,
+        }
+        if name is not None:
+            attrs["name"] = name
         return self.module.add_debug_info(
-            "DICompositeType",
-            {
-                "tag": dc.DW_TAG_structure_type,
-                "file": self.module._file_metadata,
-                "size": size,
-                "elements": members,
-            },
-            is_distinct=is_distinct,
+            "DICompositeType", attrs, is_distinct=is_distinct
         )
 
     def create_global_var_debug_info(
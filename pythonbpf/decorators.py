@@ -22,6 +22,12 @@ def struct(cls):
     return cls
 
 
+def inline(func):
+    """Decorator to inline a @bpf helper function into its callers."""
+    func._inline = True
+    return func
+
+
 def section(name: str):
     def wrapper(fn):
         fn._section = name
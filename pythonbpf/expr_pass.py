@@ -4,14 +4,154 @@ from logging import Logger
 import logging
 from typing import Dict
 
+from .binary_ops import handle_binary_op_impl
+from .type_deducer import (
+    ctypes_to_ir,
+    expr_ctype,
+    is_int_ctype,
+    is_signed,
+    local_ctypes,
+)
+
 logger: Logger = logging.getLogger(__name__)
 
 
+def coerce_value(builder, val, ir_type, signed=True):
+    """
+    Cast val to ir_type, for register locals, arguments and return values.
+
+    signed is the signedness of val, which picks sext or zext when widening.
+    """
+    if isinstance(ir_type, ir.IntType) and isinstance(val.type, ir.IntType):
+        if val.type.width < ir_type.width:
+            if not signed:
+                return builder.zext(val, ir_type)
+            return builder.sext(val, ir_type)
+        if val.type.width > ir_type.width:
+            return builder.trunc(val, ir_type)
+    return val
+
+
+def declare_return_ctype(module, func, ctype):
+    """Record the return ctype of a @bpf function declared in module."""
+    if not hasattr(module, "return_ctypes"):
+        module.return_ctypes = {}
+    module.return_ctypes[func.name] = ctype
+
+
+def function_ctypes(module):
+    """Return {name: ctype} for the @bpf functions declared in module."""
+    # Kept up to date as functions are declared, so that typing an expression
+    # does not rescan every function of the module
+    return getattr(module, "return_ctypes", {})
+
+
+def expr_signed(expr, module, local_sym_tab, structs_sym_tab=None):
+    """Whether the int value of expr is signed, which decides how it widens."""
+    env = local_ctypes(local_sym_tab, structs_sym_tab)
+    return is_signed(expr_ctype(expr, env, function_ctypes(module)))
+
+
+def is_speculatable(expr, local_sym_tab):
+    """
+    Whether expr can be evaluated even where its value is not needed.
+
+    Calls have side effects, and arithmetic on a lookup() pointer loads
+    through it, which the verifier only allows after a null check. A bare
+    pointer is only compared with null.
+    """
+    if isinstance(expr, ast.Name):
+        return True
+    for node in ast.walk(expr):
+        if isinstance(node, ast.Call):
+            return False
+        if (
+            isinstance(node, ast.Name)
+            and node.id in local_sym_tab
+            and isinstance(local_sym_tab[node.id].ir_type, ir.PointerType)
+        ):
+            return False
+    return True
+
+
+def _handle_ifexp(
+    expr: ast.IfExp,
+    func,
+    module,
+    builder: ir.IRBuilder,
+    local_sym_tab: Dict,
+    map_sym_tab,
+    structs_sym_tab,
+):
+    """Lower a if c else b to a select, or to branches if a or b has effects."""
+    # delayed import to avoid circular dependency
+    from pythonbpf.functions_pass import handle_cond
+
+    cond = handle_cond(
+        func, module, builder, expr.test, local_sym_tab, map_sym_tab, structs_sym_tab
+    )
+    if cond is None:
+        return None
+
+    def emit(node):
+        val = eval_expr(
+            func, module, builder, node, local_sym_tab, map_sym_tab, structs_sym_tab
+        )
+        if val is None:
+            raise ValueError(f"Cannot evaluate {ast.unparse(node)}")
+        return val[0]
+
+    def widen(val, node, other):
+        # Both sides take the wider int type, extended by their own signedness
+        if (
+            isinstance(val.type, ir.IntType)
+            and isinstance(other.type, ir.IntType)
+            and val.type.width < other.type.width
+        ):
+            signed = expr_signed(node, module, local_sym_tab, structs_sym_tab)
+            return coerce_value(builder, val, other.type, signed)
+        return val
+
+    if is_speculatable(expr.body, local_sym_tab) and is_speculatable(
+        expr.orelse, local_sym_tab
+    ):
+        then_val, else_val = emit(expr.body), emit(expr.orelse)
+        then_val, else_val = (
+            widen(then_val, expr.body, else_val),
+            widen(else_val, expr.orelse, then_val),
+        )
+        result = builder.select(cond, then_val, else_val)
+        return result, result.type
+
+    then_block = func.append_basic_block(name="ifexp.then")
+    else_block = func.append_basic_block(name="ifexp.else")
+    end_block = func.append_basic_block(name="ifexp.end")
+    builder.cbranch(cond, then_block, else_block)
+    builder.position_at_end(then_block)
+    then_val = emit(expr.body)
+    then_end = builder.block
+    builder.position_at_end(else_block)
+    else_val = emit(expr.orelse)
+    else_end = builder.block
+    # Widen in each branch, before it jumps to the join
+    builder.position_at_end(then_end)
+    then_val, else_val = widen(then_val, expr.body, else_val), else_val
+    builder.branch(end_block)
+    builder.position_at_end(else_end)
+    else_val = widen(else_val, expr.orelse, then_val)
+    else_end = builder.block
+    builder.branch(end_block)
+    builder.position_at_end(end_block)
+    result = builder.phi(then_val.type)
+    result.add_incoming(then_val, then_end)
+    result.add_incoming(else_val, else_end)
+    return result, result.type
+
+
 def _handle_name_expr(expr: ast.Name, local_sym_tab: Dict, builder: ir.IRBuilder):
     """Handle ast.Name expressions."""
     if expr.id in local_sym_tab:
-        var = local_sym_tab[expr.id].var
-        val = builder.load(var)
+        val = local_sym_tab[expr.id].load(builder)
         return val, local_sym_tab[expr.id].ir_type
     else:
         logger.info(f"Undefined variable {expr.id}")
@@ -70,24 +210,65 @@ def _handle_deref_call(expr: ast.Call, local_sym_tab: Dict, builder: ir.IRBuilde
         return None
 
     if isinstance(arg, ast.Name):
-        if arg.id in local_sym_tab:
-            arg_ptr = local_sym_tab[arg.id].var
-        else:
+        if arg.id not in local_sym_tab:
             logger.info(f"Undefined variable {arg.id}")
             return None
     else:
         logger.info("Unsupported argument type for deref")
         return None
 
-    if arg_ptr is None:
-        logger.info("Failed to evaluate deref argument")
-        return None
-
     # Load the value from pointer
-    val = builder.load(arg_ptr)
+    val = local_sym_tab[arg.id].load(builder)
     return val, local_sym_tab[arg.id].ir_type
 
 
+def _handle_subprogram_call(
+    expr: ast.Call,
+    callee: ir.Function,
+    func,
+    module,
+    builder: ir.IRBuilder,
+    local_sym_tab: Dict,
+    map_sym_tab,
+    structs_sym_tab,
+):
+    """Call another @bpf function, as a BPF-to-BPF call unless it is inlined."""
+    if callee is func:
+        raise SyntaxError(f"{func.name}() calls itself, BPF does not allow recursion")
+    param_types = callee.function_type.args
+    if len(expr.args) != len(param_types) or expr.keywords:
+        raise SyntaxError(
+            f"{callee.name}() takes {len(param_types)} positional arguments, "
+            f"got {len(expr.args)}"
+        )
+
+    args = []
+    for arg, param_type in zip(expr.args, param_types):
+        if (
+            isinstance(arg, ast.Name)
+            and arg.id in local_sym_tab
+            and local_sym_tab[arg.id].metadata is not None
+        ):
+            # Structs are passed by pointer to their stack slot
+            args.append(local_sym_tab[arg.id].var)
+            continue
+        val = eval_expr(
+            func, module, builder, arg, local_sym_tab, map_sym_tab, structs_sym_tab
+        )
+        if val is None:
+            raise ValueError(
+                f"Cannot evaluate argument {ast.unparse(arg)} of {callee.name}()"
+            )
+        val = val[0]
+        if isinstance(param_type, ir.PointerType) and val.type != param_type:
+            val = builder.bitcast(val, param_type)
+        signed = expr_signed(arg, module, local_sym_tab, structs_sym_tab)
+        args.append(coerce_value(builder, val, param_type, signed))
+
+    logger.info(f"Calling subprogram {callee.name}")
+    return builder.call(callee, args), callee.function_type.return_type
+
+
 def eval_expr(
     func,
     module,
@@ -105,6 +286,26 @@ def eval_expr(
     elif isinstance(expr, ast.Call):
         if isinstance(expr.func, ast.Name) and expr.func.id == "deref":
             return _handle_deref_call(expr, local_sym_tab, builder)
+        if (
+            isinstance(expr.func, ast.Name)
+            and is_int_ctype(expr.func.id)
+            and len(expr.args) == 1
+        ):
+            # c_uint32(x) and friends are casts
+            val = eval_expr(
+                func,
+                module,
+                builder,
+                expr.args[0],
+                local_sym_tab,
+                map_sym_tab,
+                structs_sym_tab,
+            )
+            if val is None:
+                return None
+            ir_type = ctypes_to_ir(expr.func.id)
+            signed = expr_signed(expr.args[0], module, local_sym_tab, structs_sym_tab)
+            return coerce_value(builder, val[0], ir_type, signed), ir_type
 
         # delayed import to avoid circular dependency
         from pythonbpf.helper import HelperHandlerRegistry, handle_helper_call
@@ -121,6 +322,19 @@ def eval_expr(
                 map_sym_tab,
                 structs_sym_tab,
             )
+        elif isinstance(expr.func, ast.Name) and isinstance(
+            module.globals.get(expr.func.id), ir.Function
+        ):
+            return _handle_subprogram_call(
+                expr,
+                module.globals[expr.func.id],
+                func,
+                module,
+                builder,
+                local_sym_tab,
+                map_sym_tab,
+                structs_sym_tab,
+            )
         elif isinstance(expr.func, ast.Attribute):
             logger.info(f"Handling method call: {ast.dump(expr.func)}")
             if isinstance(expr.func.value, ast.Call) and isinstance(
@@ -153,6 +367,13 @@ def eval_expr(
                         )
     elif isinstance(expr, ast.Attribute):
         return _handle_attribute_expr(expr, local_sym_tab, structs_sym_tab, builder)
+    elif isinstance(expr, ast.BinOp):
+        result = handle_binary_op_impl(expr, module, builder, local_sym_tab)
+        return result, result.type
+    elif isinstance(expr, ast.IfExp):
+        return _handle_ifexp(
+            expr, func, module, builder, local_sym_tab, map_sym_tab, structs_sym_tab
+        )
     logger.info("Unsupported expression evaluation")
     return None
 
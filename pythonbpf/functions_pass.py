@@ -1,44 +1,144 @@
 from llvmlite import ir
 import ast
 import logging
-from typing import Any
+import time
+from typing import Any, Optional
 from dataclasses import dataclass
 
-from .helper import HelperHandlerRegistry, handle_helper_call
-from .type_deducer import ctypes_to_ir
-from .binary_ops import handle_binary_op
-from .expr_pass import eval_expr, handle_expr
+from .helper import (
+    HelperHandlerRegistry,
+    emit_atomic_rmw,
+    emit_map_atomic_update,
+    handle_helper_call,
+)
+from .type_deducer import (
+    DEFAULT_CTYPE,
+    ctypes_to_ir,
+    expr_ctype,
+    infer_local_types,
+    is_int_ctype,
+    is_signed,
+    local_ctypes,
+    unify_ctypes,
+)
+from .binary_ops import extend_operand, fits_width, handle_binary_op
+from .expr_pass import (
+    coerce_value,
+    declare_return_ctype,
+    eval_expr,
+    expr_signed,
+    function_ctypes,
+    handle_expr,
+    is_speculatable,
+)
+from .symbol_index import SymbolKind
+from .stack_frame import StackFrame, type_align
+from .constants_pass import fold_constants, range_bounds
+from .maps.maps_pass import init_prog_array_slots, map_slot_ctype, map_value_type
+from .lookups_pass import eliminate_redundant_lookups, map_method, map_name_of
 
 logger = logging.getLogger(__name__)
 
+# Registers r1-r5 carry the arguments of a BPF-to-BPF call
+MAX_SUBPROGRAM_ARGS = 5
+
 
 @dataclass
 class LocalSymbol:
-    var: ir.AllocaInstr
+    """
+    A local variable of a @bpf function.
+
+    Locals whose address is never needed live in registers: var is None and
+    value is the SSA value currently bound to the name. Everything else
+    (structs, map keys and values) keeps a stack slot in var; a struct
+    passed to a helper function uses the caller's slot through its pointer.
+    """
+
+    var: Optional[ir.Value]
     ir_type: ir.Type
     metadata: Any = None
+    value: Any = None
+    # ctypes name of an int local, which carries its signedness
+    ctype: Optional[str] = None
 
     def __iter__(self):
         yield self.var
         yield self.ir_type
         yield self.metadata
 
+    @property
+    def in_register(self):
+        return self.var is None
+
+    def load(self, builder):
+        """Return the current value of the variable."""
+        if self.in_register:
+            return self.value
+        return builder.load(self.var)
+
+    def store(self, builder, val, signed=True):
+        """Assign val, of the given signedness, to the variable."""
+        if self.in_register:
+            self.value = coerce_value(builder, val, self.ir_type, signed)
+        elif isinstance(self.ir_type, ir.IntType):
+            builder.store(coerce_value(builder, val, self.ir_type, signed), self.var)
+        else:
+            builder.store(val, self.var)
 
-def get_probe_string(func_node):
-    """Extract the probe string from the decorator of the function node."""
-    # TODO: right now we have the whole string in the section decorator
-    # But later we can implement typed tuples for tracepoints and kprobes
-    # For helper functions, we return "helper"
 
-    for decorator in func_node.decorator_list:
-        if isinstance(decorator, ast.Name) and decorator.id == "bpfglobal":
-            return None
-        if isinstance(decorator, ast.Call) and isinstance(decorator.func, ast.Name):
-            if decorator.func.id == "section" and len(decorator.args) == 1:
-                arg = decorator.args[0]
-                if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
-                    return arg.value
-    return "helper"
+def find_address_taken(body):
+    """
+    Return the local names that need a stack slot.
+
+    Map methods (lookup, update, delete, ...) take their key and value by
+    pointer, so any plain name passed to a method call, or used as a map
+    subscript, is spilled.
+    """
+    names = set()
+    for stmt in body:
+        for node in ast.walk(stmt):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+                names.update(arg.id for arg in node.args if isinstance(arg, ast.Name))
+            elif isinstance(node, ast.Subscript) and isinstance(node.slice, ast.Name):
+                names.add(node.slice.id)
+    return names
+
+
+def map_slot_types(body, map_sym_tab):
+    """
+    Return {name: ctype} for the locals passed to map helpers by pointer.
+
+    The helper reads the map's whole key or value through the pointer, so
+    such a local's slot takes the map's key or value type rather than its
+    own; values assigned to it are widened or narrowed to fit.
+    """
+    slots = {}
+
+    def claim(node, map_name, member):
+        if not isinstance(node, ast.Name) or map_name not in map_sym_tab:
+            return
+        ctype = map_slot_ctype(map_sym_tab[map_name], member)
+        if ctype is None:
+            return
+        known = slots.setdefault(node.id, ctype)
+        if ctypes_to_ir(known).width != ctypes_to_ir(ctype).width:
+            raise TypeError(
+                f"'{node.id}' is used as a {known} and a {ctype} map {member}; "
+                "use a separate local for each"
+            )
+
+    for stmt in body:
+        for node in ast.walk(stmt):
+            call = map_method(node)
+            if call is not None:
+                map_name, method, args = call
+                if method in ("lookup", "update", "delete") and args:
+                    claim(args[0], map_name, "key")
+                if method == "update" and len(args) > 1:
+                    claim(args[1], map_name, "value")
+            elif isinstance(node, ast.Subscript):
+                claim(node.slice, map_name_of(node.value), "key")
+    return slots
 
 
 def handle_assign(
@@ -49,10 +149,13 @@ def handle_assign(
         logger.info("Unsupported multiassignment")
         return
 
-    num_types = ("c_int32", "c_int64", "c_uint32", "c_uint64")
-
     target = stmt.targets[0]
     logger.info(f"Handling assignment to {ast.dump(target)}")
+    if isinstance(target, ast.Subscript):
+        handle_pointer_store(
+            func, module, builder, stmt, map_sym_tab, local_sym_tab, structs_sym_tab
+        )
+        return
     if not isinstance(target, ast.Name) and not isinstance(target, ast.Attribute):
         logger.info("Unsupported assignment target")
         return
@@ -90,27 +193,28 @@ def handle_assign(
                     logger.info("Failed to evaluate struct field assignment")
                     return
                 logger.info(field_ptr)
-                builder.store(val[0], field_ptr)
+                # Narrowed or widened to the field, e.g. an address into a c_uint32
+                signed = expr_signed(rval, module, local_sym_tab, structs_sym_tab)
+                field_val = coerce_value(
+                    builder, val[0], struct_info.field_type(field_name), signed
+                )
+                builder.store(field_val, field_ptr)
                 logger.info(f"Assigned to struct field {var_name}.{field_name}")
                 return
     elif isinstance(rval, ast.Constant):
         if isinstance(rval.value, bool):
             if rval.value:
-                builder.store(
-                    ir.Constant(ir.IntType(1), 1), local_sym_tab[var_name].var
-                )
+                local_sym_tab[var_name].store(builder, ir.Constant(ir.IntType(1), 1))
             else:
-                builder.store(
-                    ir.Constant(ir.IntType(1), 0), local_sym_tab[var_name].var
-                )
+                local_sym_tab[var_name].store(builder, ir.Constant(ir.IntType(1), 0))
             logger.info(f"Assigned constant {rval.value} to {var_name}")
         elif isinstance(rval.value, int):
-            # Assume c_int64 for now
-            # var = builder.alloca(ir.IntType(64), name=var_name)
-            # var.align = 8
-            builder.store(
-                ir.Constant(ir.IntType(64), rval.value), local_sym_tab[var_name].var
-            )
+            # Built directly in the type inferred for the local
+            sym = local_sym_tab[var_name]
+            ir_type = sym.ir_type
+            if not isinstance(ir_type, ir.IntType):
+                ir_type = ir.IntType(64)
+            sym.store(builder, ir.Constant(ir_type, rval.value))
             logger.info(f"Assigned constant {rval.value} to {var_name}")
         elif isinstance(rval.value, str):
             str_val = rval.value.encode("utf-8") + b"\x00"
@@ -124,7 +228,7 @@ def handle_assign(
             global_str.global_constant = True
             global_str.initializer = str_const
             str_ptr = builder.bitcast(global_str, ir.PointerType(ir.IntType(8)))
-            builder.store(str_ptr, local_sym_tab[var_name].var)
+            local_sym_tab[var_name].store(builder, str_ptr)
             logger.info(f"Assigned string constant '{rval.value}' to {var_name}")
         else:
             logger.info("Unsupported constant type")
@@ -133,7 +237,7 @@ def handle_assign(
             call_type = rval.func.id
             logger.info(f"Assignment call type: {call_type}")
             if (
-                call_type in num_types
+                is_int_ctype(call_type)
                 and len(rval.args) == 1
                 and isinstance(rval.args[0], ast.Constant)
                 and isinstance(rval.args[0].value, int)
@@ -141,9 +245,10 @@ def handle_assign(
                 ir_type = ctypes_to_ir(call_type)
                 # var = builder.alloca(ir_type, name=var_name)
                 # var.align = ir_type.width // 8
-                builder.store(
+                local_sym_tab[var_name].store(
+                    builder,
                     ir.Constant(ir_type, rval.args[0].value),
-                    local_sym_tab[var_name].var,
+                    is_signed(call_type),
                 )
                 logger.info(
                     f"Assigned {call_type} constant {rval.args[0].value} to {var_name}"
@@ -160,7 +265,9 @@ def handle_assign(
                     map_sym_tab,
                     structs_sym_tab,
                 )
-                builder.store(val[0], local_sym_tab[var_name].var)
+                local_sym_tab[var_name].store(
+                    builder, val[0], expr_signed(rval, module, local_sym_tab)
+                )
                 logger.info(f"Assigned constant {rval.func.id} to {var_name}")
             elif call_type == "deref" and len(rval.args) == 1:
                 logger.info(f"Handling deref assignment {ast.dump(rval)}")
@@ -177,15 +284,29 @@ def handle_assign(
                     logger.info("Failed to evaluate deref argument")
                     return
                 logger.info(f"Dereferenced value: {val}, storing in {var_name}")
-                builder.store(val[0], local_sym_tab[var_name].var)
+                local_sym_tab[var_name].store(builder, val[0])
                 logger.info(f"Dereferenced and assigned to {var_name}")
             elif call_type in structs_sym_tab and len(rval.args) == 0:
                 struct_info = structs_sym_tab[call_type]
                 ir_type = struct_info.ir_type
                 # var = builder.alloca(ir_type, name=var_name)
                 # Null init
-                builder.store(ir.Constant(ir_type, None), local_sym_tab[var_name].var)
+                local_sym_tab[var_name].store(builder, ir.Constant(ir_type, None))
                 logger.info(f"Assigned struct {call_type} to {var_name}")
+            elif isinstance(module.globals.get(call_type), ir.Function):
+                val = eval_expr(
+                    func,
+                    module,
+                    builder,
+                    rval,
+                    local_sym_tab,
+                    map_sym_tab,
+                    structs_sym_tab,
+                )
+                local_sym_tab[var_name].store(
+                    builder, val[0], expr_signed(rval, module, local_sym_tab)
+                )
+                logger.info(f"Assigned result of {call_type}() to {var_name}")
             else:
                 logger.info(f"Unsupported assignment call type: {call_type}")
         elif isinstance(rval.func, ast.Attribute):
@@ -204,7 +325,7 @@ def handle_assign(
                             map_sym_tab,
                             structs_sym_tab,
                         )
-                        builder.store(val[0], local_sym_tab[var_name].var)
+                        local_sym_tab[var_name].store(builder, val[0])
                 else:
                     # TODO: probably a struct access
                     logger.info(f"TODO STRUCT ACCESS {ast.dump(rval)}")
@@ -226,18 +347,129 @@ def handle_assign(
                         )
                         # var = builder.alloca(ir.IntType(64), name=var_name)
                         # var.align = 8
-                        builder.store(val[0], local_sym_tab[var_name].var)
+                        local_sym_tab[var_name].store(builder, val[0])
             else:
                 logger.info("Unsupported assignment call structure")
         else:
             logger.info("Unsupported assignment call function type")
     elif isinstance(rval, ast.BinOp):
         handle_binary_op(rval, module, builder, var_name, local_sym_tab)
+    elif isinstance(rval, (ast.IfExp, ast.Name)):
+        val = eval_expr(
+            func, module, builder, rval, local_sym_tab, map_sym_tab, structs_sym_tab
+        )
+        if val is None:
+            logger.info(f"Unsupported assignment of {ast.unparse(rval)}")
+            return
+        local_sym_tab[var_name].store(
+            builder,
+            val[0],
+            expr_signed(rval, module, local_sym_tab, structs_sym_tab),
+        )
     else:
         logger.info("Unsupported assignment value type")
 
 
-def handle_cond(func, module, builder, cond, local_sym_tab, map_sym_tab):
+def handle_aug_assign(
+    func, module, builder, stmt, map_sym_tab, local_sym_tab, structs_sym_tab
+):
+    """
+    Handle m[key] op= n, and p op= n where p holds a map lookup result.
+
+    Both update the map value in place with one atomic instruction, instead
+    of a racy read-modify-write followed by update().
+    """
+    target = stmt.target
+    if isinstance(target, ast.Subscript):
+        map_name = map_name_of(target.value)
+        if map_name not in map_sym_tab:
+            raise SyntaxError(f"{ast.unparse(target.value)} is not a map")
+        value_type = map_value_type(map_sym_tab[map_name])
+        if value_type is None:
+            raise TypeError(f"In-place updates of {map_name} need an int value type")
+    elif (
+        isinstance(target, ast.Name)
+        and target.id in local_sym_tab
+        and isinstance(local_sym_tab[target.id].ir_type, ir.PointerType)
+    ):
+        value_type = local_sym_tab[target.id].ir_type.pointee
+    else:
+        raise SyntaxError(
+            "Augmented assignment is only supported on map values, "
+            "as map[key] op= n or on a lookup() result"
+        )
+
+    if isinstance(stmt.value, ast.Constant) and type(stmt.value.value) is int:
+        delta = ir.Constant(value_type, stmt.value.value)
+    else:
+        val = eval_expr(
+            func,
+            module,
+            builder,
+            stmt.value,
+            local_sym_tab,
+            map_sym_tab,
+            structs_sym_tab,
+        )
+        if val is None:
+            raise ValueError(f"Cannot evaluate {ast.unparse(stmt.value)}")
+        signed = expr_signed(stmt.value, module, local_sym_tab, structs_sym_tab)
+        delta = coerce_value(builder, val[0], value_type, signed)
+
+    if isinstance(target, ast.Subscript):
+        emit_map_atomic_update(
+            map_sym_tab[map_name],
+            target.slice,
+            stmt.op,
+            delta,
+            builder,
+            func,
+            local_sym_tab,
+        )
+    else:
+        # The verifier only accepts this under a null check of the pointer
+        emit_atomic_rmw(builder, stmt.op, local_sym_tab[target.id].load(builder), delta)
+    logger.info(f"Atomically updated {ast.unparse(target)}")
+
+
+def handle_pointer_store(
+    func, module, builder, stmt, map_sym_tab, local_sym_tab, structs_sym_tab
+):
+    """Handle p[0] = value, a store through a map lookup() pointer."""
+    target = stmt.targets[0]
+    if not (
+        isinstance(target.value, ast.Name)
+        and target.value.id in local_sym_tab
+        and isinstance(local_sym_tab[target.value.id].ir_type, ir.PointerType)
+        and isinstance(target.slice, ast.Constant)
+        and target.slice.value == 0
+    ):
+        raise SyntaxError(
+            f"Unsupported assignment target {ast.unparse(target)}, only p[0] "
+            "of a lookup() result can be assigned"
+        )
+    sym = local_sym_tab[target.value.id]
+    val = eval_expr(
+        func, module, builder, stmt.value, local_sym_tab, map_sym_tab, structs_sym_tab
+    )
+    if val is None:
+        raise ValueError(f"Cannot evaluate {ast.unparse(stmt.value)}")
+    signed = expr_signed(stmt.value, module, local_sym_tab, structs_sym_tab)
+    value = coerce_value(builder, val[0], sym.ir_type.pointee, signed)
+    builder.store(value, sym.load(builder))
+    logger.info(f"Stored through {target.value.id}")
+
+
+def handle_cond(
+    func, module, builder, cond, local_sym_tab, map_sym_tab, structs_sym_tab=None
+):
+    """
+    Lower a condition to an i1.
+
+    and/or, chained comparisons and not are short-circuited, except that
+    operands that are safe to evaluate anyway become a select instead of a
+    branch.
+    """
     if isinstance(cond, ast.Constant):
         if isinstance(cond.value, bool):
             return ir.Constant(ir.IntType(1), int(cond.value))
@@ -248,64 +480,200 @@ def handle_cond(func, module, builder, cond, local_sym_tab, map_sym_tab):
             return None
     elif isinstance(cond, ast.Name):
         if cond.id in local_sym_tab:
-            var = local_sym_tab[cond.id].var
-            val = builder.load(var)
-            if val.type != ir.IntType(1):
-                # Convert nonzero values to true, zero to false
-                if isinstance(val.type, ir.PointerType):
-                    # For pointer types, compare with null pointer
-                    zero = ir.Constant(val.type, None)
-                else:
-                    # For integer types, compare with zero
-                    zero = ir.Constant(val.type, 0)
-                val = builder.icmp_signed("!=", val, zero)
-            return val
+            return truth_value(builder, local_sym_tab[cond.id].load(builder))
         else:
             logger.info(f"Undefined variable {cond.id} in condition")
             return None
+    elif isinstance(cond, ast.BoolOp):
+        parts = [
+            (
+                lambda value=value: handle_cond(
+                    func,
+                    module,
+                    builder,
+                    value,
+                    local_sym_tab,
+                    map_sym_tab,
+                    structs_sym_tab,
+                ),
+                is_speculatable(value, local_sym_tab),
+            )
+            for value in cond.values
+        ]
+        return short_circuit(func, builder, parts, isinstance(cond.op, ast.And))
+    elif isinstance(cond, ast.UnaryOp) and isinstance(cond.op, ast.Not):
+        val = handle_cond(
+            func,
+            module,
+            builder,
+            cond.operand,
+            local_sym_tab,
+            map_sym_tab,
+            structs_sym_tab,
+        )
+        return builder.not_(val) if val is not None else None
     elif isinstance(cond, ast.Compare):
-        lhs = eval_expr(func, module, builder, cond.left, local_sym_tab, map_sym_tab)[0]
-        if len(cond.ops) != 1 or len(cond.comparators) != 1:
-            logger.info("Unsupported complex comparison")
+        # a < b < c is a < b and b < c, with b evaluated once
+        nodes = [cond.left, *cond.comparators]
+        values = {}
+
+        def operand(i):
+            if i not in values:
+                val = eval_expr(
+                    func,
+                    module,
+                    builder,
+                    nodes[i],
+                    local_sym_tab,
+                    map_sym_tab,
+                    structs_sym_tab,
+                )
+                if val is None:
+                    raise ValueError(f"Cannot evaluate {ast.unparse(nodes[i])}")
+                values[i] = val[0]
+            return values[i]
+
+        parts = [
+            (
+                lambda i=i, op=op: emit_compare(
+                    builder,
+                    op,
+                    operand(i),
+                    operand(i + 1),
+                    nodes[i],
+                    nodes[i + 1],
+                    local_sym_tab,
+                ),
+                is_speculatable(nodes[i + 1], local_sym_tab),
+            )
+            for i, op in enumerate(cond.ops)
+        ]
+        return short_circuit(func, builder, parts, True)
+    else:
+        # Any other int expression is true when nonzero
+        val = eval_expr(
+            func, module, builder, cond, local_sym_tab, map_sym_tab, structs_sym_tab
+        )
+        if val is None:
+            logger.info("Unsupported condition expression")
             return None
-        rhs = eval_expr(
-            func, module, builder, cond.comparators[0], local_sym_tab, map_sym_tab
-        )[0]
-        op = cond.ops[0]
-
-        if lhs.type != rhs.type:
-            if isinstance(lhs.type, ir.IntType) and isinstance(rhs.type, ir.IntType):
-                # Extend the smaller type to the larger type
-                if lhs.type.width < rhs.type.width:
-                    lhs = builder.sext(lhs, rhs.type)
-                elif lhs.type.width > rhs.type.width:
-                    rhs = builder.sext(rhs, lhs.type)
-            else:
-                logger.info("Type mismatch in comparison")
+        return truth_value(builder, val[0])
+
+
+def truth_value(builder, val):
+    """Convert nonzero values (or non-null pointers) to true, zero to false."""
+    if val.type == ir.IntType(1):
+        return val
+    if isinstance(val.type, ir.PointerType):
+        zero = ir.Constant(val.type, None)
+    else:
+        zero = ir.Constant(val.type, 0)
+    return builder.icmp_signed("!=", val, zero)
+
+
+def short_circuit(func, builder, parts, is_and):
+    """
+    Combine [(emit, speculatable)] conditions with and/or.
+
+    emit() lowers one operand at the builder's position. Speculatable
+    operands are evaluated unconditionally and joined with a select; the
+    others get their own block, skipped once the result is known.
+    """
+    emit, _ = parts[0]
+    result = emit()
+    for emit, speculatable in parts[1:]:
+        if result is None:
+            return None
+        if speculatable:
+            val = emit()
+            if val is None:
                 return None
+            known = ir.Constant(ir.IntType(1), int(not is_and))
+            if is_and:
+                result = builder.select(result, val, known)
+            else:
+                result = builder.select(result, known, val)
+            continue
 
-        if isinstance(op, ast.Eq):
-            return builder.icmp_signed("==", lhs, rhs)
-        elif isinstance(op, ast.NotEq):
-            return builder.icmp_signed("!=", lhs, rhs)
-        elif isinstance(op, ast.Lt):
-            return builder.icmp_signed("<", lhs, rhs)
-        elif isinstance(op, ast.LtE):
-            return builder.icmp_signed("<=", lhs, rhs)
-        elif isinstance(op, ast.Gt):
-            return builder.icmp_signed(">", lhs, rhs)
-        elif isinstance(op, ast.GtE):
-            return builder.icmp_signed(">=", lhs, rhs)
+        rhs_block = func.append_basic_block(name="and.rhs" if is_and else "or.rhs")
+        end_block = func.append_basic_block(name="and.end" if is_and else "or.end")
+        lhs_end = builder.block
+        if is_and:
+            builder.cbranch(result, rhs_block, end_block)
         else:
-            logger.info("Unsupported comparison operator")
+            builder.cbranch(result, end_block, rhs_block)
+        builder.position_at_end(rhs_block)
+        val = emit()
+        if val is None:
             return None
+        rhs_end = builder.block
+        builder.branch(end_block)
+        builder.position_at_end(end_block)
+        result = builder.phi(ir.IntType(1))
+        result.add_incoming(ir.Constant(ir.IntType(1), int(not is_and)), lhs_end)
+        result.add_incoming(val, rhs_end)
+    return result
+
+
+def emit_compare(builder, op, lhs, rhs, left, right, local_sym_tab):
+    """Compare two evaluated operands; left and right are their AST nodes."""
+    # Compare in the unified type of both sides, unsigned if either is
+    left_ctype = expr_ctype(left, local_ctypes(local_sym_tab))
+    right_ctype = expr_ctype(right, local_ctypes(local_sym_tab))
+    ctype = unify_ctypes(left_ctype, right_ctype)
+    # Literals take the other side's type instead of widening it
+    lhs = narrow_literal(left, lhs, rhs.type)
+    rhs = narrow_literal(right, rhs, lhs.type)
+    if lhs.type != rhs.type:
+        if isinstance(lhs.type, ir.IntType) and isinstance(rhs.type, ir.IntType):
+            # Extend the smaller type to the larger type
+            if lhs.type.width < rhs.type.width:
+                lhs = extend_operand(builder, lhs, rhs.type, is_signed(left_ctype))
+            elif lhs.type.width > rhs.type.width:
+                rhs = extend_operand(builder, rhs, lhs.type, is_signed(right_ctype))
+        else:
+            logger.info("Type mismatch in comparison")
+            return None
+    icmp = builder.icmp_signed if is_signed(ctype) else builder.icmp_unsigned
+
+    if isinstance(op, ast.Eq):
+        return icmp("==", lhs, rhs)
+    elif isinstance(op, ast.NotEq):
+        return icmp("!=", lhs, rhs)
+    elif isinstance(op, ast.Lt):
+        return icmp("<", lhs, rhs)
+    elif isinstance(op, ast.LtE):
+        return icmp("<=", lhs, rhs)
+    elif isinstance(op, ast.Gt):
+        return icmp(">", lhs, rhs)
+    elif isinstance(op, ast.GtE):
+        return icmp(">=", lhs, rhs)
     else:
-        logger.info("Unsupported condition expression")
+        logger.info("Unsupported comparison operator")
         return None
 
 
+def narrow_literal(node, val, ir_type):
+    """Rebuild an int literal operand as ir_type when the value fits."""
+    if (
+        isinstance(node, ast.Constant)
+        and type(node.value) is int
+        and isinstance(ir_type, ir.IntType)
+        and fits_width(node.value, ir_type.width)
+    ):
+        return ir.Constant(ir_type, node.value)
+    return val
+
+
 def handle_if(
-    func, module, builder, stmt, map_sym_tab, local_sym_tab, structs_sym_tab=None
+    func,
+    module,
+    builder,
+    stmt,
+    map_sym_tab,
+    local_sym_tab,
+    structs_sym_tab=None,
+    ret_type=ir.IntType(64),
 ):
     """Handle if statements in the function body."""
     logger.info("Handling if statement")
@@ -317,21 +685,37 @@ def handle_if(
     else:
         else_block = None
 
-    cond = handle_cond(func, module, builder, stmt.test, local_sym_tab, map_sym_tab)
+    cond = handle_cond(
+        func, module, builder, stmt.test, local_sym_tab, map_sym_tab, structs_sym_tab
+    )
+    # (block, register values) for every edge that reaches merge_block
+    incoming = []
     if else_block:
         builder.cbranch(cond, then_block, else_block)
     else:
+        incoming.append((builder.block, register_values(local_sym_tab)))
         builder.cbranch(cond, then_block, merge_block)
+    entry_values = register_values(local_sym_tab)
 
     builder.position_at_end(then_block)
     for s in stmt.body:
         process_stmt(
-            func, module, builder, s, local_sym_tab, map_sym_tab, structs_sym_tab, False
+            func,
+            module,
+            builder,
+            s,
+            local_sym_tab,
+            map_sym_tab,
+            structs_sym_tab,
+            False,
+            ret_type,
         )
     if not builder.block.is_terminated:
+        incoming.append((builder.block, register_values(local_sym_tab)))
         builder.branch(merge_block)
 
     if else_block:
+        restore_register_values(local_sym_tab, entry_values)
         builder.position_at_end(else_block)
         for s in stmt.orelse:
             process_stmt(
@@ -343,11 +727,133 @@ def handle_if(
                 map_sym_tab,
                 structs_sym_tab,
                 False,
+                ret_type,
             )
         if not builder.block.is_terminated:
+            incoming.append((builder.block, register_values(local_sym_tab)))
             builder.branch(merge_block)
 
     builder.position_at_end(merge_block)
+    merge_register_values(builder, local_sym_tab, incoming)
+
+
+def handle_loop(
+    func,
+    module,
+    builder,
+    stmt,
+    map_sym_tab,
+    local_sym_tab,
+    structs_sym_tab=None,
+    ret_type=ir.IntType(64),
+):
+    """
+    Emit a bounded loop for a for/while statement the constants pass kept.
+
+    for loops run over a constant range() with their own counter; while
+    loops re-evaluate their test. Register locals get a phi in the loop
+    header joining their entry value with the value at the end of the body.
+    """
+    is_for = isinstance(stmt, ast.For)
+    kind = "for" if is_for else "while"
+    logger.info(f"Handling {kind} loop")
+    header_block = func.append_basic_block(name=f"{kind}.cond")
+    body_block = func.append_basic_block(name=f"{kind}.body")
+    exit_block = func.append_basic_block(name=f"{kind}.end")
+
+    preheader = builder.block
+    builder.branch(header_block)
+    builder.position_at_end(header_block)
+
+    # Only locals the loop assigns need a phi, the others keep their value
+    assigned = {
+        node.id
+        for node in ast.walk(stmt)
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)
+    }
+    phis = {}
+    for name, value in register_values(local_sym_tab).items():
+        if name not in assigned:
+            continue
+        phi = builder.phi(local_sym_tab[name].ir_type, name=name)
+        phi.add_incoming(value, preheader)
+        local_sym_tab[name].value = phi
+        phis[name] = phi
+
+    if is_for:
+        start, stop, step = range_bounds(stmt.iter)
+        i64 = ir.IntType(64)
+        counter = builder.phi(i64, name=f"{stmt.target.id}.next")
+        counter.add_incoming(ir.Constant(i64, start), preheader)
+        cond = builder.icmp_signed(
+            "<" if step > 0 else ">", counter, ir.Constant(i64, stop)
+        )
+    else:
+        cond = handle_cond(
+            func,
+            module,
+            builder,
+            stmt.test,
+            local_sym_tab,
+            map_sym_tab,
+            structs_sym_tab,
+        )
+    builder.cbranch(cond, body_block, exit_block)
+    exit_values = register_values(local_sym_tab)
+
+    builder.position_at_end(body_block)
+    if is_for:
+        local_sym_tab[stmt.target.id].store(builder, counter)
+    for s in stmt.body:
+        process_stmt(
+            func,
+            module,
+            builder,
+            s,
+            local_sym_tab,
+            map_sym_tab,
+            structs_sym_tab,
+            False,
+            ret_type,
+        )
+    if not builder.block.is_terminated:
+        latch = builder.block
+        if is_for:
+            counter.add_incoming(builder.add(counter, ir.Constant(i64, step)), latch)
+            counter._clear_string_cache()
+        for name, phi in phis.items():
+            phi.add_incoming(local_sym_tab[name].value, latch)
+            # The body may already have logged the phi, drop llvmlite's cached text
+            phi._clear_string_cache()
+        builder.branch(header_block)
+
+    builder.position_at_end(exit_block)
+    restore_register_values(local_sym_tab, exit_values)
+
+
+def register_values(local_sym_tab):
+    """Snapshot the values currently bound to the register locals."""
+    return {name: sym.value for name, sym in local_sym_tab.items() if sym.in_register}
+
+
+def restore_register_values(local_sym_tab, values):
+    for name, value in values.items():
+        local_sym_tab[name].value = value
+
+
+def merge_register_values(builder, local_sym_tab, incoming):
+    """Bind each register local at a join, inserting a phi where edges disagree."""
+    if not incoming:
+        # Every branch returned, the join block is unreachable
+        return
+    for name, value in incoming[0][1].items():
+        if all(values[name] is value for _, values in incoming[1:]):
+            local_sym_tab[name].value = value
+            continue
+        phi = builder.phi(local_sym_tab[name].ir_type, name=name)
+        for block, values in incoming:
+            phi.add_incoming(values[name], block)
+        local_sym_tab[name].value = phi
 
 
 def process_stmt(
@@ -377,10 +883,30 @@ def process_stmt(
             func, module, builder, stmt, map_sym_tab, local_sym_tab, structs_sym_tab
         )
     elif isinstance(stmt, ast.AugAssign):
-        raise SyntaxError("Augmented assignment not supported")
+        handle_aug_assign(
+            func, module, builder, stmt, map_sym_tab, local_sym_tab, structs_sym_tab
+        )
     elif isinstance(stmt, ast.If):
         handle_if(
-            func, module, builder, stmt, map_sym_tab, local_sym_tab, structs_sym_tab
+            func,
+            module,
+            builder,
+            stmt,
+            map_sym_tab,
+            local_sym_tab,
+            structs_sym_tab,
+            ret_type,
+        )
+    elif isinstance(stmt, (ast.For, ast.While)):
+        handle_loop(
+            func,
+            module,
+            builder,
+            stmt,
+            map_sym_tab,
+            local_sym_tab,
+            structs_sym_tab,
+            ret_type,
         )
     elif isinstance(stmt, ast.Return):
         if stmt.value is None:
@@ -402,48 +928,83 @@ def process_stmt(
             else:
                 builder.ret(ir.Constant(ret_type, stmt.value.args[0].value))
                 did_return = True
-        elif isinstance(stmt.value, ast.Name):
-            if stmt.value.id == "XDP_PASS":
-                builder.ret(ir.Constant(ret_type, 2))
-                did_return = True
-            elif stmt.value.id == "XDP_DROP":
-                builder.ret(ir.Constant(ret_type, 1))
-                did_return = True
-            else:
-                raise ValueError("Failed to evaluate return expression")
+        elif isinstance(stmt.value, ast.Name) and stmt.value.id == "XDP_PASS":
+            builder.ret(ir.Constant(ret_type, 2))
+            did_return = True
+        elif isinstance(stmt.value, ast.Name) and stmt.value.id == "XDP_DROP":
+            builder.ret(ir.Constant(ret_type, 1))
+            did_return = True
         else:
-            raise ValueError("Unsupported return value")
+            val = eval_expr(
+                func,
+                module,
+                builder,
+                stmt.value,
+                local_sym_tab,
+                map_sym_tab,
+                structs_sym_tab,
+            )
+            if val is None:
+                raise ValueError("Failed to evaluate return expression")
+            signed = expr_signed(stmt.value, module, local_sym_tab, structs_sym_tab)
+            builder.ret(coerce_value(builder, val[0], ret_type, signed))
+            did_return = True
     return did_return
 
 
 def allocate_mem(
-    module, builder, body, func, ret_type, map_sym_tab, local_sym_tab, structs_sym_tab
+    module,
+    builder,
+    body,
+    func,
+    ret_type,
+    map_sym_tab,
+    local_sym_tab,
+    structs_sym_tab,
+    frame,
+    spilled=None,
+    types=None,
 ):
+    """
+    Declare the locals assigned in body.
+
+    Names in spilled, and struct instances, get a slot in frame; the rest are
+    kept in registers. spilled=None gives every local a slot (-O0). types
+    holds the ctypes infer_local_types found for the int locals.
+    """
+    types = types or {}
     for stmt in body:
         has_metadata = False
-        if isinstance(stmt, ast.If):
-            if stmt.body:
-                local_sym_tab = allocate_mem(
-                    module,
-                    builder,
-                    stmt.body,
-                    func,
-                    ret_type,
-                    map_sym_tab,
-                    local_sym_tab,
-                    structs_sym_tab,
-                )
-            if stmt.orelse:
-                local_sym_tab = allocate_mem(
-                    module,
+        align = None
+        ctype = None
+        if isinstance(stmt, (ast.If, ast.For, ast.While)):
+            if isinstance(stmt, ast.For) and isinstance(stmt.target, ast.Name):
+                # range() counters are c_int64
+                declare_local(
                     builder,
-                    stmt.orelse,
-                    func,
-                    ret_type,
-                    map_sym_tab,
                     local_sym_tab,
-                    structs_sym_tab,
+                    frame,
+                    spilled,
+                    stmt.target.id,
+                    ir.IntType(64),
+                    8,
+                    ctype=DEFAULT_CTYPE,
                 )
+            for nested in (stmt.body, stmt.orelse):
+                if nested:
+                    local_sym_tab = allocate_mem(
+                        module,
+                        builder,
+                        nested,
+                        func,
+                        ret_type,
+                        map_sym_tab,
+                        local_sym_tab,
+                        structs_sym_tab,
+                        frame,
+                        spilled,
+                        types,
+                    )
         elif isinstance(stmt, ast.Assign):
             if len(stmt.targets) != 1:
                 logger.info("Unsupported multiassignment")
@@ -454,40 +1015,53 @@ def allocate_mem(
                 continue
             var_name = target.id
             rval = stmt.value
+            # Int locals take the type inferred from all their assignments
+            ctype = types.get(var_name)
             if isinstance(rval, ast.Call):
                 if isinstance(rval.func, ast.Name):
                     call_type = rval.func.id
-                    if call_type in ("c_int32", "c_int64", "c_uint32", "c_uint64"):
-                        ir_type = ctypes_to_ir(call_type)
-                        var = builder.alloca(ir_type, name=var_name)
-                        var.align = ir_type.width // 8
+                    if is_int_ctype(call_type):
+                        ctype = ctype or call_type
+                        ir_type = ctypes_to_ir(ctype)
+                        align = ir_type.width // 8
                         logger.info(
-                            f"Pre-allocated variable {var_name} of type {call_type}"
+                            f"Pre-allocated variable {var_name} of type {ctype}"
                         )
                     elif HelperHandlerRegistry.has_handler(call_type):
-                        # Assume return type is int64 for now
-                        ir_type = ir.IntType(64)
-                        var = builder.alloca(ir_type, name=var_name)
-                        var.align = ir_type.width // 8
+                        ctype = ctype or DEFAULT_CTYPE
+                        ir_type = ctypes_to_ir(ctype)
+                        align = ir_type.width // 8
                         logger.info(f"Pre-allocated variable {var_name} for helper")
                     elif call_type == "deref" and len(rval.args) == 1:
-                        # Assume return type is int64 for now
-                        ir_type = ir.IntType(64)
-                        var = builder.alloca(ir_type, name=var_name)
-                        var.align = ir_type.width // 8
+                        ctype = ctype or DEFAULT_CTYPE
+                        ir_type = ctypes_to_ir(ctype)
+                        align = ir_type.width // 8
                         logger.info(f"Pre-allocated variable {var_name} for deref")
                     elif call_type in structs_sym_tab:
                         struct_info = structs_sym_tab[call_type]
                         ir_type = struct_info.ir_type
-                        var = builder.alloca(ir_type, name=var_name)
                         has_metadata = True
                         logger.info(
                             f"Pre-allocated variable {var_name} for struct {call_type}"
                         )
+                    elif isinstance(module.globals.get(call_type), ir.Function):
+                        ir_type = module.globals[call_type].function_type.return_type
+                        if ctype is not None:
+                            ir_type = ctypes_to_ir(ctype)
+                        align = ir_type.width // 8
+                        logger.info(
+                            f"Pre-allocated variable {var_name} for {call_type}()"
+                        )
+                    else:
+                        logger.info(f"Unsupported assignment call type: {call_type}")
+                        continue
                 elif isinstance(rval.func, ast.Attribute):
-                    ir_type = ir.PointerType(ir.IntType(64))
-                    var = builder.alloca(ir_type, name=var_name)
-                    # var.align = ir_type.width // 8
+                    value_type = None
+                    map_name = map_name_of(rval.func.value)
+                    if rval.func.attr == "lookup" and map_name in map_sym_tab:
+                        value_type = map_value_type(map_sym_tab[map_name])
+                    # Points at the map value, typed when it is an int
+                    ir_type = ir.PointerType(value_type or ir.IntType(64))
                     logger.info(f"Pre-allocated variable {var_name} for map")
                 else:
                     logger.info("Unsupported assignment call function type")
@@ -495,42 +1069,87 @@ def allocate_mem(
             elif isinstance(rval, ast.Constant):
                 if isinstance(rval.value, bool):
                     ir_type = ir.IntType(1)
-                    var = builder.alloca(ir_type, name=var_name)
-                    var.align = 1
+                    align = 1
                     logger.info(f"Pre-allocated variable {var_name} of type c_bool")
                 elif isinstance(rval.value, int):
-                    # Assume c_int64 for now
-                    ir_type = ir.IntType(64)
-                    var = builder.alloca(ir_type, name=var_name)
-                    var.align = ir_type.width // 8
-                    logger.info(f"Pre-allocated variable {var_name} of type c_int64")
+                    ctype = ctype or DEFAULT_CTYPE
+                    ir_type = ctypes_to_ir(ctype)
+                    align = ir_type.width // 8
+                    logger.info(f"Pre-allocated variable {var_name} of type {ctype}")
                 elif isinstance(rval.value, str):
                     ir_type = ir.PointerType(ir.IntType(8))
-                    var = builder.alloca(ir_type, name=var_name)
-                    var.align = 8
+                    align = 8
                     logger.info(f"Pre-allocated variable {var_name} of type string")
                 else:
                     logger.info("Unsupported constant type")
                     continue
-            elif isinstance(rval, ast.BinOp):
-                # Assume c_int64 for now
-                ir_type = ir.IntType(64)
-                var = builder.alloca(ir_type, name=var_name)
-                var.align = ir_type.width // 8
-                logger.info(f"Pre-allocated variable {var_name} of type c_int64")
+            elif isinstance(rval, (ast.BinOp, ast.IfExp)):
+                ctype = ctype or DEFAULT_CTYPE
+                ir_type = ctypes_to_ir(ctype)
+                align = ir_type.width // 8
+                logger.info(f"Pre-allocated variable {var_name} of type {ctype}")
+            elif isinstance(rval, ast.Name):
+                # A copy of an int local, or of a pointer such as a lookup()
+                source = local_sym_tab.get(rval.id)
+                if ctype is not None:
+                    ir_type = ctypes_to_ir(ctype)
+                    align = ir_type.width // 8
+                elif source is not None and source.metadata is None:
+                    ir_type = source.ir_type
+                else:
+                    logger.info(f"Unsupported copy of {rval.id} to {var_name}")
+                    continue
+                logger.info(f"Pre-allocated variable {var_name} as a copy")
             else:
                 logger.info("Unsupported assignment value type")
                 continue
 
-            if has_metadata:
-                local_sym_tab[var_name] = LocalSymbol(var, ir_type, call_type)
-            else:
-                local_sym_tab[var_name] = LocalSymbol(var, ir_type)
+            declare_local(
+                builder,
+                local_sym_tab,
+                frame,
+                spilled,
+                var_name,
+                ir_type,
+                align,
+                call_type if has_metadata else None,
+                ctype if is_int_ctype(ctype) else None,
+            )
     return local_sym_tab
 
 
+def declare_local(
+    builder,
+    local_sym_tab,
+    frame,
+    spilled,
+    var_name,
+    ir_type,
+    align,
+    metadata=None,
+    ctype=None,
+):
+    """Add var_name to local_sym_tab, in a stack slot or in a register."""
+    if metadata is not None or spilled is None or var_name in spilled:
+        var = frame.alloca(builder, var_name, ir_type, align)
+        local_sym_tab[var_name] = LocalSymbol(var, ir_type, metadata, ctype=ctype)
+    else:
+        # Reads before the first assignment see undef, as with a fresh slot
+        local_sym_tab[var_name] = LocalSymbol(
+            None, ir_type, value=ir.Constant(ir_type, ir.Undefined), ctype=ctype
+        )
+
+
 def process_func_body(
-    module, builder, func_node, func, ret_type, map_sym_tab, structs_sym_tab
+    module,
+    builder,
+    func_node,
+    func,
+    ret_type,
+    map_sym_tab,
+    structs_sym_tab,
+    opt_level=2,
+    params=(),
 ):
     """Process the body of a bpf function"""
     # TODO: A lot.  We just have print -> bpf_trace_printk for now
@@ -538,6 +1157,20 @@ def process_func_body(
 
     local_sym_tab = {}
 
+    # Debug builds give every local a stack slot; otherwise only locals whose
+    # address is taken are spilled and the rest are built directly in SSA form.
+    spilled = None if opt_level == 0 else find_address_taken(func_node.body)
+    frame = StackFrame(func.name, func_node.body, [param[0] for param in params])
+    frame.move_to_scratch(builder, module, struct_locals(func_node, structs_sym_tab))
+    slot_types = map_slot_types(func_node.body, map_sym_tab)
+    types = infer_local_types(
+        func_node.body,
+        {**entry_ctypes(func_node, params, structs_sym_tab), **slot_types},
+        function_ctypes(module),
+    )
+    # Map keys and values keep the map's type even if assigned wider values
+    types.update(slot_types)
+
     # pre-allocate dynamic variables
     local_sym_tab = allocate_mem(
         module,
@@ -548,6 +1181,20 @@ def process_func_body(
         map_sym_tab,
         local_sym_tab,
         structs_sym_tab,
+        frame,
+        spilled,
+        types,
+    )
+
+    bind_params(
+        builder,
+        func,
+        params,
+        local_sym_tab,
+        structs_sym_tab,
+        frame,
+        find_address_taken(func_node.body),
+        slot_types,
     )
 
     logger.info(f"Local symbol table: {local_sym_tab.keys()}")
@@ -568,127 +1215,273 @@ def process_func_body(
     if not did_return:
         builder.ret(ir.Constant(ir.IntType(32), 0))
 
+    frame.check(func)
 
-def process_bpf_chunk(func_node, module, return_type, map_sym_tab, structs_sym_tab):
-    """Process a single BPF chunk (function) and emit corresponding LLVM IR."""
 
-    func_name = func_node.name
+def entry_ctypes(func_node, params, structs_sym_tab):
+    """
+    Return the ctypes known when the body of func_node starts.
+
+    These are its int parameters and the fields of its struct parameters
+    and struct locals, keyed "var.field" as expr_ctype expects.
+    """
+    env = {name: ctype for name, _, _, ctype in params if ctype is not None}
+    structs = {name: struct_name for name, _, struct_name, _ in params}
+    for node in ast.walk(func_node):
+        if (
+            isinstance(node, ast.Assign)
+            and len(node.targets) == 1
+            and isinstance(node.targets[0], ast.Name)
+            and isinstance(node.value, ast.Call)
+            and isinstance(node.value.func, ast.Name)
+        ):
+            structs[node.targets[0].id] = node.value.func.id
+    for name, struct_name in structs.items():
+        if struct_name in structs_sym_tab:
+            for field, ctype in structs_sym_tab[struct_name].ctypes.items():
+                env[f"{name}.{field}"] = ctype
+    return env
+
+
+def struct_locals(func_node, structs_sym_tab):
+    """Return {name: IR type} for the locals assigned a struct instance."""
+    return {
+        node.targets[0].id: structs_sym_tab[node.value.func.id].ir_type
+        for node in ast.walk(func_node)
+        if isinstance(node, ast.Assign)
+        and len(node.targets) == 1
+        and isinstance(node.targets[0], ast.Name)
+        and isinstance(node.value, ast.Call)
+        and isinstance(node.value.func, ast.Name)
+        and node.value.func.id in structs_sym_tab
+    }
+
+
+def bind_params(
+    builder,
+    func,
+    params,
+    local_sym_tab,
+    structs_sym_tab,
+    frame,
+    address_taken,
+    slot_types=None,
+):
+    """
+    Make the arguments of func available as locals of its body.
+
+    slot_types gives the ctype of the parameters passed to map helpers,
+    whose slots must match the map's key or value.
+    """
+    slot_types = slot_types or {}
+    for arg, (name, ir_type, struct_name, ctype) in zip(func.args, params):
+        if struct_name is not None:
+            # Structs arrive by pointer and are used in place
+            local_sym_tab[name] = LocalSymbol(
+                arg, structs_sym_tab[struct_name].ir_type, struct_name
+            )
+        elif name in local_sym_tab:
+            # Reassigned in the body, so allocate_mem already declared it
+            local_sym_tab[name].store(builder, arg, is_signed(ctype))
+        elif name in address_taken:
+            slot_ctype = slot_types.get(name, ctype)
+            slot_type = ctypes_to_ir(slot_ctype) if slot_ctype else ir_type
+            var = frame.alloca(builder, name, slot_type, type_align(slot_type))
+            local_sym_tab[name] = LocalSymbol(var, slot_type, ctype=slot_ctype)
+            local_sym_tab[name].store(builder, arg, is_signed(ctype))
+        else:
+            local_sym_tab[name] = LocalSymbol(None, ir_type, value=arg, ctype=ctype)
 
-    ret_type = return_type
 
-    # TODO: parse parameters
-    param_types = []
-    if func_node.args.args:
+def func_params(func_node, structs_sym_tab, is_program):
+    """
+    Return [(name, ir_type, struct_name, ctype)] for the parameters of a function.
+
+    Programs only take their ctx pointer. Helper functions take up to five
+    arguments, like any BPF subprogram: c_void_p is an opaque pointer (ctx
+    or a map value), a @struct is passed by pointer and every other
+    annotation names a ctypes integer. Unannotated parameters are c_int64.
+    """
+    args = func_node.args.args
+    if is_program:
         # Assume first arg to be ctx
-        param_types.append(ir.PointerType())
+        return [(args[0].arg, ir.PointerType(), None, None)] if args else []
 
-    func_ty = ir.FunctionType(ret_type, param_types)
-    func = ir.Function(module, func_ty, func_name)
+    if len(args) > MAX_SUBPROGRAM_ARGS:
+        raise SyntaxError(
+            f"Function '{func_node.name}' takes {len(args)} arguments, BPF "
+            f"subprograms take at most {MAX_SUBPROGRAM_ARGS}"
+        )
+    params = []
+    for arg in args:
+        annotation = arg.annotation.id if isinstance(arg.annotation, ast.Name) else None
+        if annotation is None:
+            params.append((arg.arg, ir.IntType(64), None, DEFAULT_CTYPE))
+        elif annotation == "c_void_p":
+            params.append((arg.arg, ir.PointerType(), None, None))
+        elif annotation in structs_sym_tab:
+            struct_type = structs_sym_tab[annotation].ir_type
+            params.append((arg.arg, ir.PointerType(struct_type), annotation, None))
+        else:
+            params.append((arg.arg, ctypes_to_ir(annotation), None, annotation))
+    return params
+
+
+def declare_bpf_function(
+    func_node,
+    module,
+    return_type,
+    structs_sym_tab,
+    opt_level=2,
+    section=None,
+    inline=False,
+):
+    """
+    Add the ir.Function of a @bpf chunk to module, without its body.
+
+    Functions with a section are programs. The others are helper functions
+    that other @bpf functions call: a static subprogram in .text reached
+    with a BPF-to-BPF call, or with @inline a body copied into each caller.
+    """
+    params = func_params(func_node, structs_sym_tab, is_program=section is not None)
+    func_ty = ir.FunctionType(return_type, [ir_type for _, ir_type, _, _ in params])
+    func = ir.Function(module, func_ty, func_node.name)
+
+    if section is not None:
+        func.linkage = "dso_local"
+        func.section = section
+    elif inline:
+        # Dropped by the inliner once every call has been replaced
+        func.linkage = "linkonce_odr"
+    else:
+        func.linkage = "internal"
 
-    func.linkage = "dso_local"
     func.attributes.add("nounwind")
-    func.attributes.add("noinline")
-    func.attributes.add("optnone")
+    if opt_level == 0:
+        # Debug builds keep every alloca/load/store exactly as emitted
+        func.attributes.add("noinline")
+        func.attributes.add("optnone")
+    elif section is None:
+        func.attributes.add("alwaysinline" if inline else "noinline")
+
+    for arg, (name, _, _, _) in zip(func.args, params):
+        arg.name = name
+    if section is not None and func.args:
+        func.args[0].add_attribute("nocapture")
 
-    if func_node.args.args:
-        # Only look at the first argument for now
-        param = func.args[0]
-        param.add_attribute("nocapture")
+    return func
 
-    probe_string = get_probe_string(func_node)
-    if probe_string is not None:
-        func.section = probe_string
+
+def process_bpf_chunk(
+    func_node,
+    module,
+    return_type,
+    map_sym_tab,
+    structs_sym_tab,
+    opt_level=2,
+    section=None,
+    inline=False,
+):
+    """Process a single BPF chunk (function) and emit corresponding LLVM IR."""
+    func = module.globals.get(func_node.name)
+    if func is None:
+        func = declare_bpf_function(
+            func_node, module, return_type, structs_sym_tab, opt_level, section, inline
+        )
 
     block = func.append_basic_block(name="entry")
     builder = ir.IRBuilder(block)
 
     process_func_body(
-        module, builder, func_node, func, ret_type, map_sym_tab, structs_sym_tab
+        module,
+        builder,
+        func_node,
+        func,
+        return_type,
+        map_sym_tab,
+        structs_sym_tab,
+        opt_level,
+        func_params(func_node, structs_sym_tab, is_program=section is not None),
     )
     return func
 
 
-def func_proc(tree, module, chunks, map_sym_tab, structs_sym_tab):
-    for func_node in chunks:
-        is_global = False
-        for decorator in func_node.decorator_list:
-            if isinstance(decorator, ast.Name) and decorator.id in (
-                "map",
-                "bpfglobal",
-                "struct",
-            ):
-                is_global = True
-                break
-        if is_global:
-            continue
-        func_type = get_probe_string(func_node)
-        logger.info(f"Found probe_string of {func_node.name}: {func_type}")
+def func_proc(
+    tree, module, symbols, map_sym_tab, structs_sym_tab, opt_level=2, profile=None
+):
+    # Declare every function first so calls can precede the callee's definition
+    for symbol in symbols.functions():
+        declare_func_symbol(symbol, module, structs_sym_tab, opt_level)
+    init_prog_array_slots(
+        module,
+        map_sym_tab,
+        {symbol.name for symbol in symbols.of_kind(SymbolKind.PROGRAM)},
+    )
 
-        process_bpf_chunk(
-            func_node,
-            module,
-            ctypes_to_ir(infer_return_type(func_node)),
-            map_sym_tab,
-            structs_sym_tab,
+    for symbol in symbols.functions():
+        start = time.perf_counter()
+        func = process_func_symbol(
+            symbol, module, map_sym_tab, structs_sym_tab, opt_level, symbols.constants
         )
+        if profile is not None:
+            profile.record_function(func, time.perf_counter() - start)
 
 
-def infer_return_type(func_node: ast.FunctionDef):
-    if not isinstance(func_node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-        raise TypeError("Expected ast.FunctionDef")
-    if func_node.returns is not None:
-        try:
-            return ast.unparse(func_node.returns)
-        except Exception:
-            node = func_node.returns
-            if isinstance(node, ast.Name):
-                return node.id
-            if isinstance(node, ast.Attribute):
-                return getattr(node, "attr", type(node).__name__)
-            try:
-                return str(node)
-            except Exception:
-                return type(node).__name__
-    found_type = None
-
-    def _expr_type(e):
-        if e is None:
-            return "None"
-        if isinstance(e, ast.Constant):
-            return type(e.value).__name__
-        if isinstance(e, ast.Name):
-            return e.id
-        if isinstance(e, ast.Call):
-            f = e.func
-            if isinstance(f, ast.Name):
-                return f.id
-            if isinstance(f, ast.Attribute):
-                try:
-                    return ast.unparse(f)
-                except Exception:
-                    return getattr(f, "attr", type(f).__name__)
-            try:
-                return ast.unparse(f)
-            except Exception:
-                return type(f).__name__
-        if isinstance(e, ast.Attribute):
-            try:
-                return ast.unparse(e)
-            except Exception:
-                return getattr(e, "attr", type(e).__name__)
-        try:
-            return ast.unparse(e)
-        except Exception:
-            return type(e).__name__
-
-    for walked_node in ast.walk(func_node):
-        if isinstance(walked_node, ast.Return):
-            t = _expr_type(walked_node.value)
-            if found_type is None:
-                found_type = t
-            elif found_type != t:
-                raise ValueError(f"Conflicting return types: {found_type} vs {t}")
-    return found_type or "None"
+def symbol_function_type(symbol, structs_sym_tab):
+    """The ir.FunctionType of a PROGRAM or HELPER symbol."""
+    params = func_params(
+        symbol.node, structs_sym_tab, is_program=symbol.kind is SymbolKind.PROGRAM
+    )
+    return ir.FunctionType(
+        ctypes_to_ir(symbol.return_type), [ir_type for _, ir_type, _, _ in params]
+    )
+
+
+def declare_func_symbol(symbol, module, structs_sym_tab, opt_level=2):
+    """Declare one PROGRAM or HELPER symbol in module."""
+    func = declare_bpf_function(
+        symbol.node,
+        module,
+        ctypes_to_ir(symbol.return_type),
+        structs_sym_tab,
+        opt_level,
+        symbol.section,
+        symbol.inline,
+    )
+    # Callers widen the result by its signedness
+    declare_return_ctype(module, func, symbol.return_type)
+    return func
+
+
+def declare_callee(symbol, module, structs_sym_tab):
+    """Declare a PROGRAM or HELPER defined in another unit of module."""
+    func = ir.Function(
+        module, symbol_function_type(symbol, structs_sym_tab), name=symbol.name
+    )
+    declare_return_ctype(module, func, symbol.return_type)
+    return func
+
+
+def process_func_symbol(
+    symbol, module, map_sym_tab, structs_sym_tab, opt_level=2, constants=None
+):
+    """Emit one PROGRAM or HELPER symbol into module."""
+    kind = symbol.section if symbol.kind is SymbolKind.PROGRAM else "subprogram"
+    logger.info(f"Found probe_string of {symbol.name}: {kind}")
+
+    func_node = eliminate_redundant_lookups(
+        fold_constants(symbol.node, constants), map_sym_tab
+    )
+    return process_bpf_chunk(
+        func_node,
+        module,
+        ctypes_to_ir(symbol.return_type),
+        map_sym_tab,
+        structs_sym_tab,
+        opt_level,
+        symbol.section,
+        symbol.inline,
+    )
 
 
 # For string assignment to fixed-size arrays
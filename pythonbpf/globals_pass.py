@@ -1,5 +1,5 @@
 from llvmlite import ir
-import ast
+from .symbol_index import SymbolKind
 
 
 def emit_globals(module: ir.Module, names: list[str]):
@@ -24,26 +24,12 @@ def emit_globals(module: ir.Module, names: list[str]):
     gv.section = "llvm.metadata"
 
 
-def globals_processing(tree, module: ir.Module):
+def globals_processing(tree, module: ir.Module, symbols):
     collected = ["LICENSE"]
 
-    for node in tree.body:
-        if isinstance(node, ast.FunctionDef):
-            for dec in node.decorator_list:
-                if (
-                    isinstance(dec, ast.Call)
-                    and isinstance(dec.func, ast.Name)
-                    and dec.func.id == "section"
-                    and len(dec.args) == 1
-                    and isinstance(dec.args[0], ast.Constant)
-                    and isinstance(dec.args[0].value, str)
-                ):
-                    collected.append(node.name)
-
-                elif isinstance(dec, ast.Name) and dec.id == "bpfglobal":
-                    collected.append(node.name)
-
-                elif isinstance(dec, ast.Name) and dec.id == "map":
-                    collected.append(node.name)
+    for symbol in symbols.of_kind(
+        SymbolKind.PROGRAM, SymbolKind.GLOBAL, SymbolKind.MAP
+    ):
+        collected.append(symbol.name)
 
     emit_globals(module, collected)
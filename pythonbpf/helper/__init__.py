@@ -1,13 +1,33 @@
-from .helper_utils import HelperHandlerRegistry
-from .bpf_helper_handler import handle_helper_call
-from .helpers import ktime, pid, deref, XDP_DROP, XDP_PASS
+from .helpers import ktime, pid, deref, tail_call, unroll, bounded, XDP_DROP, XDP_PASS
 
 __all__ = [
     "HelperHandlerRegistry",
     "handle_helper_call",
+    "emit_atomic_rmw",
+    "emit_map_atomic_update",
+    "emit_map_lookup",
     "ktime",
     "pid",
     "deref",
+    "tail_call",
+    "unroll",
+    "bounded",
     "XDP_DROP",
     "XDP_PASS",
 ]
+
+
+def __getattr__(name):
+    # Importing the handler module registers every helper emitter, so the
+    # registry is never handed out half-populated.
+    if name in (
+        "HelperHandlerRegistry",
+        "handle_helper_call",
+        "emit_atomic_rmw",
+        "emit_map_atomic_update",
+        "emit_map_lookup",
+    ):
+        from . import bpf_helper_handler
+
+        return getattr(bpf_helper_handler, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -9,6 +9,17 @@ from .helper_utils import (
     simple_string_print,
     get_data_ptr_and_size,
 )
+from ..binary_ops import get_operand_value
+from ..expr_pass import coerce_value
+from ..maps.flags import BPF_NOEXIST
+from ..maps.maps_pass import (
+    is_array_map,
+    is_percpu_map,
+    is_prog_array,
+    map_slot_ctype,
+)
+from ..stack_frame import entry_alloca
+from ..type_deducer import ctypes_to_ir
 from logging import Logger
 import logging
 
@@ -21,10 +32,21 @@ class BPFHelperID(Enum):
     BPF_MAP_DELETE_ELEM = 3
     BPF_KTIME_GET_NS = 5
     BPF_PRINTK = 6
+    BPF_TAIL_CALL = 12
     BPF_GET_CURRENT_PID_TGID = 14
     BPF_PERF_EVENT_OUTPUT = 25
 
 
+# In-place operators with an atomicrmw equivalent
+ATOMIC_OPS = {
+    ast.Add: "add",
+    ast.Sub: "sub",
+    ast.BitOr: "or",
+    ast.BitAnd: "and",
+    ast.BitXor: "xor",
+}
+
+
 @HelperHandlerRegistry.register("ktime")
 def bpf_ktime_get_ns_emitter(
     call,
@@ -47,6 +69,12 @@ def bpf_ktime_get_ns_emitter(
     return result, ir.IntType(64)
 
 
+def map_slot_width(map_ptr, member):
+    """The bit width of a map's int "key" or "value", 64 if it is not an int."""
+    ctype = map_slot_ctype(map_ptr, member)
+    return ctypes_to_ir(ctype).width if ctype is not None else 64
+
+
 @HelperHandlerRegistry.register("lookup")
 def bpf_map_lookup_elem_emitter(
     call,
@@ -64,7 +92,9 @@ def bpf_map_lookup_elem_emitter(
         raise ValueError(
             f"Map lookup expects exactly one argument (key), got {len(call.args)}"
         )
-    key_ptr = get_or_create_ptr_from_arg(call.args[0], builder, local_sym_tab)
+    key_ptr = get_or_create_ptr_from_arg(
+        call.args[0], builder, local_sym_tab, map_slot_width(map_ptr, "key")
+    )
     map_void_ptr = builder.bitcast(map_ptr, ir.PointerType())
 
     fn_type = ir.FunctionType(
@@ -141,7 +171,7 @@ def bpf_map_update_elem_emitter(
 ):
     """
     Emit LLVM IR for bpf_map_update_elem helper function call.
-    Expected call signature: map.update(key, value, flags=0)
+    Expected call signature: map.update(key, value, flags=BPF_ANY)
     """
     if not call.args or len(call.args) < 2 or len(call.args) > 3:
         raise ValueError(
@@ -152,8 +182,12 @@ def bpf_map_update_elem_emitter(
     value_arg = call.args[1]
     flags_arg = call.args[2] if len(call.args) > 2 else None
 
-    key_ptr = get_or_create_ptr_from_arg(key_arg, builder, local_sym_tab)
-    value_ptr = get_or_create_ptr_from_arg(value_arg, builder, local_sym_tab)
+    key_ptr = get_or_create_ptr_from_arg(
+        key_arg, builder, local_sym_tab, map_slot_width(map_ptr, "key")
+    )
+    value_ptr = get_or_create_ptr_from_arg(
+        value_arg, builder, local_sym_tab, map_slot_width(map_ptr, "value")
+    )
     flags_val = get_flags_val(flags_arg, builder, local_sym_tab)
 
     map_void_ptr = builder.bitcast(map_ptr, ir.PointerType())
@@ -197,7 +231,9 @@ def bpf_map_delete_elem_emitter(
         raise ValueError(
             f"Map delete expects exactly one argument (key), got {len(call.args)}"
         )
-    key_ptr = get_or_create_ptr_from_arg(call.args[0], builder, local_sym_tab)
+    key_ptr = get_or_create_ptr_from_arg(
+        call.args[0], builder, local_sym_tab, map_slot_width(map_ptr, "key")
+    )
     map_void_ptr = builder.bitcast(map_ptr, ir.PointerType())
 
     # Define function type for bpf_map_delete_elem
@@ -289,6 +325,196 @@ def bpf_perf_event_output_handler(
     return result, None
 
 
+@HelperHandlerRegistry.register("tail_call")
+def bpf_tail_call_emitter(
+    call,
+    map_ptr,
+    module,
+    builder,
+    func,
+    local_sym_tab=None,
+    struct_sym_tab=None,
+):
+    """
+    Emit LLVM IR for bpf_tail_call helper function call.
+
+    tail_call(ctx, prog_array, index) only returns if the slot is empty.
+    """
+    if len(call.args) != 3:
+        raise ValueError(
+            f"tail_call expects ctx, a ProgArray and an index, got {len(call.args)}"
+        )
+    ctx_arg, map_arg, index_arg = call.args
+
+    if not (isinstance(ctx_arg, ast.Name) and ctx_arg.id in local_sym_tab):
+        raise ValueError(
+            f"tail_call needs the program's context, got {ast.unparse(ctx_arg)}"
+        )
+    ctx_ptr = local_sym_tab[ctx_arg.id].load(builder)
+
+    # Direct style tail_call(ctx, progs, i) or func style tail_call(ctx, progs(), i)
+    if isinstance(map_arg, ast.Call) and isinstance(map_arg.func, ast.Name):
+        map_arg = map_arg.func
+    map_global = (
+        module.globals.get(map_arg.id) if isinstance(map_arg, ast.Name) else None
+    )
+    if not is_prog_array(map_global):
+        raise ValueError(f"tail_call needs a ProgArray map, got {ast.unparse(map_arg)}")
+
+    # The index is a u32: narrower values are zero-extended, wider truncated
+    index = get_operand_value(index_arg, module, builder, local_sym_tab)
+    index = coerce_value(builder, index, ir.IntType(32), signed=False)
+
+    fn_type = ir.FunctionType(
+        ir.IntType(64),
+        [ir.PointerType(), ir.PointerType(), ir.IntType(32)],
+        var_arg=False,
+    )
+    fn_ptr_type = ir.PointerType(fn_type)
+
+    fn_addr = ir.Constant(ir.IntType(64), BPFHelperID.BPF_TAIL_CALL.value)
+    fn_ptr = builder.inttoptr(fn_addr, fn_ptr_type)
+
+    map_void_ptr = builder.bitcast(map_global, ir.PointerType())
+    result = builder.call(fn_ptr, [ctx_ptr, map_void_ptr, index], tail=False)
+    return result, ir.IntType(64)
+
+
+def emit_atomic_rmw(builder, op, value_ptr, delta):
+    """
+    Apply op to the int value_ptr points to with a single atomic instruction.
+
+    add and sub work on every kernel; or, and and xor need cpu v3 (5.12+).
+    """
+    kind = ATOMIC_OPS.get(type(op))
+    if kind is None:
+        raise SyntaxError(
+            f"Unsupported in-place operator on a map value: {type(op).__name__}"
+        )
+    if delta.type.width not in (32, 64):
+        raise TypeError(
+            f"Atomic map updates need a 32 or 64 bit value, got {delta.type}"
+        )
+    if kind == "sub":
+        # BPF only has an atomic add, and older cpus cannot select sub
+        kind, delta = "add", builder.neg(delta)
+    return builder.atomic_rmw(kind, value_ptr, delta, "monotonic")
+
+
+def emit_percpu_rmw(builder, op, value_ptr, delta):
+    """
+    Apply op to the int value_ptr points to with a plain load and store.
+
+    Enough for the values of per-CPU maps, which no other CPU writes.
+    """
+    kind = ATOMIC_OPS.get(type(op))
+    if kind is None:
+        raise SyntaxError(
+            f"Unsupported in-place operator on a map value: {type(op).__name__}"
+        )
+    emit = {
+        "add": builder.add,
+        "sub": builder.sub,
+        "or": builder.or_,
+        "and": builder.and_,
+        "xor": builder.xor,
+    }[kind]
+    value = builder.load(value_ptr, typ=delta.type)
+    builder.store(emit(value, delta), value_ptr)
+
+
+def _map_lookup(builder, map_void_ptr, key_ptr, value_type=None):
+    ret_type = ir.PointerType(value_type) if value_type else ir.PointerType()
+    fn_type = ir.FunctionType(
+        ret_type, [ir.PointerType(), ir.PointerType()], var_arg=False
+    )
+    fn_addr = ir.Constant(ir.IntType(64), BPFHelperID.BPF_MAP_LOOKUP_ELEM.value)
+    fn_ptr = builder.inttoptr(fn_addr, ir.PointerType(fn_type))
+    return builder.call(fn_ptr, [map_void_ptr, key_ptr], tail=False)
+
+
+def emit_map_lookup(builder, map_ptr, key_ptr, value_type=None):
+    """
+    Emit bpf_map_lookup_elem(map, key); the result is NULL for a missing key.
+
+    With value_type the result is typed as a pointer to it.
+    """
+    map_void_ptr = builder.bitcast(map_ptr, ir.PointerType())
+    return _map_lookup(builder, map_void_ptr, key_ptr, value_type)
+
+
+def emit_map_atomic_update(map_ptr, key_arg, op, delta, builder, func, local_sym_tab):
+    """
+    Emit map[key] op= delta as one lookup and an atomic op on the value.
+
+    A missing key is inserted with BPF_NOEXIST as if its value was 0. When
+    another CPU inserts it first the insert fails, and the op is applied to
+    the entry that won instead. Per-CPU maps skip the atomic, since only
+    the current CPU writes its copy of the value. Array entries always
+    exist, so for arrays an out of range index is simply skipped.
+    """
+    key_ptr = get_or_create_ptr_from_arg(
+        key_arg, builder, local_sym_tab, map_slot_width(map_ptr, "key")
+    )
+    map_void_ptr = builder.bitcast(map_ptr, ir.PointerType())
+    null = ir.Constant(ir.PointerType(), None)
+    rmw = emit_percpu_rmw if is_percpu_map(map_ptr) else emit_atomic_rmw
+
+    hit_block = func.append_basic_block(name="map.hit")
+    done_block = func.append_basic_block(name="map.done")
+    value_ptr = _map_lookup(builder, map_void_ptr, key_ptr)
+    if is_array_map(map_ptr):
+        builder.cbranch(
+            builder.icmp_unsigned("!=", value_ptr, null), hit_block, done_block
+        )
+        builder.position_at_end(hit_block)
+        rmw(builder, op, value_ptr, delta)
+        builder.branch(done_block)
+        builder.position_at_end(done_block)
+        return
+
+    miss_block = func.append_basic_block(name="map.miss")
+    retry_block = func.append_basic_block(name="map.retry")
+    lookup_block = builder.block
+    builder.cbranch(builder.icmp_unsigned("!=", value_ptr, null), hit_block, miss_block)
+
+    builder.position_at_end(miss_block)
+    if isinstance(op, ast.Sub):
+        initial = builder.neg(delta)
+    elif isinstance(op, ast.BitAnd):
+        initial = ir.Constant(delta.type, 0)
+    else:
+        initial = delta
+    initial_ptr = entry_alloca(builder, delta.type)
+    builder.store(initial, initial_ptr)
+    fn_type = ir.FunctionType(
+        ir.IntType(64),
+        [ir.PointerType(), ir.PointerType(), ir.PointerType(), ir.IntType(64)],
+        var_arg=False,
+    )
+    fn_addr = ir.Constant(ir.IntType(64), BPFHelperID.BPF_MAP_UPDATE_ELEM.value)
+    fn_ptr = builder.inttoptr(fn_addr, ir.PointerType(fn_type))
+    flags = ir.Constant(ir.IntType(64), BPF_NOEXIST)
+    result = builder.call(
+        fn_ptr, [map_void_ptr, key_ptr, initial_ptr, flags], tail=False
+    )
+    inserted = builder.icmp_signed("==", result, ir.Constant(ir.IntType(64), 0))
+    builder.cbranch(inserted, done_block, retry_block)
+
+    builder.position_at_end(retry_block)
+    retry_ptr = _map_lookup(builder, map_void_ptr, key_ptr)
+    builder.cbranch(builder.icmp_unsigned("!=", retry_ptr, null), hit_block, done_block)
+
+    builder.position_at_end(hit_block)
+    ptr = builder.phi(ir.PointerType())
+    ptr.add_incoming(value_ptr, lookup_block)
+    ptr.add_incoming(retry_ptr, retry_block)
+    rmw(builder, op, ptr, delta)
+    builder.branch(done_block)
+
+    builder.position_at_end(done_block)
+
+
 def handle_helper_call(
     call,
     module,
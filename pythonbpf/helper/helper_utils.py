@@ -3,7 +3,11 @@ import logging
 from collections.abc import Callable
 
 from llvmlite import ir
-from pythonbpf.expr_pass import eval_expr
+from pythonbpf.binary_ops import extend_operand
+from pythonbpf.expr_pass import eval_expr, expr_signed
+from pythonbpf.maps.flags import UPDATE_FLAGS, flags_value
+from pythonbpf.stack_frame import entry_alloca
+from pythonbpf.type_deducer import is_signed
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +41,8 @@ class HelperHandlerRegistry:
 def get_var_ptr_from_name(var_name, local_sym_tab):
     """Get a pointer to a variable from the symbol table."""
     if local_sym_tab and var_name in local_sym_tab:
+        if local_sym_tab[var_name].in_register:
+            raise ValueError(f"Variable '{var_name}' has no stack slot")
         return local_sym_tab[var_name].var
     raise ValueError(f"Variable '{var_name}' not found in local symbol table")
 
@@ -45,19 +51,23 @@ def create_int_constant_ptr(value, builder, int_width=64):
     """Create a pointer to an integer constant."""
     # Default to 64-bit integer
     int_type = ir.IntType(int_width)
-    ptr = builder.alloca(int_type)
-    ptr.align = int_type.width // 8
+    ptr = entry_alloca(builder, int_type)
     builder.store(ir.Constant(int_type, value), ptr)
     return ptr
 
 
-def get_or_create_ptr_from_arg(arg, builder, local_sym_tab):
-    """Extract or create pointer from the call arguments."""
+def get_or_create_ptr_from_arg(arg, builder, local_sym_tab, int_width=64):
+    """
+    Extract or create pointer from the call arguments.
+
+    int_width is the width of the map key or value the pointer is passed as,
+    which an int constant is stored with.
+    """
 
     if isinstance(arg, ast.Name):
         ptr = get_var_ptr_from_name(arg.id, local_sym_tab)
     elif isinstance(arg, ast.Constant) and isinstance(arg.value, int):
-        ptr = create_int_constant_ptr(arg.value, builder)
+        ptr = create_int_constant_ptr(arg.value, builder, int_width)
     else:
         raise NotImplementedError(
             "Only simple variable names are supported as args in map helpers."
@@ -70,17 +80,17 @@ def get_flags_val(arg, builder, local_sym_tab):
     if not arg:
         return 0
 
+    if isinstance(arg, ast.Name) and local_sym_tab and arg.id in local_sym_tab:
+        return local_sym_tab[arg.id].load(builder)
+    value = flags_value(arg, UPDATE_FLAGS)
+    if value is not None:
+        return value
     if isinstance(arg, ast.Name):
-        if local_sym_tab and arg.id in local_sym_tab:
-            flags_ptr = local_sym_tab[arg.id].var
-            return builder.load(flags_ptr)
-        else:
-            raise ValueError(f"Variable '{arg.id}' not found in local symbol table")
-    elif isinstance(arg, ast.Constant) and isinstance(arg.value, int):
-        return arg.value
+        raise ValueError(f"Variable '{arg.id}' not found in local symbol table")
 
     raise NotImplementedError(
-        "Only var names or int consts are supported as map helpers flags."
+        "Only var names, int consts and BPF_ANY/BPF_NOEXIST/BPF_EXIST are "
+        "supported as map helpers flags."
     )
 
 
@@ -178,8 +188,8 @@ def _process_fval(fval, fmt_parts, exprs, local_sym_tab, struct_sym_tab):
 def _process_name_in_fval(name_node, fmt_parts, exprs, local_sym_tab):
     """Process name nodes in formatted values."""
     if local_sym_tab and name_node.id in local_sym_tab:
-        _, var_type, tmp = local_sym_tab[name_node.id]
-        _populate_fval(var_type, name_node, fmt_parts, exprs)
+        sym = local_sym_tab[name_node.id]
+        _populate_fval(sym.ir_type, name_node, fmt_parts, exprs, is_signed(sym.ctype))
 
 
 def _process_attr_in_fval(attr_node, fmt_parts, exprs, local_sym_tab, struct_sym_tab):
@@ -203,22 +213,23 @@ def _process_attr_in_fval(attr_node, fmt_parts, exprs, local_sym_tab, struct_sym
             raise ValueError(f"Field '{field_name}' not found in struct '{var_type}'")
 
         field_type = struct_info.field_type(field_name)
-        _populate_fval(field_type, attr_node, fmt_parts, exprs)
+        signed = is_signed(struct_info.ctypes.get(field_name))
+        _populate_fval(field_type, attr_node, fmt_parts, exprs, signed)
     else:
         raise NotImplementedError(
             "Only simple attribute on local vars is supported in f-strings."
         )
 
 
-def _populate_fval(ftype, node, fmt_parts, exprs):
+def _populate_fval(ftype, node, fmt_parts, exprs, signed=True):
     """Populate format parts and expressions based on field type."""
     if isinstance(ftype, ir.IntType):
-        # TODO: We print as signed integers only for now
         if ftype.width == 64:
-            fmt_parts.append("%lld")
+            fmt_parts.append("%lld" if signed else "%llu")
             exprs.append(node)
-        elif ftype.width == 32:
-            fmt_parts.append("%d")
+        elif 8 <= ftype.width <= 32:
+            # Narrower values are widened by _prepare_expr_args
+            fmt_parts.append("%d" if signed else "%u")
             exprs.append(node)
         else:
             raise NotImplementedError(
@@ -267,7 +278,8 @@ def _prepare_expr_args(expr, func, module, builder, local_sym_tab, struct_sym_ta
             val = builder.ptrtoint(val, ir.IntType(64))
         elif isinstance(val.type, ir.IntType):
             if val.type.width < 64:
-                val = builder.sext(val, ir.IntType(64))
+                signed = expr_signed(expr, module, local_sym_tab, struct_sym_tab)
+                val = extend_operand(builder, val, ir.IntType(64), signed)
         else:
             logger.warning(
                 "Only int and ptr supported in bpf_printk args. Others default to 0."
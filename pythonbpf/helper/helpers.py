@@ -15,5 +15,20 @@ def deref(ptr):
     return result if result is not None else 0
 
 
+def tail_call(ctx, prog_array, index):
+    "jump to the program in slot index of prog_array, returns only on failure"
+    return ctypes.c_int64(0)
+
+
+def unroll(iterable):
+    "unroll the loop over iterable"
+    return iterable
+
+
+def bounded(iterable):
+    "keep the loop over iterable as a bounded loop"
+    return iterable
+
+
 XDP_DROP = ctypes.c_int64(1)
 XDP_PASS = ctypes.c_int64(2)
@@ -0,0 +1,246 @@
+import ast
+import hashlib
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+from logging import Logger
+import logging
+
+from llvmlite import ir
+
+from .backend import DEFAULT_OPT_LEVEL, DEFAULT_CPU, emit_object, format_timings
+from .codegen import VERSION, new_ir_module, add_module_flags
+from .functions_pass import declare_callee, process_func_symbol
+from .globals_pass import globals_processing
+from .license_pass import license_processing
+from .maps.maps_pass import init_prog_array_slots, process_bpf_map
+from .structs.structs_pass import process_bpf_struct
+from .symbol_index import SymbolKind, build_symbol_index
+
+logger: Logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CompiledUnit:
+    """Cached result of compiling one struct, map or function."""
+
+    name: str
+    kind: SymbolKind
+    key: str
+    # Textual IR of the unit's own module; structs emit no IR
+    ir_text: Optional[str]
+    # StructType for structs, (the global's type, map params) for maps, the
+    # function type for programs and helpers. Used to declare the unit in
+    # its dependents.
+    value: Any
+
+
+@dataclass
+class IncrementalBuild:
+    """Outcome of one IncrementalCompiler.build() call."""
+
+    llvm_module: Any
+    rebuilt: list[str] = field(default_factory=list)
+    reused: list[str] = field(default_factory=list)
+    timings: dict = field(default_factory=dict)
+
+
+def node_hash(node) -> str:
+    """Hash a definition's AST, ignoring positions and comments."""
+    dump = ast.dump(node, include_attributes=False)
+    return hashlib.sha256(dump.encode("utf-8")).hexdigest()
+
+
+def referenced_names(node):
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+
+
+class IncrementalCompiler:
+    """
+    Recompile only the @bpf definitions of a file that changed since the last
+    build.
+
+    Every struct, map and function is compiled into its own small module and
+    cached under a key made of its source hash and the hashes of the symbols
+    it references, so editing a map also rebuilds the functions using it.
+    The cached units are linked into a fresh LLVM module on each build; the
+    pass pipeline and BPF code generation still run over the whole module.
+    """
+
+    def __init__(self, opt_level=DEFAULT_OPT_LEVEL):
+        self.opt_level = opt_level
+        self.units: dict[str, CompiledUnit] = {}
+
+    def clear(self):
+        self.units.clear()
+
+    def unit_key(self, filename, symbol, hashes):
+        deps = sorted((referenced_names(symbol.node) & hashes.keys()) - {symbol.name})
+        payload = json.dumps(
+            {
+                "version": VERSION,
+                "opt_level": self.opt_level,
+                "filename": filename,
+                "node": hashes[symbol.name],
+                "deps": [(dep, hashes[dep]) for dep in deps],
+            }
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def compile_unit(
+        self, filename, symbol, structs_sym_tab, map_types, constants, functions=()
+    ):
+        if symbol.kind is SymbolKind.STRUCT:
+            return None, process_bpf_struct(symbol.node, None)
+
+        module = new_ir_module(filename, self.opt_level)
+        if symbol.kind is SymbolKind.MAP:
+            map_global = process_bpf_map(symbol.node, module, structs_sym_tab)
+            # A ProgArray's initializer refers to the programs it lists
+            names = referenced_names(symbol.node)
+            for callee in functions:
+                if callee.name in names:
+                    declare_callee(callee, module, structs_sym_tab)
+            init_prog_array_slots(
+                module,
+                {symbol.name: map_global},
+                {f.name for f in functions if f.kind is SymbolKind.PROGRAM},
+            )
+            value = (map_global.value_type, getattr(map_global, "map_params", {}))
+        else:
+            # Maps live in their own units; reference them as declarations
+            names = referenced_names(symbol.node)
+            map_sym_tab = {}
+            for name, (ty, map_params) in map_types.items():
+                if name in names:
+                    map_sym_tab[name] = ir.GlobalVariable(module, ty, name=name)
+                    map_sym_tab[name].map_params = map_params
+            # and the functions it calls
+            for callee in functions:
+                if callee.name in names and callee.name != symbol.name:
+                    declare_callee(callee, module, structs_sym_tab)
+            func = process_func_symbol(
+                symbol,
+                module,
+                map_sym_tab,
+                structs_sym_tab,
+                self.opt_level,
+                constants,
+            )
+            value = func.function_type
+            if func.linkage == "internal":
+                # Exported for linking, link_module makes it static again
+                func.linkage = "dso_local"
+        add_module_flags(module)
+        return str(module), value
+
+    def link_module(self, filename, symbols, map_types, func_types, ir_texts):
+        """Build the LICENSE/llvm.compiler.used unit and link everything."""
+        from llvmlite import binding as llvm
+
+        module = new_ir_module(filename, self.opt_level)
+        for name, (ty, _) in map_types.items():
+            ir.GlobalVariable(module, ty, name=name)
+        for name, ty in func_types.items():
+            ir.Function(module, ty, name=name)
+        license_processing(None, module, symbols)
+        globals_processing(None, module, symbols)
+        add_module_flags(module)
+
+        linked = llvm.parse_assembly(f'source_filename = "{filename}"\n{module}')
+        for ir_text in ir_texts:
+            linked.link_in(llvm.parse_assembly(ir_text))
+        for symbol in symbols.of_kind(SymbolKind.HELPER):
+            if not symbol.inline:
+                linked.get_function(symbol.name).linkage = "internal"
+        linked.verify()
+        return linked
+
+    def build(self, filename: str, source=None) -> IncrementalBuild:
+        """Regenerate the changed units of a file and relink the module."""
+        if source is None:
+            with open(filename) as f:
+                source = f.read()
+
+        start = time.perf_counter()
+        symbols = build_symbol_index(ast.parse(source, filename))
+        hashes = {symbol.name: node_hash(symbol.node) for symbol in symbols}
+        # Module constants are inlined, so a unit also depends on their values
+        for name, value in symbols.constants.items():
+            hashes.setdefault(name, repr(value))
+        result = IncrementalBuild(llvm_module=None)
+
+        structs_sym_tab, map_types, func_types, ir_texts = {}, {}, {}, []
+        units = {}
+        # Structs before maps before functions, so dependencies are ready
+        for kinds in (
+            (SymbolKind.STRUCT,),
+            (SymbolKind.MAP,),
+            (SymbolKind.PROGRAM, SymbolKind.HELPER),
+        ):
+            for symbol in symbols.of_kind(*kinds):
+                key = self.unit_key(filename, symbol, hashes)
+                unit = self.units.get(symbol.name)
+                if unit is not None and unit.key == key:
+                    result.reused.append(symbol.name)
+                else:
+                    logger.info(f"Rebuilding {symbol.kind.name.lower()} {symbol.name}")
+                    ir_text, value = self.compile_unit(
+                        filename,
+                        symbol,
+                        structs_sym_tab,
+                        map_types,
+                        symbols.constants,
+                        symbols.functions(),
+                    )
+                    unit = CompiledUnit(symbol.name, symbol.kind, key, ir_text, value)
+                    result.rebuilt.append(symbol.name)
+                units[symbol.name] = unit
+
+                if unit.kind is SymbolKind.STRUCT:
+                    structs_sym_tab[unit.name] = unit.value
+                elif unit.kind is SymbolKind.MAP:
+                    map_types[unit.name] = unit.value
+                else:
+                    func_types[unit.name] = unit.value
+                if unit.ir_text is not None:
+                    ir_texts.append(unit.ir_text)
+
+        # Drop units for definitions that no longer exist
+        self.units = units
+        result.timings["ir"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result.llvm_module = self.link_module(
+            filename, symbols, map_types, func_types, ir_texts
+        )
+        result.timings["link"] = time.perf_counter() - start
+
+        logger.info(
+            f"Incremental build of {filename}: rebuilt {result.rebuilt}, "
+            f"reused {len(result.reused)} units"
+        )
+        return result
+
+    def compile_to_object(
+        self,
+        filename: str,
+        output: str,
+        source=None,
+        cpu=DEFAULT_CPU,
+        use_llc=False,
+    ) -> IncrementalBuild:
+        """Incrementally rebuild a file and emit it as a BPF object."""
+        result = self.build(filename, source)
+        result.timings.update(
+            emit_object(
+                result.llvm_module,
+                output,
+                opt_level=self.opt_level,
+                cpu=cpu,
+                use_llc=use_llc,
+            )
+        )
+        logger.info(f"Object written to {output} ({format_timings(result.timings)})")
+        return result
@@ -2,6 +2,7 @@ from llvmlite import ir
 import ast
 from logging import Logger
 import logging
+from .symbol_index import SymbolKind
 
 logger: Logger = logging.getLogger(__name__)
 
@@ -23,31 +24,28 @@ def emit_license(module: ir.Module, license_str: str):
     return gvar
 
 
-def license_processing(tree, module):
+def license_processing(tree, module, symbols):
     """Process the LICENSE function decorated with @bpf and @bpfglobal and return the section name"""
-    count = 0
-    for node in tree.body:
-        if isinstance(node, ast.FunctionDef) and node.name == "LICENSE":
-            # check decorators
-            decorators = [
-                dec.id for dec in node.decorator_list if isinstance(dec, ast.Name)
-            ]
-            if "bpf" in decorators and "bpfglobal" in decorators:
-                if count == 0:
-                    count += 1
-                    # check function body has a return string
-                    if (
-                        len(node.body) == 1
-                        and isinstance(node.body[0], ast.Return)
-                        and isinstance(node.body[0].value, ast.Constant)
-                        and isinstance(node.body[0].value.value, str)
-                    ):
-                        emit_license(module, node.body[0].value.value)
-                        return "LICENSE"
-                    else:
-                        logger.info("ERROR: LICENSE() must return a string literal")
-                        return None
-                else:
-                    logger.info("ERROR: LICENSE already defined")
-                    return None
-    return None
+    licenses = [
+        symbol
+        for symbol in symbols.of_kind(SymbolKind.GLOBAL)
+        if symbol.name == "LICENSE"
+    ]
+    if not licenses:
+        return None
+    if len(licenses) > 1:
+        logger.info("ERROR: LICENSE already defined")
+
+    node = licenses[0].node
+    # check function body has a return string
+    if (
+        len(node.body) == 1
+        and isinstance(node.body[0], ast.Return)
+        and isinstance(node.body[0].value, ast.Constant)
+        and isinstance(node.body[0].value.value, str)
+    ):
+        emit_license(module, node.body[0].value.value)
+        return "LICENSE"
+    else:
+        logger.info("ERROR: LICENSE() must return a string literal")
+        return None
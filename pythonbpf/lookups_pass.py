@@ -0,0 +1,224 @@
+import ast
+import logging
+
+from .constants_pass import assigned_names, stored_names
+from .maps.flags import BPF_ANY, BPF_EXIST, UPDATE_FLAGS, flags_value
+from .maps.maps_pass import map_value_type
+
+logger = logging.getLogger(__name__)
+
+# Map methods after which earlier lookup() pointers into the map may be stale
+MAP_WRITES = {"update", "delete"}
+# update() flags under which an existing entry is simply overwritten
+OVERWRITE_FLAGS = {BPF_ANY, BPF_EXIST}
+# Calls that cannot touch a map behind the function's back
+PURE_CALLS = {"print", "ktime", "pid", "deref", "tail_call", "unroll", "bounded"}
+
+
+def map_name_of(node):
+    """The map a map expression names, for both m and m() styles."""
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+        return node.func.id
+    elif isinstance(node, ast.Name):
+        return node.id
+    return None
+
+
+def map_method(node):
+    """Return (map name, method, args) for a m.method(...) call, else None."""
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        map_name = map_name_of(node.func.value)
+        if map_name is not None:
+            return map_name, node.func.attr, node.args
+    return None
+
+
+def key_of(node):
+    """A hashable identity for a map key: a local name or an int literal."""
+    if isinstance(node, ast.Name):
+        return node.id
+    elif isinstance(node, ast.Constant) and type(node.value) is int:
+        return node.value
+    return None
+
+
+class LookupEliminator:
+    """
+    Drop map helper calls whose result is already known.
+
+    A lookup() of a map and key that an earlier lookup in a dominating
+    statement already did reuses that pointer. An update() of such a key
+    under an `if ptr:` check becomes a store through the pointer. A lookup
+    stays available until its key or pointer is reassigned or stored through
+    (k.field = ..., ptr[0] = ...), the map is written through update(),
+    delete() or m[k] op= n, or a @bpf function is called, since that may
+    write any map. Only pointers and duplicates that are assigned once in
+    the whole function are considered, so renaming the duplicate to the
+    original is always safe.
+    """
+
+    def __init__(self, func_node, map_sym_tab):
+        self.func_name = func_node.name
+        self.map_sym_tab = map_sym_tab
+        self.assigned = assigned_names(func_node)
+        # Dropped duplicate pointer -> the pointer it reuses
+        self.renames = {}
+        self.removed = []
+
+    def run(self, func_node):
+        func_node.body = self.visit_body(func_node.body, {}, set())
+        if self.renames:
+            RenameLoads(self.renames).visit(func_node)
+        if self.removed:
+            logger.info(
+                f"Removed {len(self.removed)} map helper calls from "
+                f"{self.func_name}: {'; '.join(self.removed)}"
+            )
+        return func_node
+
+    def visit_body(self, stmts, available, nonnull):
+        """
+        Rewrite a statement list.
+
+        available maps (map, key) to the local holding its lookup() pointer
+        and is updated in place; nonnull are the pointers known to be set.
+        """
+        body = []
+        for stmt in stmts:
+            if isinstance(stmt, ast.If):
+                checked = nonnull
+                if isinstance(stmt.test, ast.Name):
+                    checked = nonnull | {self.renames.get(stmt.test.id, stmt.test.id)}
+                stmt.body = self.visit_body(stmt.body, dict(available), checked)
+                stmt.orelse = self.visit_body(stmt.orelse, dict(available), nonnull)
+                self.kill(available, stmt)
+            elif isinstance(stmt, (ast.For, ast.While)):
+                # Facts the loop could kill do not hold on its later iterations
+                self.kill(available, stmt)
+                stmt.body = self.visit_body(stmt.body, dict(available), nonnull)
+            else:
+                stmt = self.visit_stmt(stmt, available, nonnull)
+                if stmt is None:
+                    continue
+            body.append(stmt)
+        return body
+
+    def visit_stmt(self, stmt, available, nonnull):
+        """Rewrite one simple statement; None drops it."""
+        if (
+            isinstance(stmt, ast.Assign)
+            and len(stmt.targets) == 1
+            and isinstance(stmt.targets[0], ast.Name)
+            and map_method(stmt.value)
+        ):
+            ptr = stmt.targets[0].id
+            map_name, method, args = map_method(stmt.value)
+            key = key_of(args[0]) if method == "lookup" and len(args) == 1 else None
+            if key is not None:
+                known = available.get((map_name, key))
+                if known is not None and self.assigned[ptr] == 1:
+                    self.renames[ptr] = known
+                    self.removed.append(
+                        f"{ptr} = {ast.unparse(stmt.value)} reuses {known}"
+                    )
+                    return None
+                self.kill(available, stmt)
+                if self.assigned[ptr] == 1:
+                    available[(map_name, key)] = ptr
+                return stmt
+
+        if isinstance(stmt, ast.Expr) and map_method(stmt.value):
+            map_name, method, args = map_method(stmt.value)
+            known = None
+            if method == "update" and len(args) in (2, 3):
+                known = available.get((map_name, key_of(args[0])))
+            if (
+                known in nonnull
+                and map_value_type(self.map_sym_tab.get(map_name)) is not None
+                and isinstance(args[1], (ast.Name, ast.Constant))
+                and (len(args) == 2 or self.update_flags(args[2]) in OVERWRITE_FLAGS)
+            ):
+                # The entry exists, so overwrite the value in place
+                self.removed.append(f"{ast.unparse(stmt.value)} stores through {known}")
+                target = ast.Subscript(
+                    value=ast.Name(id=known, ctx=ast.Load()),
+                    slice=ast.Constant(0),
+                    ctx=ast.Store(),
+                )
+                new_stmt = ast.copy_location(
+                    ast.Assign(targets=[target], value=args[1]), stmt
+                )
+                ast.fix_missing_locations(new_stmt)
+                # Other lookups of the map are unaffected by the store
+                return new_stmt
+
+        self.kill(available, stmt)
+        return stmt
+
+    def update_flags(self, node):
+        """The value of constant update() flags, or None."""
+        if isinstance(node, ast.Name) and node.id in self.assigned:
+            return None
+        return flags_value(node, UPDATE_FLAGS)
+
+    def kill(self, available, node):
+        """Forget the lookups node may invalidate."""
+        names = stored_names(node) | stored_bases(node)
+        written = set()
+        for sub in ast.walk(node):
+            call = map_method(sub)
+            if call is not None and call[1] in MAP_WRITES:
+                written.add(call[0])
+            elif isinstance(sub, ast.AugAssign) and isinstance(
+                sub.target, ast.Subscript
+            ):
+                written.add(map_name_of(sub.target.value))
+            elif (
+                isinstance(sub, ast.Call)
+                and isinstance(sub.func, ast.Name)
+                and sub.func.id not in PURE_CALLS
+                and sub.func.id not in self.map_sym_tab
+                and not sub.func.id.startswith("c_")
+            ):
+                # Possibly a @bpf function, which can write any map
+                written.update(self.map_sym_tab)
+        for (map_name, key), ptr in list(available.items()):
+            if map_name in written or key in names or ptr in names:
+                del available[(map_name, key)]
+
+
+def stored_bases(node):
+    """The names whose fields or elements node stores to, as in k.a = 1 or p[0] = 1."""
+    bases = set()
+    for sub in ast.walk(node):
+        if isinstance(sub, (ast.Attribute, ast.Subscript)) and isinstance(
+            sub.ctx, ast.Store
+        ):
+            base = sub.value
+            while isinstance(base, (ast.Attribute, ast.Subscript)):
+                base = base.value
+            if isinstance(base, ast.Name):
+                bases.add(base.id)
+    return bases
+
+
+class RenameLoads(ast.NodeTransformer):
+    def __init__(self, renames):
+        self.renames = renames
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load) and node.id in self.renames:
+            return ast.copy_location(
+                ast.Name(id=self.renames[node.id], ctx=ast.Load()), node
+            )
+        return node
+
+
+def eliminate_redundant_lookups(func_node, map_sym_tab):
+    """
+    Return func_node with repeated map lookups reused and lookup-then-update
+    of the same key turned into a store through the lookup pointer.
+
+    func_node is rewritten in place; fold_constants already hands over a copy.
+    """
+    return LookupEliminator(func_node, map_sym_tab or {}).run(func_node)
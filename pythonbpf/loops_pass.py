@@ -0,0 +1,142 @@
+import ast
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Loops are unrolled when trips * body cost stays within this budget
+UNROLL_BUDGET = 128
+# and never beyond this many iterations
+MAX_UNROLL_TRIPS = 32
+
+# Rough number of BPF instructions each node turns into
+NODE_COSTS = {
+    ast.Call: 4,
+    ast.BinOp: 1,
+    ast.Compare: 2,
+    ast.BoolOp: 2,
+    ast.IfExp: 2,
+    ast.UnaryOp: 1,
+    ast.Assign: 1,
+    ast.If: 1,
+    ast.Attribute: 1,
+}
+
+# Marker helpers from pythonbpf.helper that override the heuristic
+OVERRIDES = {"unroll": True, "bounded": False}
+
+
+def loop_cost(body):
+    """Estimate the instructions one iteration of body costs."""
+    return sum(
+        NODE_COSTS.get(type(node), 0) for stmt in body for node in ast.walk(stmt)
+    )
+
+
+def strip_override(node):
+    """
+    Return (node, forced) with an unroll()/bounded() wrapper removed.
+
+    forced is True for unroll(...), False for bounded(...) and None when
+    the heuristic decides.
+    """
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id in OVERRIDES
+        and len(node.args) == 1
+    ):
+        return node.args[0], OVERRIDES[node.func.id]
+    return node, None
+
+
+def trip_count(start, stop, step):
+    return len(range(start, stop, step))
+
+
+def should_unroll(trips, body, forced=None):
+    """Decide whether a loop with a known trip count is unrolled."""
+    if forced is not None:
+        return forced
+    cost = loop_cost(body)
+    unroll = trips <= MAX_UNROLL_TRIPS and trips * cost <= UNROLL_BUDGET
+    logger.info(
+        f"Loop of {trips} trips at ~{cost} instructions each: "
+        f"{'unrolling' if unroll else 'keeping a bounded loop'}"
+    )
+    return unroll
+
+
+def check_loop_body(body):
+    """Reject control flow the loop lowering does not support."""
+    for stmt in body:
+        for node in ast.walk(stmt):
+            if isinstance(node, (ast.Break, ast.Continue)):
+                raise SyntaxError("break and continue are not supported in loops")
+
+
+def while_trip_count(test, body, known, evaluate):
+    """
+    Return (name, init, step, trips) for a while loop with a provable bound.
+
+    The loop must compare a counter with a constant, the counter must hold a
+    known constant on entry, and the body must update it exactly once, at
+    its top level, by adding or subtracting a constant. evaluate returns the
+    constant value of an expression or None. Returns None when the bound
+    cannot be proven.
+    """
+    if not (
+        isinstance(test, ast.Compare)
+        and len(test.ops) == 1
+        and isinstance(test.left, ast.Name)
+    ):
+        return None
+    name = test.left.id
+    limit = evaluate(test.comparators[0])
+    if limit is None or name not in known:
+        return None
+
+    updates = [
+        node
+        for stmt in body
+        for node in ast.walk(stmt)
+        if isinstance(node, ast.Name)
+        and isinstance(node.ctx, ast.Store)
+        and node.id == name
+    ]
+    step = None
+    for stmt in body:
+        if (
+            isinstance(stmt, ast.Assign)
+            and len(stmt.targets) == 1
+            and isinstance(stmt.targets[0], ast.Name)
+            and stmt.targets[0].id == name
+            and isinstance(stmt.value, ast.BinOp)
+            and isinstance(stmt.value.left, ast.Name)
+            and stmt.value.left.id == name
+            and isinstance(stmt.value.op, (ast.Add, ast.Sub))
+        ):
+            step = evaluate(stmt.value.right)
+            if step is not None and isinstance(stmt.value.op, ast.Sub):
+                step = -step
+    if step is None or step == 0 or len(updates) != 1:
+        return None
+
+    init = known[name]
+    op = test.ops[0]
+    if isinstance(op, ast.Lt) and step > 0:
+        trips = trip_count(init, limit, step)
+    elif isinstance(op, ast.LtE) and step > 0:
+        trips = trip_count(init, limit + 1, step)
+    elif isinstance(op, ast.Gt) and step < 0:
+        trips = trip_count(init, limit, step)
+    elif isinstance(op, ast.GtE) and step < 0:
+        trips = trip_count(init, limit - 1, step)
+    elif (
+        isinstance(op, ast.NotEq)
+        and (limit - init) % step == 0
+        and (limit - init) // step >= 0
+    ):
+        trips = (limit - init) // step
+    else:
+        return None
+    return name, init, step, trips
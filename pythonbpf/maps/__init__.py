@@ -1,4 +1,63 @@
-from .maps import HashMap, PerfEventArray, RingBuf
-from .maps_pass import maps_proc
+from .maps import (
+    Array,
+    HashMap,
+    LruHash,
+    LruPerCpuHash,
+    LpmTrie,
+    PerCpuHash,
+    PerCpuArray,
+    PerfEventArray,
+    RingBuf,
+    ProgArray,
+)
+from .array_view import ArrayView
+from .flags import (
+    BPF_ANY,
+    BPF_NOEXIST,
+    BPF_EXIST,
+    BPF_F_NO_PREALLOC,
+    BPF_F_NO_COMMON_LRU,
+    BPF_F_NUMA_NODE,
+    BPF_F_RDONLY_PROG,
+    BPF_F_WRONLY_PROG,
+    BPF_F_MMAPABLE,
+)
+from .lpm import lpm_key, load_cidrs
+from .percpu import PerCpuReader, percpu_values, reduce_percpu
 
-__all__ = ["HashMap", "PerfEventArray", "maps_proc", "RingBuf"]
+__all__ = [
+    "Array",
+    "HashMap",
+    "LruHash",
+    "LruPerCpuHash",
+    "LpmTrie",
+    "PerCpuHash",
+    "PerCpuArray",
+    "PerfEventArray",
+    "maps_proc",
+    "RingBuf",
+    "ProgArray",
+    "ArrayView",
+    "lpm_key",
+    "load_cidrs",
+    "PerCpuReader",
+    "percpu_values",
+    "reduce_percpu",
+    "BPF_ANY",
+    "BPF_NOEXIST",
+    "BPF_EXIST",
+    "BPF_F_NO_PREALLOC",
+    "BPF_F_NO_COMMON_LRU",
+    "BPF_F_NUMA_NODE",
+    "BPF_F_RDONLY_PROG",
+    "BPF_F_WRONLY_PROG",
+    "BPF_F_MMAPABLE",
+]
+
+
+def __getattr__(name):
+    if name == "maps_proc":
+        from .maps_pass import maps_proc
+
+        return maps_proc
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,81 @@
+"""
+Zero-copy user-side access to an mmapable Array map.
+
+An Array created with mmapable=True can be mapped into the process, after
+which its values are plain memory: reading or writing them needs no
+syscall, and scanning every counter is a memory scan.
+"""
+
+import mmap
+
+from .percpu import slot_size, value_slots
+
+
+def map_fd(bpf_map) -> int:
+    """The file descriptor of a loaded map, or bpf_map itself if it is one."""
+    if isinstance(bpf_map, int):
+        return bpf_map
+    fd = getattr(bpf_map, "fd", None)
+    if callable(fd):
+        fd = fd()
+    if not isinstance(fd, int):
+        raise TypeError(f"Cannot get a map file descriptor from {bpf_map!r}")
+    return fd
+
+
+class ArrayView:
+    """
+    The values of a loaded mmapable Array, mapped into this process.
+
+    bpf_map is a map fd or an object with an fd, such as a pylibbpf BpfMap;
+    value_type and max_entries must match the Array's declaration. values
+    is a memoryview of value_type items indexed like the map, which the
+    program's updates show up in immediately.
+    """
+
+    def __init__(self, bpf_map, value_type, max_entries, writable=True):
+        self.value_type = value_type
+        self.max_entries = max_entries
+        size = slot_size(value_type) * max_entries
+        length = -(-size // mmap.PAGESIZE) * mmap.PAGESIZE
+        prot = mmap.PROT_READ | (mmap.PROT_WRITE if writable else 0)
+        self.mmap = mmap.mmap(map_fd(bpf_map), length, mmap.MAP_SHARED, prot)
+        self.values = value_slots(memoryview(self.mmap)[:size], value_type)
+
+    def __len__(self):
+        return self.max_entries
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def __setitem__(self, index, value):
+        self.values[index] = value
+
+    def tolist(self) -> list:
+        return self.values.tolist()
+
+    def numpy(self):
+        """
+        Return the values as a NumPy array sharing the map's memory.
+
+        Needs numpy, which PythonBPF does not otherwise depend on.
+        """
+        try:
+            import numpy as np
+        except ImportError as e:
+            raise ImportError("ArrayView.numpy() needs numpy installed") from e
+
+        dtype = np.dtype(self.value_type)
+        raw = np.frombuffer(self.mmap, dtype=np.uint8)
+        slots = raw[: slot_size(self.value_type) * self.max_entries]
+        return slots.view(dtype)[:: slot_size(self.value_type) // dtype.itemsize]
+
+    def close(self):
+        self.values.release()
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,54 @@
+"""
+Named map flags, with the values linux/bpf.h gives them.
+
+The update flags are the third argument of update(); the BPF_F_* creation
+flags go in a map's map_flags= argument and can be combined with |.
+"""
+
+# update() flags
+BPF_ANY = 0  # create a new entry or overwrite an existing one
+BPF_NOEXIST = 1  # only create a new entry
+BPF_EXIST = 2  # only overwrite an existing entry
+
+# Map creation flags
+BPF_F_NO_PREALLOC = 1 << 0
+BPF_F_NO_COMMON_LRU = 1 << 1
+BPF_F_NUMA_NODE = 1 << 2
+BPF_F_RDONLY_PROG = 1 << 7
+BPF_F_WRONLY_PROG = 1 << 8
+BPF_F_MMAPABLE = 1 << 10
+
+UPDATE_FLAGS = {
+    "BPF_ANY": BPF_ANY,
+    "BPF_NOEXIST": BPF_NOEXIST,
+    "BPF_EXIST": BPF_EXIST,
+}
+MAP_FLAGS = {
+    "BPF_F_NO_PREALLOC": BPF_F_NO_PREALLOC,
+    "BPF_F_NO_COMMON_LRU": BPF_F_NO_COMMON_LRU,
+    "BPF_F_NUMA_NODE": BPF_F_NUMA_NODE,
+    "BPF_F_RDONLY_PROG": BPF_F_RDONLY_PROG,
+    "BPF_F_WRONLY_PROG": BPF_F_WRONLY_PROG,
+    "BPF_F_MMAPABLE": BPF_F_MMAPABLE,
+}
+
+
+def flags_value(node, names):
+    """
+    The value of a constant flags expression, or None if it is not one.
+
+    node is an int literal, a flag named in names, or flags joined with |.
+    """
+    # Only the compiler calls this; importing pythonbpf.maps stays cheap
+    import ast
+
+    if isinstance(node, ast.Constant) and type(node.value) is int:
+        return node.value
+    elif isinstance(node, ast.Name):
+        return names.get(node.id)
+    elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitOr):
+        left = flags_value(node.left, names)
+        right = flags_value(node.right, names)
+        if left is not None and right is not None:
+            return left | right
+    return None
@@ -0,0 +1,68 @@
+"""
+User-side loading of LpmTrie maps.
+
+An LpmTrie key is a host-order u32 prefix length followed by the address in
+network byte order, padded to the size of the key @struct. lpm_key() builds
+one from a CIDR string and load_cidrs() fills a trie from many of them.
+"""
+
+import struct
+
+PREFIXLEN = struct.Struct("=I")
+U64 = struct.Struct("=Q")
+
+
+def lpm_key(cidr, key_size=None) -> bytes:
+    """
+    Return the LpmTrie key of cidr, such as "10.0.0.0/8" or "2001:db8::/32".
+
+    A bare address is a full-length prefix. key_size is the size of the
+    map's key struct; by default the key is padded to the 4-byte alignment
+    of prefixlen, as the struct is (8 bytes for IPv4, 20 for IPv6).
+    """
+    # Only needed to load tries; importing pythonbpf.maps stays cheap
+    import socket
+
+    addr, sep, prefixlen = cidr.partition("/")
+    family = socket.AF_INET6 if ":" in addr else socket.AF_INET
+    try:
+        packed = socket.inet_pton(family, addr)
+    except OSError:
+        raise ValueError(f"Invalid address in {cidr!r}") from None
+    bits = len(packed) * 8
+    prefixlen = int(prefixlen) if sep else bits
+    if not 0 <= prefixlen <= bits:
+        raise ValueError(f"Prefix length of {cidr!r} is not between 0 and {bits}")
+
+    key = PREFIXLEN.pack(prefixlen) + packed
+    if key_size is None:
+        key_size = -(-len(key) // PREFIXLEN.size) * PREFIXLEN.size
+    if len(key) > key_size:
+        raise ValueError(f"Key of {cidr!r} does not fit in {key_size} bytes")
+    return key.ljust(key_size, b"\0")
+
+
+def load_cidrs(bpf_map, entries, value_type=None, key_size=None) -> int:
+    """
+    Insert every (cidr, value) of entries into a loaded LpmTrie.
+
+    entries is a dict or an iterable of pairs. Int values are packed as
+    value_type, a ctypes int type (c_uint64 by default); bytes are used as
+    is. All keys are built before the first update, so a malformed CIDR
+    leaves the map untouched. Returns the number of entries written.
+    """
+    if isinstance(entries, dict):
+        entries = entries.items()
+    pack = U64.pack
+    if value_type is not None:
+        pack = struct.Struct("=" + value_type._type_).pack
+
+    items = []
+    for cidr, value in entries:
+        if isinstance(value, int):
+            value = pack(value)
+        items.append((lpm_key(cidr, key_size), bytes(value)))
+
+    for key, value in items:
+        bpf_map.update(key, value)
+    return len(items)
@@ -1,9 +1,22 @@
 # This file provides type  and function hints only and does not actually give any functionality.
+from .flags import BPF_ANY, BPF_EXIST, BPF_NOEXIST
+
+
 class HashMap:
-    def __init__(self, key, value, max_entries):
+    """
+    A hash table of up to max_entries values.
+
+    map_flags takes BPF_F_* creation flags from pythonbpf.maps, such as
+    BPF_F_NO_PREALLOC to allocate entries on insert instead of up front;
+    numa_node places the map's memory on that NUMA node.
+    """
+
+    def __init__(self, key, value, max_entries, map_flags=0, numa_node=None):
         self.key = key
         self.value = value
         self.max_entries = max_entries
+        self.map_flags = map_flags
+        self.numa_node = numa_node
         self.entries = {}
 
     def lookup(self, key):
@@ -18,12 +31,93 @@ class HashMap:
         else:
             raise KeyError(f"Key {key} not found in map")
 
-    # TODO: define the flags that can be added
-    def update(self, key, value, flags=None):
-        if key in self.entries:
-            self.entries[key] = value
-        else:
+    def update(self, key, value, flags=BPF_ANY):
+        """
+        Set key to value.
+
+        flags is BPF_ANY to insert or overwrite, BPF_NOEXIST to only insert
+        a new key and BPF_EXIST to only overwrite an existing one.
+        """
+        if flags == BPF_NOEXIST and key in self.entries:
+            raise KeyError(f"Key {key} already in map")
+        if flags == BPF_EXIST and key not in self.entries:
             raise KeyError(f"Key {key} not found in map")
+        self.entries[key] = value
+
+
+class Array:
+    """
+    max_entries values indexed by a c_uint32, all preallocated and zeroed.
+
+    With mmapable=True user space can map the values into memory, see
+    pythonbpf.maps.ArrayView.
+    """
+
+    def __init__(self, value, max_entries, mmapable=False, map_flags=0, numa_node=None):
+        self.value = value
+        self.max_entries = max_entries
+        self.mmapable = mmapable
+        self.map_flags = map_flags
+        self.numa_node = numa_node
+        self.entries = [0] * max_entries
+
+    def lookup(self, key):
+        if 0 <= key < self.max_entries:
+            return self.entries[key]
+        return None
+
+    def update(self, key, value, flags=None):
+        if not 0 <= key < self.max_entries:
+            raise KeyError(f"Index {key} out of range")
+        self.entries[key] = value
+
+
+class PerCpuHash(HashMap):
+    """A HashMap with one copy of every value per CPU."""
+
+
+class LruHash(HashMap):
+    """
+    A HashMap that evicts its least recently used entries when full.
+
+    update() of a new key always succeeds, at the cost of an old key.
+    """
+
+
+class LruPerCpuHash(LruHash):
+    """An LruHash with one copy of every value per CPU."""
+
+
+class LpmTrie(HashMap):
+    """
+    A longest-prefix-match table, such as a routing table of CIDR ranges.
+
+    key is a @struct whose first field is `prefixlen: c_uint32`, followed by
+    the address bytes in network byte order. lookup() of a key whose
+    prefixlen covers the whole address returns the value of the longest
+    stored prefix matching it. Fill it from user space with load_cidrs().
+    """
+
+
+class PerCpuArray:
+    """max_entries values indexed by a c_uint32, with one copy per CPU."""
+
+    def __init__(self, value, max_entries, map_flags=0, numa_node=None):
+        self.value = value
+        self.max_entries = max_entries
+        self.map_flags = map_flags
+        self.numa_node = numa_node
+        self.entries = {}
+
+    def lookup(self, key):
+        if 0 <= key < self.max_entries:
+            return self.entries.get(key, 0)
+        return None
+
+    def update(self, key, value, flags=None):
+        if not 0 <= key < self.max_entries:
+            raise KeyError(f"Index {key} out of range")
+        self.entries[key] = value
 
 
 class PerfEventArray:
@@ -49,3 +143,10 @@ class RingBuf:
         pass
 
     # add discard, output and also give names to flags and stuff
+
+
+class ProgArray:
+    def __init__(self, max_entries, programs=None):
+        # programs are @bpf programs, loaded into slots 0, 1, ... by libbpf
+        self.max_entries = max_entries
+        self.programs = list(programs or [])
@@ -2,30 +2,31 @@ import ast
 from logging import Logger
 from llvmlite import ir
 from enum import Enum
+from .flags import (
+    BPF_F_MMAPABLE,
+    BPF_F_NO_PREALLOC,
+    BPF_F_NUMA_NODE,
+    MAP_FLAGS,
+    flags_value,
+)
 from .maps_utils import MapProcessorRegistry
 from ..debuginfo import DebugInfoGenerator
+from ..symbol_index import SymbolKind
+from ..type_deducer import CTYPES, ctypes_to_ir, is_int_ctype, is_signed
 import logging
 
 logger: Logger = logging.getLogger(__name__)
 
 
-def maps_proc(tree, module, chunks):
+def maps_proc(tree, module, symbols, structs_sym_tab=None):
     """Process all functions decorated with @map to find BPF maps"""
     map_sym_tab = {}
-    for func_node in chunks:
-        if is_map(func_node):
-            logger.info(f"Found BPF map: {func_node.name}")
-            map_sym_tab[func_node.name] = process_bpf_map(func_node, module)
+    for symbol in symbols.of_kind(SymbolKind.MAP):
+        logger.info(f"Found BPF map: {symbol.name}")
+        map_sym_tab[symbol.name] = process_bpf_map(symbol.node, module, structs_sym_tab)
     return map_sym_tab
 
 
-def is_map(func_node):
-    return any(
-        isinstance(decorator, ast.Name) and decorator.id == "map"
-        for decorator in func_node.decorator_list
-    )
-
-
 class BPFMapType(Enum):
     UNSPEC = 0
     HASH = 1
@@ -64,6 +65,30 @@ class BPFMapType(Enum):
     CGRP_STORAGE = 32
 
 
+# Map types whose values are private to each CPU
+PERCPU_MAP_TYPES = {
+    BPFMapType.PERCPU_HASH,
+    BPFMapType.PERCPU_ARRAY,
+    BPFMapType.LRU_PERCPU_HASH,
+}
+# Map definition members that hold a number, encoded like libbpf's __uint()
+UINT_MEMBERS = ("max_entries", "map_flags", "numa_node")
+
+# Map types described by create_map_debug_info, whose BTF declares int keys
+# and values as 8 bytes whatever their ctype
+U64_BTF_MAP_TYPES = {BPFMapType.HASH}
+
+# Map types indexed by a c_uint32 below max_entries
+ARRAY_MAP_TYPES = {BPFMapType.ARRAY, BPFMapType.PERCPU_ARRAY}
+# Most address bytes an LpmTrie key may hold after its prefixlen
+LPM_MAX_DATA_SIZE = 256
+# Map types the kernel always preallocates, so BPF_F_NO_PREALLOC is rejected
+PREALLOC_MAP_TYPES = ARRAY_MAP_TYPES | {
+    BPFMapType.LRU_HASH,
+    BPFMapType.LRU_PERCPU_HASH,
+}
+
+
 def create_bpf_map(module, map_name, map_params):
     """Create a BPF map in the module with given parameters and debug info"""
 
@@ -79,11 +104,114 @@ def create_bpf_map(module, map_name, map_params):
     map_global.initializer = ir.Constant(map_struct_type, None)
     map_global.section = ".maps"
     map_global.align = 8
+    # Read back by the helpers that need the key or value type
+    map_global.map_params = map_params
 
     logger.info(f"Created BPF map: {map_name} with params {map_params}")
     return map_global
 
 
+def map_slot_ctype(map_global, member):
+    """
+    The ctype of a map's "key" or "value" as BTF declares it, or None.
+
+    Map helpers read that many bytes through the key and value pointers,
+    so the stack slots behind them must have this type. None when the
+    member is not an int.
+    """
+    params = getattr(map_global, "map_params", {})
+    ctype = params.get(member)
+    if not is_int_ctype(ctype):
+        return None
+    if params.get("type") in U64_BTF_MAP_TYPES:
+        return "c_int64" if is_signed(ctype) else "c_uint64"
+    return ctype
+
+
+def map_value_type(map_global):
+    """The IR type of a map's value if it is a ctypes integer, else None."""
+    ctype = map_slot_ctype(map_global, "value")
+    return ctypes_to_ir(ctype) if ctype is not None else None
+
+
+def is_percpu_map(map_global):
+    """Whether every CPU has its own copy of the map's values."""
+    return getattr(map_global, "map_params", {}).get("type") in PERCPU_MAP_TYPES
+
+
+def is_array_map(map_global):
+    """Whether the map is an array, whose entries always exist."""
+    return getattr(map_global, "map_params", {}).get("type") in ARRAY_MAP_TYPES
+
+
+def is_prog_array(map_global):
+    """Whether the map is a ProgArray, which tail_call() jumps through."""
+    return getattr(map_global, "map_params", {}).get("type") is BPFMapType.PROG_ARRAY
+
+
+def ctype_debug_type(generator, ctype):
+    """The debug type of a map key or value; non-int types are described as u64."""
+    if is_int_ctype(ctype):
+        ir_type, signed = CTYPES[ctype]
+        return generator.get_int_type(ir_type.width, signed)
+    return generator.get_uint64_type()
+
+
+def struct_debug_type(generator, struct_type):
+    """The debug type of a @struct, laid out like its IR type."""
+    elements_arr = []
+    for name, ftype in struct_type.fields.items():
+        if isinstance(ftype, ir.ArrayType):
+            base = generator.get_int_type(ftype.element.width, False)
+            debug_type = generator.create_array_type(base, ftype.count)
+        else:
+            debug_type = ctype_debug_type(generator, struct_type.ctypes.get(name))
+        offset = struct_type.offsets[name] * 8
+        elements_arr.append(generator.create_struct_member(name, debug_type, offset))
+    return generator.create_struct_type(
+        elements_arr, struct_type.abi_size * 8, is_distinct=True, name=struct_type.name
+    )
+
+
+def create_typed_map_debug_info(
+    module, map_global, map_name, map_params, structs_sym_tab=None
+):
+    """
+    Generate debug info metadata for a map with key and value types.
+
+    Unlike create_map_debug_info, the key and value members point at their
+    actual types, so BTF gives the kernel the right key and value sizes.
+    """
+    generator = DebugInfoGenerator(module)
+    structs_sym_tab = structs_sym_tab or {}
+
+    int_type = generator.get_int32_type()
+    members = {"type": generator.create_array_type(int_type, map_params["type"].value)}
+    for name in ("key", "value"):
+        ctype = map_params[name]
+        if ctype in structs_sym_tab:
+            members[name] = struct_debug_type(generator, structs_sym_tab[ctype])
+        else:
+            members[name] = ctype_debug_type(generator, ctype)
+    for name in UINT_MEMBERS:
+        if name in map_params:
+            members[name] = generator.create_array_type(int_type, map_params[name])
+
+    elements_arr = []
+    for offset, name in enumerate(map_params):
+        ptr = generator.create_pointer_type(members[name], 64)
+        elements_arr.append(generator.create_struct_member(name, ptr, offset * 64))
+
+    struct_type = generator.create_struct_type(
+        elements_arr, 64 * len(elements_arr), is_distinct=True
+    )
+    global_var = generator.create_global_var_debug_info(
+        map_name, struct_type, is_local=False
+    )
+    map_global.set_metadata("dbg", global_var)
+    return global_var
+
+
 def create_map_debug_info(module, map_global, map_name, map_params):
     """Generate debug info metadata for BPF maps HASH and PERF_EVENT_ARRAY"""
     generator = DebugInfoGenerator(module)
@@ -107,7 +235,7 @@ def create_map_debug_info(module, map_global, map_name, map_params):
     # scope field does not appear for some reason
     cnt = 0
     for elem in map_params:
-        if elem == "max_entries":
+        if elem in UINT_MEMBERS:
             continue
         if elem == "type":
             ptr = type_ptr
@@ -120,15 +248,13 @@ def create_map_debug_info(module, map_global, map_name, map_params):
         elements_arr.append(member)
         cnt += 1
 
-    if "max_entries" in map_params:
-        max_entries_array = generator.create_array_type(
-            uint_type, map_params["max_entries"]
-        )
-        max_entries_ptr = generator.create_pointer_type(max_entries_array, 64)
-        max_entries_member = generator.create_struct_member(
-            "max_entries", max_entries_ptr, cnt * 64
-        )
-        elements_arr.append(max_entries_member)
+    for name in UINT_MEMBERS:
+        if name not in map_params:
+            continue
+        uint_array = generator.create_array_type(uint_type, map_params[name])
+        uint_ptr = generator.create_pointer_type(uint_array, 64)
+        elements_arr.append(generator.create_struct_member(name, uint_ptr, cnt * 64))
+        cnt += 1
 
     # Create the struct type
     struct_type = generator.create_struct_type(
@@ -176,7 +302,7 @@ def create_ringbuf_debug_info(module, map_global, map_name, map_params):
 
 
 @MapProcessorRegistry.register("RingBuf")
-def process_ringbuf_map(map_name, rval, module):
+def process_ringbuf_map(map_name, rval, module, structs_sym_tab=None):
     """Process a BPF_RINGBUF map declaration"""
     logger.info(f"Processing Ringbuf: {map_name}")
     map_params = {"type": BPFMapType.RINGBUF}
@@ -201,7 +327,7 @@ def process_ringbuf_map(map_name, rval, module):
 
 
 @MapProcessorRegistry.register("HashMap")
-def process_hash_map(map_name, rval, module):
+def process_hash_map(map_name, rval, module, structs_sym_tab=None):
     """Process a BPF_HASH map declaration"""
     logger.info(f"Processing HashMap: {map_name}")
     map_params = {"type": BPFMapType.HASH}
@@ -225,7 +351,10 @@ def process_hash_map(map_name, rval, module):
             const_val = keyword.value.value
             if isinstance(const_val, (int, str)):
                 map_params["max_entries"] = const_val
+        elif keyword.arg in ("map_flags", "numa_node"):
+            add_creation_param(map_name, map_params, keyword.arg, keyword.value)
 
+    check_map_flags(map_name, map_params)
     logger.info(f"Map parameters: {map_params}")
     map_global = create_bpf_map(module, map_name, map_params)
     # Generate debug info for BTF
@@ -233,8 +362,220 @@ def process_hash_map(map_name, rval, module):
     return map_global
 
 
+def add_creation_param(map_name, map_params, name, node):
+    """
+    Record a map_flags= or numa_node= argument in map_params.
+
+    map_flags takes BPF_F_* flags joined with |; a numa_node also sets
+    BPF_F_NUMA_NODE, without which the kernel ignores it.
+    """
+    if name == "map_flags":
+        value = flags_value(node, MAP_FLAGS)
+        if value is None:
+            raise ValueError(
+                f"map_flags of map {map_name} must be BPF_F_* flags or an int"
+            )
+    else:
+        if not (isinstance(node, ast.Constant) and type(node.value) is int):
+            raise ValueError(f"numa_node of map {map_name} must be an int")
+        map_params["numa_node"] = node.value
+        value = BPF_F_NUMA_NODE
+    map_params["map_flags"] = map_params.get("map_flags", 0) | value
+
+
+def check_map_flags(map_name, map_params):
+    """Reject map_flags the kernel would refuse for the map's type at load."""
+    flags = map_params.get("map_flags", 0)
+    if flags & BPF_F_NO_PREALLOC and map_params["type"] in PREALLOC_MAP_TYPES:
+        raise ValueError(
+            f"Map {map_name} of type {map_params['type'].name} is always "
+            "preallocated, so it cannot take BPF_F_NO_PREALLOC"
+        )
+
+
+def check_lpm_key(map_name, key, structs_sym_tab):
+    """
+    Check that an LpmTrie key is a @struct the kernel accepts.
+
+    Its first field must be a c_uint32 prefixlen, followed by 1 to
+    LPM_MAX_DATA_SIZE bytes of address data in network byte order.
+    """
+    struct_type = structs_sym_tab.get(key)
+    if struct_type is None:
+        raise ValueError(f"Key of LpmTrie {map_name} must be a @struct, not {key}")
+    first = next(iter(struct_type.fields), None)
+    if first != "prefixlen" or struct_type.ctypes.get(first) != "c_uint32":
+        raise ValueError(
+            f"Key {key} of LpmTrie {map_name} must start with prefixlen: c_uint32"
+        )
+    # The kernel takes the key size from BTF, and the data after prefixlen
+    # sets the longest prefix the trie holds
+    data_size = struct_type.abi_size - 4
+    if not 1 <= data_size <= LPM_MAX_DATA_SIZE:
+        raise ValueError(
+            f"Key {key} of LpmTrie {map_name} has {data_size} bytes of data, "
+            f"expected 1 to {LPM_MAX_DATA_SIZE}"
+        )
+    logger.info(
+        f"LpmTrie {map_name} keys hold {data_size} bytes, prefixes up to "
+        f"{data_size * 8} bits"
+    )
+
+
+def map_args(rval, positional):
+    """
+    Return {name: node} for the arguments of a map constructor.
+
+    positional names the parameters the positional arguments bind to.
+    """
+    args = dict(zip(positional, rval.args))
+    args.update((keyword.arg, keyword.value) for keyword in rval.keywords)
+    return args
+
+
+def typed_map_params(map_name, rval, map_type, positional, flags=None, **defaults):
+    """
+    Parse the key, value, max_entries and creation flags of a map constructor.
+
+    flags maps boolean keyword arguments to the map_flags bit they set.
+    """
+    flags = flags or {}
+    map_params = {"type": map_type, **defaults}
+    for name, node in map_args(rval, positional).items():
+        if name in ("key", "value") and isinstance(node, ast.Name):
+            map_params[name] = node.id
+        elif name == "max_entries" and isinstance(node, ast.Constant):
+            map_params[name] = node.value
+        elif name in flags and isinstance(node, ast.Constant):
+            if node.value:
+                map_params["map_flags"] = map_params.get("map_flags", 0) | flags[name]
+        elif name in ("map_flags", "numa_node"):
+            add_creation_param(map_name, map_params, name, node)
+        else:
+            raise ValueError(f"Unsupported argument {name} of map {map_name}")
+    for name in ("key", "value"):
+        if name not in map_params:
+            raise ValueError(f"Map {map_name} needs a {name} type")
+    check_map_flags(map_name, map_params)
+    return map_params
+
+
+@MapProcessorRegistry.register("PerCpuHash")
+def process_percpu_hash_map(map_name, rval, module, structs_sym_tab=None):
+    """Process a BPF_PERCPU_HASH map declaration"""
+    logger.info(f"Processing PerCpuHash: {map_name}")
+    map_params = typed_map_params(
+        map_name,
+        rval,
+        BPFMapType.PERCPU_HASH,
+        ("key", "value", "max_entries"),
+    )
+    logger.info(f"Map parameters: {map_params}")
+    map_global = create_bpf_map(module, map_name, map_params)
+    create_typed_map_debug_info(
+        module, map_global, map_name, map_params, structs_sym_tab
+    )
+    return map_global
+
+
+@MapProcessorRegistry.register("LruHash")
+def process_lru_hash_map(map_name, rval, module, structs_sym_tab=None):
+    """Process a BPF_LRU_HASH map declaration"""
+    logger.info(f"Processing LruHash: {map_name}")
+    map_params = typed_map_params(
+        map_name,
+        rval,
+        BPFMapType.LRU_HASH,
+        ("key", "value", "max_entries"),
+    )
+    logger.info(f"Map parameters: {map_params}")
+    map_global = create_bpf_map(module, map_name, map_params)
+    create_typed_map_debug_info(
+        module, map_global, map_name, map_params, structs_sym_tab
+    )
+    return map_global
+
+
+@MapProcessorRegistry.register("LruPerCpuHash")
+def process_lru_percpu_hash_map(map_name, rval, module, structs_sym_tab=None):
+    """Process a BPF_LRU_PERCPU_HASH map declaration"""
+    logger.info(f"Processing LruPerCpuHash: {map_name}")
+    map_params = typed_map_params(
+        map_name,
+        rval,
+        BPFMapType.LRU_PERCPU_HASH,
+        ("key", "value", "max_entries"),
+    )
+    logger.info(f"Map parameters: {map_params}")
+    map_global = create_bpf_map(module, map_name, map_params)
+    create_typed_map_debug_info(
+        module, map_global, map_name, map_params, structs_sym_tab
+    )
+    return map_global
+
+
+@MapProcessorRegistry.register("LpmTrie")
+def process_lpm_trie_map(map_name, rval, module, structs_sym_tab=None):
+    """Process a BPF_LPM_TRIE map declaration, keyed by a prefixlen @struct"""
+    logger.info(f"Processing LpmTrie: {map_name}")
+    map_params = typed_map_params(
+        map_name,
+        rval,
+        BPFMapType.LPM_TRIE,
+        ("key", "value", "max_entries"),
+    )
+    check_lpm_key(map_name, map_params["key"], structs_sym_tab or {})
+    # The kernel only creates tries that allocate nodes on insert
+    map_params["map_flags"] = map_params.get("map_flags", 0) | BPF_F_NO_PREALLOC
+    logger.info(f"Map parameters: {map_params}")
+    map_global = create_bpf_map(module, map_name, map_params)
+    create_typed_map_debug_info(
+        module, map_global, map_name, map_params, structs_sym_tab
+    )
+    return map_global
+
+
+@MapProcessorRegistry.register("PerCpuArray")
+def process_percpu_array_map(map_name, rval, module, structs_sym_tab=None):
+    """Process a BPF_PERCPU_ARRAY map declaration, indexed by a c_uint32"""
+    logger.info(f"Processing PerCpuArray: {map_name}")
+    map_params = typed_map_params(
+        map_name,
+        rval,
+        BPFMapType.PERCPU_ARRAY,
+        ("value", "max_entries"),
+        key="c_uint32",
+    )
+    logger.info(f"Map parameters: {map_params}")
+    map_global = create_bpf_map(module, map_name, map_params)
+    create_typed_map_debug_info(
+        module, map_global, map_name, map_params, structs_sym_tab
+    )
+    return map_global
+
+
+@MapProcessorRegistry.register("Array")
+def process_array_map(map_name, rval, module, structs_sym_tab=None):
+    """Process a BPF_ARRAY map declaration, indexed by a c_uint32"""
+    logger.info(f"Processing Array: {map_name}")
+    map_params = typed_map_params(
+        map_name,
+        rval,
+        BPFMapType.ARRAY,
+        ("value", "max_entries", "mmapable"),
+        flags={"mmapable": BPF_F_MMAPABLE},
+        key="c_uint32",
+    )
+    logger.info(f"Map parameters: {map_params}")
+    map_global = create_bpf_map(module, map_name, map_params)
+    create_typed_map_debug_info(
+        module, map_global, map_name, map_params, structs_sym_tab
+    )
+    return map_global
+
+
 @MapProcessorRegistry.register("PerfEventArray")
-def process_perf_event_map(map_name, rval, module):
+def process_perf_event_map(map_name, rval, module, structs_sym_tab=None):
     """Process a BPF_PERF_EVENT_ARRAY map declaration"""
     logger.info(f"Processing PerfEventArray: {map_name}")
     map_params = {"type": BPFMapType.PERF_EVENT_ARRAY}
@@ -257,7 +598,157 @@ def process_perf_event_map(map_name, rval, module):
     return map_global
 
 
-def process_bpf_map(func_node, module):
+def create_prog_array_debug_info(module, map_global, map_name, map_params):
+    """
+    Generate debug information metadata for a BPF PROG_ARRAY map.
+
+    The trailing `values` member mirrors libbpf's `__array(values, int (void *))`,
+    which lets the loader fill the array from the map's initializer.
+    """
+    generator = DebugInfoGenerator(module)
+
+    int_type = generator.get_int32_type()
+    elements_arr = []
+    for offset, name in enumerate(("type", "max_entries", "key_size", "value_size")):
+        value = map_params[name]
+        array = generator.create_array_type(
+            int_type, value.value if isinstance(value, BPFMapType) else value
+        )
+        ptr = generator.create_pointer_type(array, 64)
+        elements_arr.append(generator.create_struct_member(name, ptr, offset * 64))
+
+    prog_type = generator.create_subroutine_type(
+        int_type, [generator.create_pointer_type(None, 64)]
+    )
+    values = generator.create_flexible_array_type(
+        generator.create_pointer_type(prog_type, 64)
+    )
+    elements_arr.append(generator.create_struct_member("values", values, 4 * 64))
+
+    struct_type = generator.create_struct_type(elements_arr, 4 * 64, is_distinct=True)
+
+    global_var = generator.create_global_var_debug_info(
+        map_name, struct_type, is_local=False
+    )
+    map_global.set_metadata("dbg", global_var)
+    return global_var
+
+
+def create_scratch_map(module, map_name, value_size):
+    """
+    Create a hidden single-entry PERCPU_ARRAY with value_size byte values.
+
+    Functions keep locals too large for the BPF stack in its one entry. The
+    value is described as an array of u32 in BTF, which is all the kernel
+    needs to size it.
+    """
+    map_params = {
+        "type": BPFMapType.PERCPU_ARRAY,
+        "max_entries": 1,
+        "key": "c_uint32",
+        "value_size": value_size,
+    }
+    map_global = create_bpf_map(module, map_name, map_params)
+
+    generator = DebugInfoGenerator(module)
+    int_type = generator.get_int32_type()
+    uint_type = generator.get_uint32_type()
+    elements_arr = []
+    for offset, (name, member_type) in enumerate(
+        (
+            ("type", generator.create_array_type(int_type, map_params["type"].value)),
+            ("max_entries", generator.create_array_type(int_type, 1)),
+            ("key", uint_type),
+            ("value", generator.create_array_type(uint_type, -(-value_size // 4))),
+        )
+    ):
+        ptr = generator.create_pointer_type(member_type, 64)
+        elements_arr.append(generator.create_struct_member(name, ptr, offset * 64))
+
+    struct_type = generator.create_struct_type(elements_arr, 4 * 64, is_distinct=True)
+    global_var = generator.create_global_var_debug_info(
+        map_name, struct_type, is_local=False
+    )
+    map_global.set_metadata("dbg", global_var)
+    return map_global
+
+
+@MapProcessorRegistry.register("ProgArray")
+def process_prog_array_map(map_name, rval, module, structs_sym_tab=None):
+    """Process a BPF_PROG_ARRAY map declaration"""
+    logger.info(f"Processing ProgArray: {map_name}")
+    map_params = {"type": BPFMapType.PROG_ARRAY, "key_size": 4, "value_size": 4}
+    programs = []
+
+    # Assuming order: max_entries, programs
+    args = dict(zip(("max_entries", "programs"), rval.args))
+    args.update((keyword.arg, keyword.value) for keyword in rval.keywords)
+    if isinstance(args.get("max_entries"), ast.Constant):
+        map_params["max_entries"] = args["max_entries"].value
+    if isinstance(args.get("programs"), (ast.List, ast.Tuple)):
+        for elt in args["programs"].elts:
+            if not isinstance(elt, ast.Name):
+                raise ValueError(f"ProgArray {map_name} programs must be @bpf programs")
+            programs.append(elt.id)
+    map_params.setdefault("max_entries", len(programs))
+    if len(programs) > map_params["max_entries"]:
+        raise ValueError(
+            f"ProgArray {map_name} lists {len(programs)} programs but has "
+            f"max_entries={map_params['max_entries']}"
+        )
+
+    logger.info(f"ProgArray parameters: {map_params}, programs {programs}")
+
+    # type, max_entries, key_size, value_size, then one slot per program
+    map_struct_type = ir.LiteralStructType(
+        [ir.PointerType() for _ in range(4)]
+        + [ir.ArrayType(ir.PointerType(), len(programs))]
+    )
+    map_global = ir.GlobalVariable(module, map_struct_type, name=map_name)
+    map_global.linkage = "dso_local"
+    map_global.global_constant = False
+    map_global.initializer = ir.Constant(map_struct_type, None)
+    map_global.section = ".maps"
+    map_global.align = 8
+    map_global.map_params = map_params
+    # Filled in by init_prog_array_slots once the programs are declared
+    map_global.prog_array_programs = programs
+
+    create_prog_array_debug_info(module, map_global, map_name, map_params)
+    return map_global
+
+
+def init_prog_array_slots(module, map_sym_tab, program_names):
+    """
+    Point every ProgArray's initial slots at the programs it lists.
+
+    The programs must already be declared in module; program_names are the
+    names of the @section functions, the only ones a tail call can enter.
+
+    libbpf turns the relocations against these slots into program fds when
+    the object is loaded, so the array is populated without any loader code.
+    """
+    for map_name, map_global in map_sym_tab.items():
+        programs = getattr(map_global, "prog_array_programs", None)
+        if not programs:
+            continue
+        slots = []
+        for name in programs:
+            func = module.globals.get(name)
+            if name not in program_names or not isinstance(func, ir.Function):
+                raise ValueError(
+                    f"ProgArray {map_name} entry {name} is not a @bpf program "
+                    "with a @section"
+                )
+            slots.append(func)
+        struct_type = map_global.value_type
+        null = ir.Constant(ir.PointerType(), None)
+        map_global.initializer = ir.Constant(
+            struct_type, [null] * 4 + [ir.Constant(struct_type.elements[4], slots)]
+        )
+
+
+def process_bpf_map(func_node, module, structs_sym_tab=None):
     """Process a BPF map (a function decorated with @map)"""
     map_name = func_node.name
     logger.info(f"Processing BPF map: {map_name}")
@@ -276,9 +767,9 @@ def process_bpf_map(func_node, module):
     if isinstance(rval, ast.Call) and isinstance(rval.func, ast.Name):
         handler = MapProcessorRegistry.get_processor(rval.func.id)
         if handler:
-            return handler(map_name, rval, module)
+            return handler(map_name, rval, module, structs_sym_tab)
         else:
             logger.warning(f"Unknown map type {rval.func.id}, defaulting to HashMap")
-            return process_hash_map(map_name, rval, module)
+            return process_hash_map(map_name, rval, module, structs_sym_tab)
     else:
         raise ValueError("Function under @map must return a map")
@@ -0,0 +1,124 @@
+"""
+User-side reading of PerCpuHash and PerCpuArray values.
+
+A lookup of a per-CPU map from user space returns one value per possible
+CPU, each padded to 8 bytes. The helpers here decode that buffer with a
+single memoryview cast and reduce it with the C-level sum/min/max, so
+reading a map on a many-core machine never loops over CPUs in Python.
+"""
+
+import struct
+
+POSSIBLE_CPUS_PATH = "/sys/devices/system/cpu/possible"
+
+REDUCERS = {"sum": sum, "min": min, "max": max}
+
+
+def possible_cpus(path=POSSIBLE_CPUS_PATH) -> int:
+    """Number of CPUs the kernel sizes per-CPU values for, e.g. "0-7" is 8."""
+    with open(path) as f:
+        ranges = f.read().strip()
+    last = 0
+    for part in ranges.split(","):
+        last = max(last, int(part.split("-")[-1]))
+    # Per-CPU buffers have a slot for every id up to the highest possible CPU
+    return last + 1
+
+
+def slot_size(value_type) -> int:
+    """Bytes the kernel gives each value of value_type: its size rounded up to 8."""
+    return -(-struct.calcsize(value_type._type_) // 8) * 8
+
+
+def value_slots(buf, value_type):
+    """
+    Return a memoryview of the values in buf, one per 8-byte aligned slot.
+
+    value_type is a ctypes int type such as c_uint64. The view shares buf's
+    memory, so it is writable when buf is.
+    """
+    fmt = value_type._type_
+    stride = slot_size(value_type)
+    view = memoryview(buf).cast("B")
+    if len(view) % stride:
+        raise ValueError(
+            f"Buffer of {len(view)} bytes is not a whole number of {stride} byte slots"
+        )
+    return view.cast(fmt)[:: stride // struct.calcsize(fmt)]
+
+
+def percpu_view(raw, value_type, ncpus=None):
+    """
+    Return a memoryview of the per-CPU values in raw.
+
+    raw is the buffer a per-CPU map lookup returns and value_type the map's
+    ctypes int value type, such as c_uint64.
+    """
+    values = value_slots(raw, value_type)
+    if ncpus is not None:
+        values = values[:ncpus]
+    return values
+
+
+def percpu_values(raw, value_type, ncpus=None) -> list:
+    """Return the value of every CPU in raw as a list of ints."""
+    return percpu_view(raw, value_type, ncpus).tolist()
+
+
+def reducer(how):
+    if how not in REDUCERS:
+        raise ValueError(f"Unknown reduction {how!r}, expected one of {list(REDUCERS)}")
+    return REDUCERS[how]
+
+
+def reduce_percpu(raw, value_type, how="sum", ncpus=None) -> int:
+    """Combine the per-CPU values in raw with how: "sum", "min" or "max"."""
+    return reducer(how)(percpu_view(raw, value_type, ncpus))
+
+
+class PerCpuReader:
+    """
+    Read a loaded per-CPU map through a pylibbpf BpfMap.
+
+    bpf_map.lookup() is expected to return the raw per-CPU buffer; a list
+    of per-CPU values is used as is.
+    """
+
+    def __init__(self, bpf_map, value_type, ncpus=None):
+        self.bpf_map = bpf_map
+        self.value_type = value_type
+        self.ncpus = ncpus if ncpus is not None else possible_cpus()
+
+    def values(self, key) -> list:
+        """The value of key on every CPU, or None if key is missing."""
+        raw = self.bpf_map.lookup(key)
+        if raw is None:
+            return None
+        if isinstance(raw, (list, tuple)):
+            return list(raw[: self.ncpus])
+        return percpu_values(raw, self.value_type, self.ncpus)
+
+    def reduce(self, key, how="sum"):
+        """The per-CPU values of key combined with how, or None if missing."""
+        raw = self.bpf_map.lookup(key)
+        if raw is None:
+            return None
+        if isinstance(raw, (list, tuple)):
+            return reducer(how)(raw[: self.ncpus])
+        return reduce_percpu(raw, self.value_type, how, self.ncpus)
+
+    def sum(self, key):
+        return self.reduce(key, "sum")
+
+    def min(self, key):
+        return self.reduce(key, "min")
+
+    def max(self, key):
+        return self.reduce(key, "max")
+
+    def items(self, how="sum"):
+        """Yield (key, reduced value) for every key in the map."""
+        for key in self.bpf_map.keys():
+            value = self.reduce(key, how)
+            if value is not None:
+                yield key, value
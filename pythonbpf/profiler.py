@@ -0,0 +1,115 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+from llvmlite import ir
+
+from .stack_frame import frame_size
+
+
+def count_instructions(func: ir.Function):
+    """Count the blocks, instructions, allocas and stack bytes of a function."""
+    instructions = allocas = 0
+    for block in func.blocks:
+        instructions += len(block.instructions)
+        allocas += sum(
+            isinstance(instr, ir.AllocaInstr) for instr in block.instructions
+        )
+    return {
+        "blocks": len(func.blocks),
+        "instructions": instructions,
+        "allocas": allocas,
+        "stack_bytes": frame_size(func),
+    }
+
+
+class CompileProfile:
+    """
+    Wall-clock time spent in each compiler phase and each @bpf function of one
+    compilation, along with the size of the IR emitted for every function.
+    """
+
+    def __init__(self, filename=None, version=None, opt_level=None):
+        self.filename = filename
+        self.version = version
+        self.opt_level = opt_level
+        self.phases = {}
+        self.functions = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_timings(self, timings):
+        """Merge a backend timings dict (see backend.emit_object)."""
+        for name, seconds in timings.items():
+            self.add_phase(name, seconds)
+
+    def record_function(self, func: ir.Function, seconds):
+        self.functions[func.name] = {"seconds": seconds, **count_instructions(func)}
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+    def to_dict(self):
+        return {
+            "filename": self.filename,
+            "version": self.version,
+            "opt_level": self.opt_level,
+            "total_seconds": self.total,
+            "phases": dict(self.phases),
+            "functions": {name: dict(info) for name, info in self.functions.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        profile = cls(data["filename"], data["version"], data["opt_level"])
+        profile.phases = dict(data["phases"])
+        profile.functions = {
+            name: dict(info) for name, info in data["functions"].items()
+        }
+        return profile
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            f.write(self.to_json())
+            f.write("\n")
+
+    def format(self):
+        """Render the profile as a plain text table."""
+        lines = [f"Compile profile for {self.filename} (-O{self.opt_level})"]
+        lines.append(f"  {'phase':<24}{'ms':>10}")
+        for name, seconds in self.phases.items():
+            lines.append(f"  {name:<24}{seconds * 1000:>10.2f}")
+        lines.append(f"  {'total':<24}{self.total * 1000:>10.2f}")
+        if self.functions:
+            lines.append(
+                f"  {'function':<24}{'ms':>10}{'blocks':>8}{'instrs':>8}"
+                f"{'allocas':>9}{'stack':>7}"
+            )
+            for name, info in self.functions.items():
+                lines.append(
+                    f"  {name:<24}{info['seconds'] * 1000:>10.2f}"
+                    f"{info['blocks']:>8}{info['instructions']:>8}{info['allocas']:>9}"
+                    f"{info.get('stack_bytes', 0):>7}"
+                )
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.format()
+
+
+def phase(profile, name):
+    """Time a block into profile; a no-op when profiling is off."""
+    return profile.phase(name) if profile is not None else nullcontext()
@@ -0,0 +1,286 @@
+import ast
+import logging
+from itertools import count
+
+from llvmlite import ir
+
+from pythonbpf.structs.structs_pass import calc_struct_size
+
+logger = logging.getLogger(__name__)
+
+# Size of the stack the verifier gives every BPF program
+BPF_STACK_LIMIT = 512
+# Struct locals are moved to the scratch map until the ones left on the stack
+# take at most this much, which leaves the rest for scalars and temporaries
+SCRATCH_STACK_SHARE = BPF_STACK_LIMIT // 2
+
+
+def type_size(ir_type):
+    """Size in bytes of a stack slot holding ir_type."""
+    if isinstance(ir_type, ir.IntType):
+        return max(ir_type.width // 8, 1)
+    elif isinstance(ir_type, ir.PointerType):
+        return 8
+    elif isinstance(ir_type, ir.ArrayType):
+        return ir_type.count * type_size(ir_type.element)
+    elif isinstance(ir_type, ir.LiteralStructType):
+        return calc_struct_size(list(ir_type.elements))
+    raise TypeError(f"Unsupported stack slot type: {ir_type}")
+
+
+def type_align(ir_type):
+    if isinstance(ir_type, ir.ArrayType):
+        return type_align(ir_type.element)
+    elif isinstance(ir_type, ir.LiteralStructType):
+        return 8
+    return min(type_size(ir_type), 8)
+
+
+def entry_alloca(builder, ir_type, name=""):
+    """
+    Allocate ir_type in the entry block through builder and return it.
+
+    BPF cannot do dynamic stack allocation, so every alloca goes in the
+    entry block, after the allocas already there. builder is put back where
+    it was; a second builder would leave its position stale.
+    """
+    block = builder.block
+    following = (
+        block.instructions[builder._anchor]
+        if builder._anchor < len(block.instructions)
+        else None
+    )
+    entry = block.parent.entry_basic_block
+    for instr in entry.instructions:
+        if not isinstance(instr, ir.AllocaInstr):
+            builder.position_before(instr)
+            break
+    else:
+        builder.position_at_end(entry)
+    var = builder.alloca(ir_type, name=name)
+    var.align = type_align(ir_type)
+    if following is not None:
+        builder.position_before(following)
+    else:
+        builder.position_at_end(block)
+    return var
+
+
+def frame_allocas(func):
+    """Yield (alloca, offset, size) in frame order for every alloca in func."""
+    offset = 0
+    for block in func.blocks:
+        for instr in block.instructions:
+            if not isinstance(instr, ir.AllocaInstr):
+                continue
+            size = type_size(instr.allocated_type)
+            align = instr.align or type_align(instr.allocated_type)
+            offset += (align - offset % align) % align
+            yield instr, offset, size
+            offset += size
+
+
+def frame_size(func):
+    """Bytes of stack used by the allocas of func."""
+    return max((offset + size for _, offset, size in frame_allocas(func)), default=0)
+
+
+def live_ranges(body):
+    """
+    Return {name: (first, last)} statement indices for every name in body.
+
+    Statements are numbered in source order, with an if's or loop's header
+    before its body. A name is treated as live from its first to its last
+    mention, which is conservative across branches: a local that is only
+    used inside one branch does not overlap a local only used in the other.
+    Names mentioned in a loop are live for the whole loop.
+    """
+    ranges = {}
+    counter = count()
+
+    def mention(name, first, last):
+        old_first, old_last = ranges.get(name, (first, last))
+        ranges[name] = (min(old_first, first), max(old_last, last))
+
+    def visit(stmts):
+        for stmt in stmts:
+            index = next(counter)
+            if isinstance(stmt, (ast.If, ast.While)):
+                headers = [stmt.test]
+            elif isinstance(stmt, ast.For):
+                headers = [stmt.target, stmt.iter]
+            else:
+                headers = [stmt]
+            for node in headers:
+                for sub in ast.walk(node):
+                    if isinstance(sub, ast.Name):
+                        mention(sub.id, index, index)
+            if isinstance(stmt, (ast.If, ast.For, ast.While)):
+                visit(stmt.body)
+                visit(stmt.orelse)
+            if isinstance(stmt, (ast.For, ast.While)):
+                end = next(counter)
+                for sub in ast.walk(stmt):
+                    if isinstance(sub, ast.Name):
+                        mention(sub.id, index, end)
+
+    visit(body)
+    return ranges
+
+
+def plan_scratch(sizes, budget=SCRATCH_STACK_SHARE):
+    """
+    Return the locals to keep in the scratch map instead of on the stack.
+
+    sizes maps local names to their size in bytes. Locals over budget always
+    move; after that the largest move until the rest fit in budget.
+    """
+    moved = []
+    remaining = sum(sizes.values())
+    for name, size in sorted(sizes.items(), key=lambda item: (-item[1], item[0])):
+        if size <= budget and remaining <= budget:
+            break
+        moved.append(name)
+        remaining -= size
+    return moved
+
+
+class StackFrame:
+    """
+    Stack slots of one @bpf function.
+
+    Locals of the same type share a slot when their live ranges do not
+    overlap, so a function only pays for the locals that are live at once.
+    Struct locals too large for the stack live in a per-CPU scratch map.
+    """
+
+    def __init__(self, func_name, body, params=()):
+        self.func_name = func_name
+        self.ranges = live_ranges(body)
+        # Parameters are stored to their slots on entry, before any statement
+        for name in params:
+            _, last = self.ranges.get(name, (-1, -1))
+            self.ranges[name] = (-1, last)
+        self.slots = {}  # name -> alloca
+        self.owners = {}  # alloca -> [names]
+        self.scratch = {}  # name -> pointer into the scratch map value
+
+    def _overlaps(self, name, other):
+        unbounded = (0, float("inf"))
+        first, last = self.ranges.get(name, unbounded)
+        other_first, other_last = self.ranges.get(other, unbounded)
+        return first <= other_last and other_first <= last
+
+    def alloca(self, builder, name, ir_type, align=None):
+        """Return the slot for name, reusing a dead local's slot if possible."""
+        if name in self.scratch:
+            return self.scratch[name]
+        var = self.slots.get(name)
+        if var is not None and var.allocated_type == ir_type:
+            return var
+
+        for var, names in self.owners.items():
+            if var.allocated_type != ir_type:
+                continue
+            if not any(self._overlaps(name, other) for other in names):
+                logger.info(f"{name} reuses the stack slot of {', '.join(names)}")
+                names.append(name)
+                self.slots[name] = var
+                return var
+
+        entry = builder.block.parent.entry_basic_block
+        if builder.block is not entry:
+            # In the entry block, BPF cannot do dynamic stack allocation
+            builder = ir.IRBuilder(entry)
+            builder.position_at_start(entry)
+        var = builder.alloca(ir_type, name=name)
+        if align is not None:
+            var.align = align
+        self.slots[name] = var
+        self.owners[var] = [name]
+        return var
+
+    def move_to_scratch(self, builder, module, local_types):
+        """
+        Keep the largest struct locals in a per-CPU scratch map.
+
+        local_types maps struct locals to their IR types; plan_scratch picks
+        which of them move. The function looks up the map's single entry
+        once, at builder, and returns 0 if that fails, which it cannot for
+        an array. builder is left after the check, where the locals are
+        pointers into the entry. Each function gets its own map, so a
+        program and the helper functions it calls do not share a buffer.
+        """
+        # delayed import to avoid circular dependency
+        from pythonbpf.helper import emit_map_lookup
+        from pythonbpf.maps.maps_pass import create_scratch_map
+
+        moved = plan_scratch(
+            {name: type_size(ir_type) for name, ir_type in local_types.items()}
+        )
+        if not moved:
+            return
+
+        value_type = ir.LiteralStructType([local_types[name] for name in moved])
+        # Struct sizes are padded to 8 bytes, so their sum covers the value
+        value_size = sum(type_size(local_types[name]) for name in moved)
+        map_name = f"{self.func_name}_scratch"
+        if map_name in module.globals:
+            raise ValueError(f"{map_name} is reserved for {self.func_name}")
+        map_global = create_scratch_map(module, map_name, value_size)
+
+        func = builder.block.parent
+        # builder is still in the entry block, where allocas belong
+        key_ptr = builder.alloca(ir.IntType(32))
+        key_ptr.align = 4
+        builder.store(ir.Constant(ir.IntType(32), 0), key_ptr)
+        value_ptr = emit_map_lookup(builder, map_global, key_ptr, value_type)
+        ok_block = func.append_basic_block(name="scratch.ok")
+        miss_block = func.append_basic_block(name="scratch.miss")
+        null = ir.Constant(value_ptr.type, None)
+        builder.cbranch(
+            builder.icmp_unsigned("!=", value_ptr, null), ok_block, miss_block
+        )
+        builder.position_at_end(miss_block)
+        builder.ret(ir.Constant(func.function_type.return_type, None))
+
+        builder.position_at_end(ok_block)
+        for index, name in enumerate(moved):
+            self.scratch[name] = builder.gep(
+                value_ptr,
+                [ir.Constant(ir.IntType(32), 0), ir.Constant(ir.IntType(32), index)],
+                name=name,
+            )
+        logger.info(
+            f"Moved {', '.join(moved)} ({value_size} bytes) of {self.func_name} "
+            f"off the stack into per-CPU scratch map {map_name}"
+        )
+
+    def usage(self, func):
+        """
+        Return (total bytes, [(names, bytes)]) for every alloca in func.
+
+        Temporaries emitted by the helper lowering are included under
+        "<temporary>".
+        """
+        entries = [
+            (self.owners.get(var, ["<temporary>"]), size)
+            for var, _, size in frame_allocas(func)
+        ]
+        return frame_size(func), entries
+
+    def check(self, func, limit=BPF_STACK_LIMIT):
+        """Log the frame size of func and raise if it exceeds limit."""
+        total, entries = self.usage(func)
+        logger.info(f"Stack frame of {self.func_name}: {total}/{limit} bytes")
+        if total <= limit:
+            return total
+
+        entries.sort(key=lambda entry: entry[1], reverse=True)
+        culprits = ", ".join(
+            f"{' / '.join(names)} ({size} bytes)" for names, size in entries
+        )
+        raise ValueError(
+            f"Function '{self.func_name}' needs {total} bytes of stack, over the "
+            f"{limit} byte BPF limit: {culprits}"
+        )
@@ -2,10 +2,20 @@ from llvmlite import ir
 
 
 class StructType:
-    def __init__(self, ir_type, fields, size):
+    def __init__(
+        self, ir_type, fields, size, ctypes=None, offsets=None, name=None, abi_size=None
+    ):
         self.ir_type = ir_type
         self.fields = fields
         self.size = size
+        # Size of ir_type itself, without size's padding to 8 bytes. Map keys
+        # and values are this big, as helpers read them from the IR object.
+        self.abi_size = abi_size if abi_size is not None else size
+        # ctypes names of the integer fields, for signedness
+        self.ctypes = ctypes or {}
+        # Byte offset of every field, for the struct's debug info
+        self.offsets = offsets or {}
+        self.name = name
 
     def field_idx(self, field_name):
         return list(self.fields.keys()).index(field_name)
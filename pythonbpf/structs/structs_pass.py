@@ -2,6 +2,7 @@ import ast
 import logging
 from llvmlite import ir
 from pythonbpf.type_deducer import ctypes_to_ir
+from pythonbpf.symbol_index import SymbolKind
 from .struct_type import StructType
 
 logger = logging.getLogger(__name__)
@@ -14,33 +15,39 @@ logger = logging.getLogger(__name__)
 # Shall we just int64, int32 and uint32 similarly?
 
 
-def structs_proc(tree, module, chunks):
+def structs_proc(tree, module, symbols):
     """Process all class definitions to find BPF structs"""
     structs_sym_tab = {}
-    for cls_node in chunks:
-        if is_bpf_struct(cls_node):
-            logger.info(f"Found BPF struct: {cls_node.name}")
-            struct_info = process_bpf_struct(cls_node, module)
-            structs_sym_tab[cls_node.name] = struct_info
+    for symbol in symbols.of_kind(SymbolKind.STRUCT):
+        logger.info(f"Found BPF struct: {symbol.name}")
+        struct_info = process_bpf_struct(symbol.node, module)
+        structs_sym_tab[symbol.name] = struct_info
     return structs_sym_tab
 
 
-def is_bpf_struct(cls_node):
-    return any(
-        isinstance(decorator, ast.Name) and decorator.id == "struct"
-        for decorator in cls_node.decorator_list
-    )
-
-
 def process_bpf_struct(cls_node, module):
     """Process a single BPF struct definition"""
 
     fields = parse_struct_fields(cls_node)
     field_types = list(fields.values())
     total_size = calc_struct_size(field_types)
+    offsets, _ = calc_field_offsets(field_types)
     struct_type = ir.LiteralStructType(field_types)
+    field_ctypes = {
+        item.target.id: item.annotation.id
+        for item in cls_node.body
+        if isinstance(item.annotation, ast.Name)
+    }
     logger.info(f"Created struct {cls_node.name} with fields {fields.keys()}")
-    return StructType(struct_type, fields, total_size)
+    return StructType(
+        struct_type,
+        fields,
+        total_size,
+        field_ctypes,
+        dict(zip(fields, offsets)),
+        name=cls_node.name,
+        abi_size=calc_abi_size(field_types),
+    )
 
 
 def parse_struct_fields(cls_node):
@@ -71,25 +78,48 @@ def get_type_from_ann(annotation):
     raise TypeError(f"Unsupported annotation type: {ast.dump(annotation)}")
 
 
-def calc_struct_size(field_types):
-    """Calculate total size of the struct with alignment and padding"""
+def field_layout(ftype):
+    """Return the size and alignment of a struct field type"""
+    if isinstance(ftype, ir.IntType):
+        fsize = ftype.width // 8
+        alignment = fsize
+    elif isinstance(ftype, ir.ArrayType):
+        fsize = ftype.count * (ftype.element.width // 8)
+        alignment = ftype.element.width // 8
+    elif isinstance(ftype, ir.PointerType):
+        # We won't encounter this rn, but for the future
+        fsize = 8
+        alignment = 8
+    else:
+        raise TypeError(f"Unsupported field type: {ftype}")
+    return fsize, alignment
+
+
+def calc_field_offsets(field_types):
+    """Return the byte offset of every field and the end of the last one"""
+    offsets = []
     curr_offset = 0
     for ftype in field_types:
-        if isinstance(ftype, ir.IntType):
-            fsize = ftype.width // 8
-            alignment = fsize
-        elif isinstance(ftype, ir.ArrayType):
-            fsize = ftype.count * (ftype.element.width // 8)
-            alignment = ftype.element.width // 8
-        elif isinstance(ftype, ir.PointerType):
-            # We won't encounter this rn, but for the future
-            fsize = 8
-            alignment = 8
-        else:
-            raise TypeError(f"Unsupported field type: {ftype}")
-
+        fsize, alignment = field_layout(ftype)
         padding = (alignment - (curr_offset % alignment)) % alignment
-        curr_offset += padding + fsize
+        curr_offset += padding
+        offsets.append(curr_offset)
+        curr_offset += fsize
+    return offsets, curr_offset
+
+
+def calc_abi_size(field_types):
+    """
+    Size of the struct as C and LLVM lay it out, padded only to its most
+    aligned field. This is what its IR type occupies on the stack.
+    """
+    _, end = calc_field_offsets(field_types)
+    alignment = max((field_layout(ftype)[1] for ftype in field_types), default=1)
+    return end + (alignment - (end % alignment)) % alignment
 
+
+def calc_struct_size(field_types):
+    """Calculate total size of the struct with alignment and padding"""
+    _, curr_offset = calc_field_offsets(field_types)
     final_padding = (8 - (curr_offset % 8)) % 8
     return curr_offset + final_padding
@@ -0,0 +1,192 @@
+import ast
+import logging
+from dataclasses import dataclass
+from enum import Enum
+from typing import Optional
+
+from .constants_pass import collect_module_constants
+
+logger = logging.getLogger(__name__)
+
+
+class SymbolKind(Enum):
+    STRUCT = "struct"
+    MAP = "map"
+    GLOBAL = "global"
+    PROGRAM = "program"
+    HELPER = "helper"
+
+
+@dataclass
+class BpfSymbol:
+    name: str
+    kind: SymbolKind
+    node: ast.AST
+    section: Optional[str] = None
+    return_type: Optional[str] = None
+    # Helpers only: copy the body into every caller instead of calling it
+    inline: bool = False
+
+
+class SymbolIndex:
+    """
+    Every top-level @bpf chunk of a module, classified once, along with the
+    module-level int constants the chunks may refer to.
+    """
+
+    def __init__(self, symbols, constants=None):
+        self.symbols = symbols
+        self.constants = constants or {}
+        self._by_kind = {kind: [] for kind in SymbolKind}
+        self._by_name = {}
+        for symbol in symbols:
+            self._by_kind[symbol.kind].append(symbol)
+            self._by_name[symbol.name] = symbol
+
+    def __iter__(self):
+        return iter(self.symbols)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def get(self, name):
+        return self._by_name.get(name)
+
+    def of_kind(self, *kinds):
+        """Symbols of the given kinds, in source order."""
+        if len(kinds) == 1:
+            return self._by_kind[kinds[0]]
+        return [symbol for symbol in self.symbols if symbol.kind in kinds]
+
+    def functions(self):
+        """Programs and helpers, i.e. every chunk that is compiled to code."""
+        return self.of_kind(SymbolKind.PROGRAM, SymbolKind.HELPER)
+
+    @property
+    def chunks(self):
+        return [symbol.node for symbol in self.symbols]
+
+
+def scan_decorators(node):
+    """Return the bare decorator names and the @section string of a node."""
+    names = set()
+    section = None
+    for decorator in node.decorator_list:
+        if isinstance(decorator, ast.Name):
+            names.add(decorator.id)
+        elif (
+            isinstance(decorator, ast.Call)
+            and isinstance(decorator.func, ast.Name)
+            and decorator.func.id == "section"
+            and len(decorator.args) == 1
+            and isinstance(decorator.args[0], ast.Constant)
+            and isinstance(decorator.args[0].value, str)
+        ):
+            section = decorator.args[0].value
+    return names, section
+
+
+def classify(node):
+    """Classify a top-level node, or return None if it is not a @bpf chunk."""
+    if not isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+        return None
+    names, section = scan_decorators(node)
+    if "bpf" not in names:
+        return None
+
+    if isinstance(node, ast.ClassDef):
+        if "struct" not in names:
+            logger.info(f"Ignoring @bpf class {node.name} without @struct")
+            return None
+        return BpfSymbol(node.name, SymbolKind.STRUCT, node)
+    if "map" in names:
+        return BpfSymbol(node.name, SymbolKind.MAP, node)
+    if "bpfglobal" in names:
+        return BpfSymbol(node.name, SymbolKind.GLOBAL, node)
+    if "struct" in names:
+        logger.info(f"Ignoring @struct function {node.name}")
+        return None
+
+    if section is not None:
+        return BpfSymbol(
+            node.name, SymbolKind.PROGRAM, node, section, infer_return_type(node)
+        )
+    return BpfSymbol(
+        node.name,
+        SymbolKind.HELPER,
+        node,
+        return_type=infer_return_type(node),
+        inline="inline" in names,
+    )
+
+
+def build_symbol_index(tree) -> SymbolIndex:
+    """Classify every top-level node of a module in a single pass."""
+    symbols = []
+    for node in tree.body:
+        symbol = classify(node)
+        if symbol is not None:
+            logger.info(f"Found BPF {symbol.kind.value}: {symbol.name}")
+            symbols.append(symbol)
+    return SymbolIndex(symbols, collect_module_constants(tree.body))
+
+
+def infer_return_type(func_node: ast.FunctionDef):
+    if not isinstance(func_node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        raise TypeError("Expected ast.FunctionDef")
+    if func_node.returns is not None:
+        try:
+            return ast.unparse(func_node.returns)
+        except Exception:
+            node = func_node.returns
+            if isinstance(node, ast.Name):
+                return node.id
+            if isinstance(node, ast.Attribute):
+                return getattr(node, "attr", type(node).__name__)
+            try:
+                return str(node)
+            except Exception:
+                return type(node).__name__
+    found_type = None
+
+    def _expr_type(e):
+        if e is None:
+            return "None"
+        if isinstance(e, ast.Constant):
+            return type(e.value).__name__
+        if isinstance(e, ast.Name):
+            return e.id
+        if isinstance(e, ast.Call):
+            f = e.func
+            if isinstance(f, ast.Name):
+                return f.id
+            if isinstance(f, ast.Attribute):
+                try:
+                    return ast.unparse(f)
+                except Exception:
+                    return getattr(f, "attr", type(f).__name__)
+            try:
+                return ast.unparse(f)
+            except Exception:
+                return type(f).__name__
+        if isinstance(e, ast.Attribute):
+            try:
+                return ast.unparse(e)
+            except Exception:
+                return getattr(e, "attr", type(e).__name__)
+        try:
+            return ast.unparse(e)
+        except Exception:
+            return type(e).__name__
+
+    for walked_node in ast.walk(func_node):
+        if isinstance(walked_node, ast.Return):
+            t = _expr_type(walked_node.value)
+            if found_type is None:
+                found_type = t
+            elif found_type != t:
+                raise ValueError(f"Conflicting return types: {found_type} vs {t}")
+    return found_type or "None"
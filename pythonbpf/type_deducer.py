@@ -1,24 +1,162 @@
+import ast
+
 from llvmlite import ir
 
 # TODO: THIS IS NOT SUPPOSED TO MATCH STRINGS :skull:
 
+# ctypes name -> (IR type, signed)
+CTYPES = {
+    "c_int8": (ir.IntType(8), True),
+    "c_uint8": (ir.IntType(8), False),
+    "c_int16": (ir.IntType(16), True),
+    "c_uint16": (ir.IntType(16), False),
+    "c_int32": (ir.IntType(32), True),
+    "c_uint32": (ir.IntType(32), False),
+    "c_int64": (ir.IntType(64), True),
+    "c_uint64": (ir.IntType(64), False),
+    "c_float": (ir.FloatType(), True),
+    "c_double": (ir.DoubleType(), True),
+    "c_void_p": (ir.IntType(64), False),
+    # Not so sure about this one
+    "str": (ir.PointerType(ir.IntType(8)), False),
+}
+
+# Integer ctypes by (width, signed), for picking the result type of an operation
+INT_CTYPES = {
+    (ir_type.width, signed): name
+    for name, (ir_type, signed) in CTYPES.items()
+    if isinstance(ir_type, ir.IntType) and name != "c_void_p"
+}
+
+# What the helpers in pythonbpf.helper evaluate to
+HELPER_CTYPES = {
+    "ktime": "c_uint64",
+    "pid": "c_uint32",
+    "deref": "c_int64",
+    "tail_call": "c_int64",
+}
+
+# Untyped int literals and expressions default to this
+DEFAULT_CTYPE = "c_int64"
+
 
 def ctypes_to_ir(ctype: str):
-    mapping = {
-        "c_int8": ir.IntType(8),
-        "c_uint8": ir.IntType(8),
-        "c_int16": ir.IntType(16),
-        "c_uint16": ir.IntType(16),
-        "c_int32": ir.IntType(32),
-        "c_uint32": ir.IntType(32),
-        "c_int64": ir.IntType(64),
-        "c_uint64": ir.IntType(64),
-        "c_float": ir.FloatType(),
-        "c_double": ir.DoubleType(),
-        "c_void_p": ir.IntType(64),
-        # Not so sure about this one
-        "str": ir.PointerType(ir.IntType(8)),
-    }
-    if ctype in mapping:
-        return mapping[ctype]
+    if ctype in CTYPES:
+        return CTYPES[ctype][0]
     raise NotImplementedError(f"No mapping for {ctype}")
+
+
+def is_signed(ctype) -> bool:
+    """Whether ctype is a signed integer; unknown types count as c_int64."""
+    return CTYPES[ctype][1] if ctype in CTYPES else True
+
+
+def is_int_ctype(ctype) -> bool:
+    return ctype in CTYPES and isinstance(CTYPES[ctype][0], ir.IntType)
+
+
+def unify_ctypes(a, b):
+    """
+    Return the type an operation on a and b is carried out in.
+
+    None stands for an int literal, which takes the other operand's type.
+    The wider type wins, and at equal width an unsigned operand makes the
+    operation unsigned, as in C for int and wider.
+    """
+    if a is None or not is_int_ctype(a):
+        return b if is_int_ctype(b) else a
+    if b is None or not is_int_ctype(b) or a == b:
+        return a
+    a_width, b_width = CTYPES[a][0].width, CTYPES[b][0].width
+    if a_width != b_width:
+        return a if a_width > b_width else b
+    return INT_CTYPES[(a_width, is_signed(a) and is_signed(b))]
+
+
+def expr_ctype(expr, env, calls=None):
+    """
+    Return the ctype of an int expression, or None if it is untyped.
+
+    env maps local names, and "var.field" for struct locals, to ctypes;
+    calls maps @bpf function names to their return ctypes.
+    """
+    if isinstance(expr, ast.Name):
+        return env.get(expr.id)
+    elif isinstance(expr, ast.BinOp):
+        left = expr_ctype(expr.left, env, calls)
+        if isinstance(expr.op, (ast.LShift, ast.RShift)):
+            # Shifts keep the type of the shifted value
+            return left
+        return unify_ctypes(left, expr_ctype(expr.right, env, calls))
+    elif isinstance(expr, ast.IfExp):
+        return unify_ctypes(
+            expr_ctype(expr.body, env, calls), expr_ctype(expr.orelse, env, calls)
+        )
+    elif isinstance(expr, ast.UnaryOp) and not isinstance(expr.op, ast.Not):
+        return expr_ctype(expr.operand, env, calls)
+    elif isinstance(expr, ast.Call) and isinstance(expr.func, ast.Name):
+        name = expr.func.id
+        if is_int_ctype(name):
+            return name
+        if calls and name in calls:
+            return calls[name]
+        return HELPER_CTYPES.get(name)
+    elif isinstance(expr, ast.Attribute) and isinstance(expr.value, ast.Name):
+        return env.get(f"{expr.value.id}.{expr.attr}")
+    return None
+
+
+def infer_local_types(body, env, calls=None):
+    """
+    Return {name: ctype} for the int locals assigned in body.
+
+    env holds the types known on entry (parameters and struct fields) and is
+    not modified. A local assigned several times gets the unified type of
+    all its assignments, so the walk repeats until no type changes; locals
+    only ever assigned untyped literals are c_int64.
+    """
+    env = dict(env)
+    assigns = [
+        node
+        for stmt in body
+        for node in ast.walk(stmt)
+        if isinstance(node, ast.Assign)
+        and len(node.targets) == 1
+        and isinstance(node.targets[0], ast.Name)
+    ]
+    literal_only = set()
+    changed = True
+    while changed:
+        changed = False
+        for node in assigns:
+            name = node.targets[0].id
+            value = node.value
+            if isinstance(value, ast.Constant):
+                if isinstance(value.value, int) and not isinstance(value.value, bool):
+                    literal_only.add(name)
+                continue
+            ctype = expr_ctype(value, env, calls)
+            if ctype is None:
+                if isinstance(value, (ast.BinOp, ast.IfExp)):
+                    literal_only.add(name)
+                continue
+            unified = unify_ctypes(env.get(name), ctype)
+            if unified != env.get(name):
+                env[name] = unified
+                changed = True
+
+    for name in literal_only:
+        env.setdefault(name, DEFAULT_CTYPE)
+    return env
+
+
+def local_ctypes(local_sym_tab, structs_sym_tab=None):
+    """The expr_ctype env of a function's locals and their struct fields."""
+    env = {}
+    for name, sym in (local_sym_tab or {}).items():
+        if sym.ctype is not None:
+            env[name] = sym.ctype
+        if structs_sym_tab and sym.metadata in structs_sym_tab:
+            for field, ctype in structs_sym_tab[sym.metadata].ctypes.items():
+                env[f"{name}.{field}"] = ctype
+    return env
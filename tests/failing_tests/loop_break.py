@@ -0,0 +1,24 @@
+from pythonbpf import bpf, section, bpfglobal, compile
+from pythonbpf.helper import pid
+from ctypes import c_void_p, c_int64
+
+
+# break and continue are rejected: loops are unrolled or lowered with a
+# single exit through their condition
+@bpf
+@section("tracepoint/syscalls/sys_enter_sync")
+def breaks(ctx: c_void_p) -> c_int64:
+    p = pid()
+    for i in range(8):
+        if p > i:
+            break
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+
+
+compile()
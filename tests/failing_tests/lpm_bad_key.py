@@ -0,0 +1,33 @@
+from pythonbpf import bpf, map, section, bpfglobal, struct, compile
+from pythonbpf.maps import LpmTrie
+from ctypes import c_void_p, c_int64, c_uint32, c_uint64
+
+
+# An LpmTrie key must start with prefixlen: c_uint32, the kernel reads the
+# prefix length from the first 4 bytes
+@bpf
+@struct
+class bad_key:
+    addr: c_uint32
+    prefixlen: c_uint32
+
+
+@bpf
+@map
+def routes() -> LpmTrie:
+    return LpmTrie(key=bad_key, value=c_uint64, max_entries=16)
+
+
+@bpf
+@section("tracepoint/syscalls/sys_enter_sync")
+def on_sync(ctx: c_void_p) -> c_int64:
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+
+
+compile()
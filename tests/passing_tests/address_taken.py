@@ -0,0 +1,40 @@
+from pythonbpf import bpf, map, section, bpfglobal, compile
+from pythonbpf.helper import pid, bounded
+from pythonbpf.maps import HashMap
+from ctypes import c_void_p, c_int64, c_uint64
+
+
+@bpf
+@map
+def seen() -> HashMap:
+    return HashMap(key=c_uint64, value=c_uint64, max_entries=1024)
+
+
+# key and value are passed to map helpers by address, so they stay in stack
+# slots; the stores in branches and loops must reach the helper calls
+@bpf
+@section("tracepoint/syscalls/sys_enter_sync")
+def spilled(ctx: c_void_p) -> c_int64:
+    key = pid()
+    value = 1
+    if key > 100:
+        value = key
+    else:
+        key = 7
+    seen.update(key, value)
+    for i in bounded(range(40)):
+        key = key + 1
+        seen.update(key, value)
+    prev = seen.lookup(key)
+    if prev:
+        print(f"last {key}")
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+
+
+compile()
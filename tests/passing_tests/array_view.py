@@ -0,0 +1,63 @@
+"""
+Map values through ArrayView and check reads and writes go straight to the
+shared memory. A page-sized temporary file stands in for the Array's fd.
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+from ctypes import c_uint32, c_uint64
+
+from pythonbpf.maps import ArrayView
+from pythonbpf.maps.array_view import map_fd
+
+
+class FakeMap:
+    def __init__(self, fd):
+        self._fd = fd
+
+    def fd(self):
+        return self._fd
+
+
+with tempfile.TemporaryFile() as f:
+    f.write(struct.pack("=4Q", 10, 20, 30, 40).ljust(mmap.PAGESIZE, b"\0"))
+    f.flush()
+    fd = f.fileno()
+    assert map_fd(fd) == fd
+    assert map_fd(FakeMap(fd)) == fd
+
+    with ArrayView(FakeMap(fd), c_uint64, 4) as view:
+        assert len(view) == 4
+        assert view.tolist() == [10, 20, 30, 40]
+        assert view[2] == 30
+        view[1] = 21
+        assert struct.unpack_from("=Q", os.pread(fd, 8, 8))[0] == 21
+
+        # Writes through the file show up in the view without a copy
+        os.pwrite(fd, struct.pack("=Q", 99), 0)
+        assert view[0] == 99
+
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        if numpy is not None:
+            array = view.numpy()
+            assert array.tolist() == [99, 21, 30, 40]
+            del array
+
+    # 32-bit values sit in 8-byte slots, the view skips the padding
+    os.pwrite(fd, struct.pack("=IIII", 7, 0xFFFFFFFF, 8, 0xFFFFFFFF), 0)
+    with ArrayView(fd, c_uint32, 2, writable=False) as view:
+        assert view.tolist() == [7, 8]
+
+try:
+    map_fd(object())
+except TypeError:
+    pass
+else:
+    raise AssertionError("expected TypeError")
+
+print("array_view ok")
@@ -0,0 +1,78 @@
+from pythonbpf import bpf, map, section, bpfglobal, compile
+from pythonbpf.helper import pid, ktime
+from pythonbpf.maps import HashMap, PerCpuHash, Array, PerCpuArray
+from ctypes import c_void_p, c_int64, c_uint64, c_uint32
+
+
+@bpf
+@map
+def hist() -> HashMap:
+    return HashMap(key=c_uint64, value=c_uint64, max_entries=4096)
+
+
+@bpf
+@map
+def masks() -> HashMap:
+    return HashMap(key=c_uint64, value=c_uint32, max_entries=16)
+
+
+@bpf
+@map
+def per_cpu() -> PerCpuHash:
+    return PerCpuHash(key=c_uint32, value=c_uint64, max_entries=1024)
+
+
+@bpf
+@map
+def totals() -> Array:
+    return Array(key=c_uint32, value=c_uint64, max_entries=4)
+
+
+@bpf
+@map
+def cpu_totals() -> PerCpuArray:
+    return PerCpuArray(key=c_uint32, value=c_uint64, max_entries=4)
+
+
+# Hash maps look the key up, apply the op atomically on a hit and insert
+# it with BPF_NOEXIST on a miss, retrying the lookup if another CPU won
+@bpf
+@section("tracepoint/syscalls/sys_enter_clone")
+def hash_updates(ctx: c_void_p) -> c_int64:
+    p = pid()
+    hist[p] += 1
+    delta = ktime()
+    hist[p] -= delta
+    key = 0
+    masks[key] |= 4
+    masks[key] &= 6
+    masks[key] ^= 1
+    # In place through a lookup() pointer, under its null check
+    prev = hist.lookup(p)
+    if prev:
+        prev += 2
+    return c_int64(0)
+
+
+# Per-CPU values are only written by their own CPU and skip the atomic;
+# array entries always exist and have no miss path
+@bpf
+@section("tracepoint/syscalls/sys_enter_execve")
+def percpu_updates(ctx: c_void_p) -> c_int64:
+    p = pid()
+    per_cpu[p] += 1
+    totals[1] += p
+    cpu_totals[0] += 1
+    slot = 2
+    cpu_totals[slot] -= 1
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+
+
+# |=, &= and ^= need the atomic ALU ops of cpu v3
+compile(cpu="v3")
@@ -0,0 +1,35 @@
+from pythonbpf import bpf, section, bpfglobal, compile
+from pythonbpf.helper import pid, ktime
+from ctypes import c_void_p, c_int64
+
+
+# Locals reassigned in a branch are merged with a phi after the if
+@bpf
+@section("tracepoint/syscalls/sys_enter_sync")
+def branches(ctx: c_void_p) -> c_int64:
+    p = pid()
+    x = 1
+    y = 2
+    if p > 100:
+        x = p
+    if p > 1000:
+        y = 3
+    else:
+        y = ktime()
+    z = 0
+    if p > 10:
+        if p > 20:
+            z = x + y
+        else:
+            z = x
+    print(f"x {x} y {y} z {z}")
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+
+
+compile()
@@ -0,0 +1,76 @@
+"""
+Run 'python -m pythonbpf build' on a small source tree and check the objects
+it writes, that a second build is served from the compile cache, and that a
+broken source fails the build without stopping the others.
+"""
+
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+PROGRAM = '''
+from pythonbpf import bpf, section, bpfglobal
+from pythonbpf.helper import pid
+from ctypes import c_void_p, c_int64
+
+
+@bpf
+@section("tracepoint/syscalls/sys_enter_sync")
+def {name}(ctx: c_void_p) -> c_int64:
+    p = pid()
+    print(f"{name} {{p}}")
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+'''
+
+
+def build(*args):
+    result = subprocess.run(
+        [sys.executable, "-m", "pythonbpf", "build", *args],
+        capture_output=True,
+        text=True,
+    )
+    print(result.stdout, end="")
+    return result
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    tmp = Path(tmp)
+    src = tmp / "src"
+    (src / "net").mkdir(parents=True)
+    (src / "sync_probe.py").write_text(PROGRAM.format(name="sync_probe"))
+    (src / "net" / "net_probe.py").write_text(PROGRAM.format(name="net_probe"))
+    # Files without @bpf chunks are not built
+    (src / "util.py").write_text("VALUE = 1\n")
+    out, cache = tmp / "out", tmp / "cache"
+
+    first = build(str(src), "-o", str(out), "--cache-dir", str(cache), "-j", "2")
+    assert first.returncode == 0, first.stderr
+    built = sorted(str(p.relative_to(out)) for p in out.rglob("*.o"))
+    assert built == ["net/net_probe.o", "sync_probe.o"], built
+    assert first.stdout.count("OK  ") == 2, first.stdout
+    for obj in out.rglob("*.o"):
+        assert obj.read_bytes()[:4] == b"\x7fELF", obj
+
+    second = build(str(src), "-o", str(out), "--cache-dir", str(cache), "-j", "2")
+    assert second.returncode == 0, second.stderr
+    assert second.stdout.count("HIT ") == 2, second.stdout
+
+    # break is rejected by the compiler
+    (src / "broken.py").write_text(
+        PROGRAM.format(name="broken").replace(
+            "p = pid()", "for i in range(4):\n        break"
+        )
+    )
+    third = build(str(src), "-o", str(out), "--no-cache")
+    assert third.returncode == 1, third.stdout
+    assert third.stdout.count("FAIL") == 1, third.stdout
+    assert "Built 2/3 objects" in third.stdout, third.stdout
+
+print("build ok")
@@ -0,0 +1,51 @@
+from pythonbpf import bpf, map, section, bpfglobal, compile
+from pythonbpf.helper import pid, ktime
+from pythonbpf.maps import HashMap
+from ctypes import c_void_p, c_int64, c_uint64, c_uint32
+
+DEBUG = 0
+
+
+@bpf
+@map
+def hist() -> HashMap:
+    return HashMap(key=c_uint32, value=c_uint64, max_entries=4096)
+
+
+# and/or short-circuit: the right operand only runs when it decides the
+# result, which matters for calls and for pointers that may be null
+@bpf
+@section("tracepoint/syscalls/sys_enter_clone")
+def conditions(ctx: c_void_p) -> c_int64:
+    p = pid()
+    ts = ktime()
+    if p > 100 and p < 5000 or not ts:
+        print("mixed")
+    if (p > 1 or ts > 2) and not (p > 3 and ts > 4):
+        print("nested")
+    if not (not p):
+        print("double not")
+    if 0 < p < 10:
+        print("chained")
+    if p > 5 and ktime() > 3:
+        print("call on the right")
+    prev = hist.lookup(p)
+    if prev and ts > 5:
+        print("seen")
+    if not prev or p == 7:
+        hist.update(p, ts)
+    if DEBUG and p:
+        print("folded away")
+    if p > 10:
+        if ts > 20 or p < 30:
+            print("inner")
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+
+
+compile()
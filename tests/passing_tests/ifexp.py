@@ -0,0 +1,30 @@
+from pythonbpf import bpf, section, bpfglobal, compile
+from pythonbpf.helper import pid, ktime
+from ctypes import c_void_p, c_int64, c_uint64
+
+DEBUG = 0
+
+
+# Only the branch that is taken is evaluated; the arms are unified to one
+# type and merged with a phi, or folded when the test is constant
+@bpf
+@section("tracepoint/syscalls/sys_enter_clone")
+def conditional(ctx: c_void_p) -> c_int64:
+    p = pid()
+    ts = ktime()
+    y = p if p > 7 else 3
+    z = ts if p and ts > 9 else c_uint64(4)
+    w = 1 if DEBUG else 2
+    n = (p + 1 if p < 100 else p - 1) if ts else 0
+    print(f"{y} {z} {w}")
+    print(f"{n}")
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+
+
+compile()
@@ -0,0 +1,105 @@
+"""
+Rebuild a file through IncrementalCompiler after a series of edits and check
+which definitions each edit recompiles.
+"""
+
+import tempfile
+from pathlib import Path
+
+from pythonbpf import IncrementalCompiler
+
+SOURCE = '''
+from pythonbpf import bpf, map, section, bpfglobal
+from pythonbpf.helper import pid
+from pythonbpf.maps import HashMap
+from ctypes import c_void_p, c_int64, c_uint64
+
+LIMIT = 100
+
+
+@bpf
+@map
+def counts() -> HashMap:
+    return HashMap(key=c_uint64, value=c_uint64, max_entries=1024)
+
+
+@bpf
+def over_limit(n: c_uint64) -> c_uint64:
+    if n > LIMIT:
+        return c_uint64(1)
+    return c_uint64(0)
+
+
+@bpf
+@section("tracepoint/syscalls/sys_enter_clone")
+def on_clone(ctx: c_void_p) -> c_int64:
+    p = pid()
+    one = 1
+    counts.update(p, one)
+    return c_int64(0)
+
+
+@bpf
+@section("tracepoint/syscalls/sys_enter_sync")
+def on_sync(ctx: c_void_p) -> c_int64:
+    p = pid()
+    big = over_limit(p)
+    print(f"sync {big}")
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+'''
+
+
+def rebuild(compiler, path, source, output):
+    path.write_text(source)
+    result = compiler.compile_to_object(str(path), str(output))
+    assert output.read_bytes()[:4] == b"\x7fELF"
+    return sorted(result.rebuilt)
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    path, output = Path(tmp) / "probe.py", Path(tmp) / "probe.o"
+    compiler = IncrementalCompiler()
+
+    rebuilt = rebuild(compiler, path, SOURCE, output)
+    assert rebuilt == ["counts", "on_clone", "on_sync", "over_limit"], rebuilt
+
+    # Nothing changed, comments and blank lines do not count
+    rebuilt = rebuild(compiler, path, SOURCE + "\n# trailing comment\n", output)
+    assert rebuilt == [], rebuilt
+
+    # A program body only rebuilds that program
+    source = SOURCE.replace('print(f"sync {big}")', 'print(f"sync! {big}")')
+    rebuilt = rebuild(compiler, path, source, output)
+    assert rebuilt == ["on_sync"], rebuilt
+
+    # A map rebuilds the functions that use it
+    source = source.replace("max_entries=1024", "max_entries=2048")
+    rebuilt = rebuild(compiler, path, source, output)
+    assert rebuilt == ["counts", "on_clone"], rebuilt
+
+    # A module constant rebuilds the functions that inline it; callers of
+    # those functions only refer to them by name
+    source = source.replace("LIMIT = 100", "LIMIT = 200")
+    rebuilt = rebuild(compiler, path, source, output)
+    assert rebuilt == ["over_limit"], rebuilt
+
+    # Editing a helper rebuilds its callers too
+    source = source.replace("return c_uint64(1)", "return c_uint64(2)")
+    rebuilt = rebuild(compiler, path, source, output)
+    assert rebuilt == ["on_sync", "over_limit"], rebuilt
+
+    # A removed program is dropped from the module
+    start = source.index('@section("tracepoint/syscalls/sys_enter_clone")')
+    end = source.index('@section("tracepoint/syscalls/sys_enter_sync")')
+    source = source[: start - len("@bpf\n")] + source[end - len("@bpf\n") :]
+    rebuilt = rebuild(compiler, path, source, output)
+    assert rebuilt == [], rebuilt
+    assert "on_clone" not in compiler.units
+
+print("incremental ok")
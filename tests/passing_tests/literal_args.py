@@ -0,0 +1,39 @@
+from pythonbpf import bpf, map, section, bpfglobal, compile
+from pythonbpf.helper import pid
+from pythonbpf.maps import HashMap, Array
+from ctypes import c_void_p, c_int64, c_uint64, c_uint32
+
+
+@bpf
+@map
+def counts() -> HashMap:
+    return HashMap(key=c_uint64, value=c_uint64, max_entries=1024)
+
+
+@bpf
+@map
+def slots() -> Array:
+    return Array(key=c_uint32, value=c_uint64, max_entries=4)
+
+
+# Int literals passed to map helpers get a stack slot in the entry block,
+# while the entry block is still being filled
+@bpf
+@section("tracepoint/syscalls/sys_enter_clone")
+def literal_value(ctx: c_void_p) -> c_int64:
+    y = pid()
+    counts.update(y, 1)
+    counts.update(7, y)
+    counts.delete(3)
+    slots.update(2, y)
+    print(f"updated {y}")
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+
+
+compile()
@@ -0,0 +1,66 @@
+from pythonbpf import bpf, map, struct, section, bpfglobal, compile
+from pythonbpf.helper import pid
+from pythonbpf.maps import HashMap
+from ctypes import c_void_p, c_int64, c_uint64, c_int32
+
+
+@bpf
+@struct
+class key_t:
+    a: c_uint64
+
+
+@bpf
+@map
+def hist() -> HashMap:
+    return HashMap(key=c_int32, value=c_uint64, max_entries=4096)
+
+
+@bpf
+@map
+def by_key() -> HashMap:
+    return HashMap(key=key_t, value=c_uint64, max_entries=4096)
+
+
+@bpf
+@section("tracepoint/syscalls/sys_enter_clone")
+def reuse(ctx: c_void_p) -> c_int64:
+    process_id = pid()
+    prev = hist().lookup(process_id)
+    if prev:
+        # Reuses prev
+        again = hist().lookup(process_id)
+        if again:
+            print(f"seen {process_id}")
+    else:
+        hist().update(process_id, 1)
+    third = hist().lookup(process_id)
+    if third:
+        # Becomes a store through third
+        hist().update(process_id, 5)
+    return c_int64(0)
+
+
+@bpf
+@section("tracepoint/syscalls/sys_enter_execve")
+def field_store(ctx: c_void_p) -> c_int64:
+    k = key_t()
+    k.a = pid()
+    p = by_key.lookup(k)
+    k.a = 7
+    # k changed, so this is a new lookup and not p
+    q = by_key.lookup(k)
+    if p:
+        print("old key")
+    if q:
+        print("new key")
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+
+
+compile()
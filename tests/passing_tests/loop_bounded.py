@@ -0,0 +1,25 @@
+from pythonbpf import bpf, section, bpfglobal, compile
+from pythonbpf.helper import pid
+from ctypes import c_void_p, c_int64
+
+
+# 200 trips are over the unroll budget, so this stays a bounded loop
+@bpf
+@section("tracepoint/syscalls/sys_enter_sync")
+def bounded_loop(ctx: c_void_p) -> c_int64:
+    p = pid()
+    hits = 0
+    for i in range(200):
+        if p > i:
+            hits = hits + 1
+    print(f"hits {hits}")
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+
+
+compile()
@@ -0,0 +1,32 @@
+from pythonbpf import bpf, section, bpfglobal, compile
+from pythonbpf.helper import pid, bounded
+from ctypes import c_void_p, c_int64
+
+
+# Locals assigned in a bounded loop get a phi in the loop header
+@bpf
+@section("tracepoint/syscalls/sys_enter_sync")
+def loops(ctx: c_void_p) -> c_int64:
+    p = pid()
+    total = 0
+    last = 0
+    for i in bounded(range(64)):
+        total = total + i
+        if i > p:
+            last = i
+    n = 0
+    acc = 1
+    while bounded(n < 40):
+        acc = acc * 3 + n
+        n = n + 1
+    print(f"total {total} last {last} acc {acc}")
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+
+
+compile()
@@ -0,0 +1,28 @@
+from pythonbpf import bpf, section, bpfglobal, compile
+from pythonbpf.helper import pid
+from ctypes import c_void_p, c_int64
+
+
+# 4 trips of a small body fit the unroll budget: the loop disappears and
+# every iteration's counter is a constant
+@bpf
+@section("tracepoint/syscalls/sys_enter_sync")
+def unrolled(ctx: c_void_p) -> c_int64:
+    p = pid()
+    total = 0
+    for i in range(4):
+        total = total + i * p
+    for j in range(10, 0, -3):
+        if p > j:
+            print(f"above {j}")
+    print(f"total {total}")
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+
+
+compile()
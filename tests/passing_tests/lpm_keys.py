@@ -0,0 +1,73 @@
+"""
+Build LpmTrie keys from CIDR strings and bulk-load them into a stand-in map.
+"""
+
+import socket
+import struct
+from ctypes import c_uint32
+
+from pythonbpf.maps import load_cidrs, lpm_key
+
+key = lpm_key("10.0.0.0/8")
+assert len(key) == 8
+assert struct.unpack("=I", key[:4])[0] == 8
+assert key[4:] == socket.inet_aton("10.0.0.0")
+
+# A bare address is a full-length prefix
+assert lpm_key("192.168.1.1") == struct.pack("=I", 32) + bytes([192, 168, 1, 1])
+
+key = lpm_key("2001:db8::/32")
+assert len(key) == 20
+assert struct.unpack("=I", key[:4])[0] == 32
+assert key[4:] == socket.inet_pton(socket.AF_INET6, "2001:db8::")
+
+# A larger key struct is zero padded
+assert lpm_key("10.0.0.0/8", key_size=12) == lpm_key("10.0.0.0/8") + bytes(4)
+
+for cidr, key_size in (
+    ("10.0.0.300/8", None),
+    ("10.0.0.0/33", None),
+    ("10.0.0.0/-1", None),
+    ("2001:db8::/129", None),
+    ("2001:db8::/32", 8),
+):
+    try:
+        lpm_key(cidr, key_size)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError(f"expected ValueError for {cidr!r}")
+
+
+class FakeMap:
+    def __init__(self):
+        self.entries = {}
+
+    def update(self, key, value):
+        self.entries[key] = value
+
+
+routes = FakeMap()
+assert load_cidrs(routes, {"10.0.0.0/8": 1, "192.168.0.0/16": 2}) == 2
+assert routes.entries == {
+    lpm_key("10.0.0.0/8"): struct.pack("=Q", 1),
+    lpm_key("192.168.0.0/16"): struct.pack("=Q", 2),
+}
+
+# Pairs, value_type packing and raw bytes values
+routes = FakeMap()
+load_cidrs(routes, [("10.0.0.0/8", 7), ("::1", b"\x01\x02")], value_type=c_uint32)
+assert routes.entries[lpm_key("10.0.0.0/8")] == struct.pack("=I", 7)
+assert routes.entries[lpm_key("::1")] == b"\x01\x02"
+
+# A malformed CIDR anywhere in entries leaves the map untouched
+routes = FakeMap()
+try:
+    load_cidrs(routes, [("10.0.0.0/8", 1), ("not an address", 2)])
+except ValueError:
+    pass
+else:
+    raise AssertionError("expected ValueError")
+assert routes.entries == {}
+
+print("lpm ok")
@@ -0,0 +1,39 @@
+from pythonbpf import bpf, map, section, bpfglobal, compile
+from pythonbpf.helper import pid
+from pythonbpf.maps import HashMap
+from ctypes import c_void_p, c_int64, c_uint64
+
+
+@bpf
+@map
+def counts() -> HashMap:
+    return HashMap(key=c_uint64, value=c_uint64, max_entries=1024)
+
+
+# x is stored to its stack slot on entry, so y must not share that slot
+# even though x is first mentioned after y's last use
+@bpf
+def first_seen(x: c_uint64) -> c_uint64:
+    y = pid()
+    counts.update(y, y)
+    p = counts.lookup(x)
+    if p:
+        return c_uint64(0)
+    return x
+
+
+@bpf
+@section("tracepoint/syscalls/sys_enter_clone")
+def probe(ctx: c_void_p) -> c_int64:
+    seen = first_seen(42)
+    print(f"first seen {seen}")
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+
+
+compile()
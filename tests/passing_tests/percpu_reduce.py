@@ -0,0 +1,70 @@
+"""
+Decode and reduce per-CPU map values the way a user-space lookup returns
+them: one value per possible CPU, each in an 8-byte slot.
+"""
+
+import struct
+import tempfile
+from ctypes import c_uint32, c_uint64
+from pathlib import Path
+
+from pythonbpf.maps import PerCpuReader, percpu_values, reduce_percpu
+from pythonbpf.maps.percpu import possible_cpus, slot_size
+
+assert slot_size(c_uint64) == 8
+assert slot_size(c_uint32) == 8
+
+raw = struct.pack("=4Q", 5, 1, 9, 3)
+assert percpu_values(raw, c_uint64) == [5, 1, 9, 3]
+assert percpu_values(raw, c_uint64, ncpus=2) == [5, 1]
+assert reduce_percpu(raw, c_uint64) == 18
+assert reduce_percpu(raw, c_uint64, "min") == 1
+assert reduce_percpu(raw, c_uint64, "max") == 9
+assert reduce_percpu(raw, c_uint64, "max", ncpus=2) == 5
+
+# 32-bit values still take 8 bytes per CPU, the padding is skipped
+raw32 = b"".join(struct.pack("=II", v, 0xFFFFFFFF) for v in (7, 2, 4))
+assert percpu_values(raw32, c_uint32) == [7, 2, 4]
+assert reduce_percpu(raw32, c_uint32) == 13
+
+for bad in (
+    lambda: reduce_percpu(raw, c_uint64, "mean"),
+    lambda: percpu_values(raw[:-1], c_uint64),
+):
+    try:
+        bad()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+with tempfile.TemporaryDirectory() as tmp:
+    path = Path(tmp) / "possible"
+    path.write_text("0-7\n")
+    assert possible_cpus(path) == 8
+    path.write_text("0,2-3\n")
+    assert possible_cpus(path) == 4
+
+
+class FakeMap:
+    def __init__(self, entries):
+        self.entries = entries
+
+    def lookup(self, key):
+        return self.entries.get(key)
+
+    def keys(self):
+        return iter(self.entries)
+
+
+reader = PerCpuReader(FakeMap({1: raw, 2: [4, 4, 4, 4, 4]}), c_uint64, ncpus=4)
+assert reader.values(1) == [5, 1, 9, 3]
+assert reader.values(2) == [4, 4, 4, 4]
+assert reader.values(3) is None
+assert reader.sum(1) == 18 and reader.min(1) == 1 and reader.max(1) == 9
+assert reader.sum(2) == 16
+assert reader.sum(3) is None
+assert dict(reader.items()) == {1: 18, 2: 16}
+assert dict(reader.items("max")) == {1: 9, 2: 4}
+
+print("percpu ok")
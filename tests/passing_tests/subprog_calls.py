@@ -0,0 +1,86 @@
+from pythonbpf import bpf, map, struct, section, bpfglobal, compile, inline
+from pythonbpf.helper import pid, ktime
+from pythonbpf.maps import HashMap
+from ctypes import c_void_p, c_int64, c_int32, c_uint32, c_uint64
+
+
+@bpf
+@struct
+class event_t:
+    pid: c_uint64
+    ts: c_uint64
+
+
+@bpf
+@map
+def seen() -> HashMap:
+    return HashMap(key=c_uint64, value=c_uint64, max_entries=1024)
+
+
+# Called for its side effect, its result is dropped
+@bpf
+def record(key: c_uint64) -> c_int64:
+    now = ktime()
+    seen.update(key, now)
+    return c_int64(0)
+
+
+# Structs are passed by pointer and filled in place
+@bpf
+def fill(ev: event_t, n: c_int32) -> c_int64:
+    ev.pid = pid()
+    ts = ktime()
+    ev.ts = ts + n
+    return c_int64(0)
+
+
+# Returns from inside an if and a loop use the declared return type
+@bpf
+def sign(n: c_int32) -> c_int32:
+    if n > 0:
+        return c_int32(1)
+    elif n < 0:
+        return c_int32(-1)
+    return c_int32(0)
+
+
+@bpf
+def first_above(limit: c_uint32) -> c_uint32:
+    for i in range(4):
+        if i > limit:
+            return c_uint32(7)
+    return limit
+
+
+@bpf
+@inline
+def scale(x: c_uint64) -> c_uint64:
+    return x * 3 + 1
+
+
+@bpf
+@section("tracepoint/syscalls/sys_enter_execve")
+def caller(ctx: c_void_p) -> c_int64:
+    ev = event_t()
+    fill(ev, 5)
+    p = pid()
+    # c_int32 results are sign-extended, c_uint32 ones zero-extended
+    s = sign(p)
+    f = first_above(p)
+    if p > 100:
+        record(p)
+    for i in range(3):
+        record(i)
+    t = scale(f)
+    print(f"pid {ev.pid} sign {s}")
+    print(f"first {f} scaled {t}")
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+
+
+compile()
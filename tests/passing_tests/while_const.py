@@ -0,0 +1,32 @@
+from pythonbpf import bpf, section, bpfglobal, compile
+from pythonbpf.helper import pid
+from ctypes import c_void_p, c_int64
+
+
+# The trip count of a while loop is derived from its counter: n runs from 0
+# to 8 in steps of 2, and m counts down from 100 past the unroll budget
+@bpf
+@section("tracepoint/syscalls/sys_enter_sync")
+def while_loops(ctx: c_void_p) -> c_int64:
+    p = pid()
+    n = 0
+    acc = 0
+    while n < 8:
+        acc = acc + p
+        n = n + 2
+    m = 100
+    down = 0
+    while m != 0:
+        down = down + m
+        m = m - 1
+    print(f"acc {acc} down {down}")
+    return c_int64(0)
+
+
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+
+
+compile()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Check that IR generation scales linearly with the size of a probe file.
+
+Synthetic modules with N maps and N tracepoint programs are compiled to IR
+(no object emission) for growing N. The per-symbol cost at the largest size
+must stay within --tolerance times the cost at the smallest size.
+
+Usage: python tools/compile_bench.py [--sizes 250 500 1000 2000] [--tolerance 2.0]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HEADER = """\
+from pythonbpf import bpf, map, section, bpfglobal, struct
+from pythonbpf.helper import pid, ktime
+from pythonbpf.maps import HashMap
+from ctypes import c_void_p, c_int64, c_uint64
+
+
+@bpf
+@struct
+class event_t:
+    pid: c_uint64
+    ts: c_uint64
+
+"""
+
+UNIT = """
+@bpf
+@map
+def counts_{i}() -> HashMap:
+    return HashMap(key=c_int64, value=c_uint64, max_entries={i} + 1)
+
+
+@bpf
+@section("tracepoint/syscalls/sys_enter_{i}")
+def probe_{i}(ctx: c_void_p) -> c_int64:
+    key = pid()
+    one = 1
+    prev = counts_{i}().lookup(key)
+    if prev:
+        nxt = prev + 1
+        counts_{i}().update(key, nxt)
+    else:
+        counts_{i}().update(key, one)
+    return c_int64(0)
+
+"""
+
+FOOTER = """
+@bpf
+@bpfglobal
+def LICENSE() -> str:
+    return "GPL"
+"""
+
+
+def generate(n):
+    return HEADER + "".join(UNIT.format(i=i) for i in range(n)) + FOOTER
+
+
+def time_compile(source, repeat):
+    from pythonbpf.codegen import generate_ir_module
+
+    best = float("inf")
+    with tempfile.NamedTemporaryFile("w", suffix=".py") as f:
+        f.write(source)
+        f.flush()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            module = generate_ir_module(f.name)
+            str(module)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[250, 500, 1000, 2000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=2.0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+    per_symbol = []
+    print(f"{'programs':>10} {'total ms':>12} {'us/program':>12}")
+    for n in sorted(args.sizes):
+        elapsed = time_compile(generate(n), args.repeat)
+        per_symbol.append(elapsed / n)
+        print(f"{n:>10} {elapsed * 1000:>12.2f} {elapsed / n * 1e6:>12.2f}")
+
+    growth = per_symbol[-1] / per_symbol[0]
+    print(f"per-program cost grew {growth:.2f}x (tolerance {args.tolerance:.2f}x)")
+    return 0 if growth <= args.tolerance else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
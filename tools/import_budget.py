@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Fail if `import pythonbpf` gets slower than a fixed budget.
+
+Each sample runs in a fresh interpreter so nothing is cached in sys.modules.
+The check also fails if the import drags in the compiler backends, which must
+stay lazy.
+
+Usage: python tools/import_budget.py [--budget-ms 30] [--runs 15]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+HEAVY_MODULES = ("llvmlite", "pylibbpf")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import pythonbpf
+from pythonbpf.helper import pid, ktime
+from pythonbpf.maps import HashMap
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "elapsed": elapsed,
+    "heavy": [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def sample(repo_root):
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=repo_root,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(out.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budget-ms", type=float, default=30.0)
+    parser.add_argument("--runs", type=int, default=15)
+    args = parser.parse_args()
+
+    repo_root = Path(__file__).resolve().parent.parent
+    samples = [sample(repo_root) for _ in range(args.runs)]
+    median_ms = statistics.median(s["elapsed"] for s in samples) * 1000
+    heavy = sorted({m for s in samples for m in s["heavy"]})
+
+    print(f"import pythonbpf: median {median_ms:.2f}ms over {args.runs} runs")
+    failed = False
+    if heavy:
+        print(f"FAIL: eagerly imported {', '.join(heavy)}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"FAIL: over the {args.budget_ms:.2f}ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Compare BPF instruction counts of the Python probes against their C baselines.
+
+Every probe is compiled at -O0 (one stack slot per local, loads/stores as
+written) and at -O2 (SSA locals plus the LLVM pipeline). The matching C
+program from tests/c-form is built with clang when it is available, or read
+from a prebuilt tests/c-form/*.bpf.o. Counts are 8-byte instruction slots per
+program section, the unit the verifier's complexity limits are stated in.
+
+Usage: python tools/insn_count.py [--clang clang]
+"""
+
+import argparse
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+C_FORM = ROOT / "tests" / "c-form"
+
+# Python probe -> C program doing the same work
+BASELINES = {
+    "examples/sys_sync.py": "ex3.bpf.c",
+    "examples/binops_demo.py": "ex4.bpf.c",
+    "examples/struct_and_perf.py": "ex6.bpf.c",
+    "examples/xdp_pass.py": "ex2.bpf.c",
+    "tests/passing_tests/ringbuf.py": "ringbuf.bpf.c",
+}
+
+SHF_EXECINSTR = 0x4
+
+
+def program_sizes(obj_path):
+    """Return {section: instruction slots} for the executable sections of an ELF."""
+    data = Path(obj_path).read_bytes()
+    (shoff,) = struct.unpack_from("<Q", data, 0x28)
+    shentsize, shnum, shstrndx = struct.unpack_from("<HHH", data, 0x3A)
+
+    headers = []
+    for i in range(shnum):
+        name, _, flags, _, offset, size = struct.unpack_from(
+            "<IIQQQQ", data, shoff + i * shentsize
+        )
+        headers.append((name, flags, offset, size))
+
+    strtab_offset = headers[shstrndx][2]
+    sizes = {}
+    for name, flags, _, size in headers:
+        if not flags & SHF_EXECINSTR or size == 0:
+            continue
+        end = data.index(b"\0", strtab_offset + name)
+        sizes[data[strtab_offset + name : end].decode()] = size // 8
+    return sizes
+
+
+def build_python(source, opt_level, out_dir):
+    from pythonbpf.codegen import compile_to_object
+
+    output = out_dir / f"{Path(source).stem}-O{opt_level}.o"
+    compile_to_object(str(ROOT / source), str(output), opt_level=opt_level)
+    return program_sizes(output)
+
+
+def build_c(c_file, clang, out_dir):
+    source = C_FORM / c_file
+    prebuilt = source.with_suffix(".o")
+    if clang:
+        output = out_dir / prebuilt.name
+        subprocess.run(
+            [
+                clang,
+                "-O2",
+                "-g",
+                "-target",
+                "bpf",
+                "-c",
+                str(source),
+                "-o",
+                str(output),
+            ],
+            check=True,
+            cwd=C_FORM,
+        )
+        return program_sizes(output)
+    if prebuilt.exists():
+        return program_sizes(prebuilt)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clang", default=shutil.which("clang"))
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(ROOT))
+    with tempfile.TemporaryDirectory() as tmp:
+        out_dir = Path(tmp)
+        print(f"{'probe':<34}{'section':<38}{'-O0':>6}{'-O2':>6}{'C':>6}")
+        for source, c_file in BASELINES.items():
+            o0 = build_python(source, 0, out_dir)
+            o2 = build_python(source, 2, out_dir)
+            c = build_c(c_file, args.clang, out_dir)
+            # C sections are matched by position, names differ between ports
+            c_counts = list(c.values()) if c else []
+            for i, (section, count) in enumerate(o2.items()):
+                c_count = str(c_counts[i]) if i < len(c_counts) else "-"
+                print(
+                    f"{source:<34}{section:<38}{o0.get(section, 0):>6}"
+                    f"{count:>6}{c_count:>6}"
+                )
+        if not args.clang:
+            print("\nclang not found; C counts come from prebuilt tests/c-form objects")
+
+
+if __name__ == "__main__":
+    main()